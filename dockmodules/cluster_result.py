@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+このスクリプトは、クラスタリング結果をNumPy配列で保持するClusterResultクラスを提供します。
+
+`parse_cluster_log`のDataFrameはメンバーをカンマ区切りの文字列で保持するため、メンバーを調べるたびに
+文字列を分割する必要があります。ClusterResultはクラスターID・構造数・中央構造を配列で、メンバーを
+全クラスター分を連結した整数配列とクラスターごとの開始位置で保持し、構造ID→クラスターIDの
+ラベル配列も併せて持つため、クラスターのメンバーや構造の所属をO(1)で参照できます。
+`gmx cluster`のログは、あらかじめコンパイルした正規表現で1行ずつ読みながら解析します。
+
+使用方法:
+    `gmx cluster`のログファイル、またはクラスタリング結果のDataFrameから作成します。
+
+例:
+    python cluster_result.py cluster.log
+
+依存関係:
+    - NumPy
+    - pandas
+
+クラス:
+    - ClusterResult: クラスタリング結果を保持し、メンバーと所属を参照します。
+"""
+import argparse
+import re
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["Cluster ID", "# Structures", "RMSD", "Middle Structure", "Middle RMSD", "Members"]
+
+# gmx clusterのログのクラスター行 (クラスターID | 構造数 RMSD | 中央構造 RMSD | メンバー)
+_CLUSTER_LINE = re.compile(r"^\s*(\d+)\s*\|\s*(\d+)\s*([\d.]*)\s*\|\s*(\d+)\s*([\d.]*)\s*\|")
+_NUMBER = re.compile(r"\d+")
+
+
+class ClusterResult:
+    """
+    ClusterResultクラス
+    クラスタリング結果をNumPy配列で保持し、クラスターのメンバーと構造の所属をO(1)で参照します。
+
+    使用例:
+        clusters = ClusterResult.from_log("cluster.log")
+        # クラスター1のメンバーのID (整数配列)
+        members = clusters.members_of(1)
+        # 構造15が属するクラスターのID (どのクラスターにも属さなければ0)
+        cluster_id = clusters.cluster_of(15)
+        # parse_cluster_logと同じ形式のDataFrame
+        df = clusters.to_dataframe()
+
+    属性:
+        cluster_ids (np.ndarray): クラスターID。
+        sizes (np.ndarray): 各クラスターの構造数。
+        rmsd (np.ndarray): 各クラスターのRMSD (メンバーが1つの場合はNaN)。
+        middle_structures (np.ndarray): 各クラスターの中央構造のID。
+        middle_rmsd (np.ndarray): 各クラスターの中央構造のRMSD。
+        members (np.ndarray): 全クラスターのメンバーのIDを順に連結した配列。
+        offsets (np.ndarray): 長さ (クラスター数 + 1) の、membersにおける各クラスターの開始位置。
+        labels (np.ndarray): 構造IDをインデックスとする、所属するクラスターのID (どこにも属さなければ0)。
+        extra (dict): "FCC" や "Represented Poses" など、その他の列の値。
+    """
+    def __init__(self, cluster_ids, sizes, rmsd, middle_structures, middle_rmsd, members, extra=None):
+        self.cluster_ids = np.asarray(cluster_ids, dtype=int)
+        self.sizes = np.asarray(sizes, dtype=int)
+        self.rmsd = np.asarray(rmsd, dtype=float)
+        self.middle_structures = np.asarray(middle_structures, dtype=int)
+        self.middle_rmsd = np.asarray(middle_rmsd, dtype=float)
+        member_arrays = [np.asarray(m, dtype=int) for m in members]
+        self.offsets = np.concatenate([[0], np.cumsum([len(m) for m in member_arrays], dtype=int)]).astype(int)
+        self.members = np.concatenate(member_arrays) if member_arrays else np.zeros(0, dtype=int)
+        self.extra = dict(extra or {})
+
+        # クラスターID→行の位置、構造ID→クラスターIDの表を作る
+        self._positions = np.full(self.cluster_ids.max() + 1 if len(self.cluster_ids) else 1, -1, dtype=int)
+        self._positions[self.cluster_ids] = np.arange(len(self.cluster_ids))
+        self.labels = np.zeros(self.members.max() + 1 if len(self.members) else 1, dtype=int)
+        self.labels[self.members] = np.repeat(self.cluster_ids, np.diff(self.offsets))
+
+    def __len__(self):
+        return len(self.cluster_ids)
+
+    @classmethod
+    def from_log(cls, log_text="cluster.log"):
+        """
+        `gmx cluster`のログを1行ずつ解析します。
+
+        引数:
+            log_text (str): ログファイルのパスまたはログ内容の文字列。
+                            ".log"で終わる文字列が指定された場合、それはファイルパスとして扱われます。
+
+        戻り値:
+            ClusterResult: 解析したクラスタリング結果。
+
+        例外:
+            FileNotFoundError: 指定されたログファイルパスが存在しない場合。
+        """
+        if isinstance(log_text, str) and log_text.endswith(".log"):
+            with open(log_text, "r", encoding="utf-8") as f:
+                return cls._parse_lines(f)
+        return cls._parse_lines(log_text.splitlines())
+
+    @classmethod
+    def _parse_lines(cls, lines):
+        rows, members = [], []
+        for line in lines:
+            match = _CLUSTER_LINE.match(line)
+            if match:
+                rows.append((int(match.group(1)), int(match.group(2)),
+                             float(match.group(3)) if match.group(3) else np.nan,
+                             int(match.group(4)),
+                             float(match.group(5)) if match.group(5) else np.nan))
+                members.append(_NUMBER.findall(line, match.end()))
+            elif members:
+                # 2行目以降に続くメンバー
+                members[-1].extend(_NUMBER.findall(line))
+        columns = list(zip(*rows)) if rows else [[]] * 5
+        return cls(*columns, [np.array(m, dtype=int) for m in members])
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        `parse_cluster_log`と同じ列を持つDataFrameから作成します。その他の列はextraに保持します。
+
+        引数:
+            df (pd.DataFrame): クラスタリング結果。
+
+        戻り値:
+            ClusterResult: クラスタリング結果。
+        """
+        members = [np.array(str(m).replace(",", " ").split(), dtype=int) for m in df["Members"]]
+        extra = {column: df[column].to_numpy() for column in df.columns if column not in COLUMNS}
+        return cls(df["Cluster ID"], df["# Structures"], df["RMSD"], df["Middle Structure"], df["Middle RMSD"], members, extra)
+
+    def members_of(self, cluster_id):
+        """
+        クラスターのメンバーのIDを返します。
+
+        引数:
+            cluster_id (int): クラスターID。
+
+        戻り値:
+            np.ndarray: メンバーのID (クラスタリング結果の順)。
+        """
+        position = self._positions[cluster_id]
+        return self.members[self.offsets[position]:self.offsets[position + 1]]
+
+    def first_member(self, cluster_id):
+        """
+        クラスターの最初のメンバー (ZDOCKのポーズではスコアの最も良い構造) のIDを返します。
+
+        引数:
+            cluster_id (int): クラスターID。
+
+        戻り値:
+            int: 最初のメンバーのID。
+        """
+        return int(self.members[self.offsets[self._positions[cluster_id]]])
+
+    def cluster_of(self, structure_ids):
+        """
+        構造が属するクラスターのIDを返します。
+
+        引数:
+            structure_ids (int or array_like): 構造のID。
+
+        戻り値:
+            int or np.ndarray: クラスターID。どのクラスターにも属さない構造は0です。
+        """
+        ids = np.asarray(structure_ids, dtype=int)
+        # ラベル配列の範囲外のIDはどのクラスターにも属さない
+        inside = (ids >= 0) & (ids < len(self.labels))
+        labels = np.where(inside, self.labels[np.where(inside, ids, 0)], 0)
+        return int(labels) if labels.ndim == 0 else labels
+
+    def member_sums(self, values):
+        """
+        クラスターごとに、メンバーの値の和を求めます。
+
+        引数:
+            values (np.ndarray): 構造ID kの値をvalues[k - 1]に持つ配列。
+
+        戻り値:
+            np.ndarray: 各クラスターのメンバーの値の和。
+        """
+        values = np.asarray(values)
+        if len(self.members) == 0:
+            return np.zeros(len(self), dtype=values.dtype)
+        return np.add.reduceat(values[self.members - 1], self.offsets[:-1])
+
+    def to_dataframe(self):
+        """
+        `parse_cluster_log`と同じ列 (Membersはカンマ区切りの文字列) のDataFrameを返します。
+
+        戻り値:
+            pd.DataFrame: クラスタリング結果。extraの列は後ろに追加されます。
+        """
+        df = pd.DataFrame({
+            "Cluster ID": self.cluster_ids,
+            "# Structures": self.sizes,
+            "RMSD": self.rmsd,
+            "Middle Structure": self.middle_structures,
+            "Middle RMSD": self.middle_rmsd,
+            "Members": [", ".join(map(str, self.members[start:stop].tolist()))
+                        for start, stop in zip(self.offsets[:-1], self.offsets[1:])]
+        }, columns=COLUMNS)
+        for column, values in self.extra.items():
+            df[column] = values
+        return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gmx clusterのログを解析し、構造の所属を表示します。")
+    parser.add_argument("log_file", help="gmx clusterのログファイルのパス")
+    parser.add_argument("--structure", type=int, action="append", help="所属を調べる構造のID (複数指定可)")
+    args = parser.parse_args()
+
+    clusters = ClusterResult.from_log(args.log_file)
+    print(clusters.to_dataframe())
+    for structure_id in args.structure or []:
+        print(f"構造 {structure_id}: クラスター {clusters.cluster_of(structure_id)}")
+
+
+if __name__ == "__main__":
+    main()
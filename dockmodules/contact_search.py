@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+このスクリプトは、残基の外接球による粗い判定で原子レベルの距離計算を絞り込む接触探索の部品を提供します。
+
+各残基を、原子の重心を中心とし重心から最も遠い原子までの距離を半径とする球で表します。
+2つの残基の球の中心間距離から両方の半径を引いた値がdistanceより大きければ、その残基ペアの
+どの原子もdistance以内に近づけないため、原子レベルの計算をせずに除外できます。
+球による除外は残基の中心座標の距離行列としてまとめて計算し、残った残基ペアの原子ペアだけを
+一括で距離計算して最小原子間距離を求めます。
+インターフェイス残基の検出 (distance=8Å程度)、衝突の検出 (distance=3Å程度)、既知の残基による
+ポーズのふるい分けで共通して使います。
+
+使用方法:
+    PDBファイルと2つのチェーンIDを指定し、distance以内で接触する残基ペアを表示します。
+
+例:
+    python contact_search.py complex.1.pdb A B --distance 3.0
+
+依存関係:
+    - NumPy
+
+関数:
+    - residue_spheres: 残基ごとの外接球 (中心と半径) を求めます。
+    - candidate_residue_pairs: 外接球の間の距離がdistance以内の残基ペアを求めます。
+    - residue_contacts: 外接球で絞り込んだ残基ペアについて、最小原子間距離がdistance以内の残基ペアを求めます。
+"""
+import argparse
+import numpy as np
+from dockmodules.zdock_output import read_pdb_atoms
+
+# 外接球による除外で、丸め誤差のために接触する残基ペアを落とさないための余裕 (Å)
+SPHERE_TOLERANCE = 1e-6
+
+
+def residue_spheres(coords, owners, num_residues=None):
+    """
+    残基ごとの外接球を求めます。
+
+    引数:
+        coords (np.ndarray): 原子座標 (原子数, 3)。
+        owners (np.ndarray): 各原子が属する残基のインデックス (原子数,)。
+        num_residues (int, optional): 残基数。省略した場合はowners.max() + 1。
+
+    戻り値:
+        tuple: (centers, radii)
+        - centers (np.ndarray): 残基の原子の重心 (残基数, 3)。原子を持たない残基はNaN。
+        - radii (np.ndarray): 重心から最も遠い原子までの距離 (残基数,)。
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    owners = np.asarray(owners, dtype=int)
+    if num_residues is None:
+        num_residues = int(owners.max()) + 1 if len(owners) else 0
+    counts = np.bincount(owners, minlength=num_residues)
+    sums = np.zeros((num_residues, 3))
+    np.add.at(sums, owners, coords)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centers = sums / counts[:, None]
+    radii = np.zeros(num_residues)
+    np.maximum.at(radii, owners, np.linalg.norm(coords - centers[owners], axis=1))
+    return centers, radii
+
+
+def candidate_residue_pairs(centers_a, radii_a, centers_b, radii_b, distance, block_size=1024):
+    """
+    外接球の間の距離 (中心間距離 - 両方の半径) がdistance以内の残基ペアを求めます。
+    ここで除外された残基ペアは、原子間距離がdistance以内になることはありません。
+
+    引数:
+        centers_a (np.ndarray): 1つ目の残基の外接球の中心 (残基数A, 3)。
+        radii_a (np.ndarray): 1つ目の残基の外接球の半径 (残基数A,)。
+        centers_b (np.ndarray): 2つ目の残基の外接球の中心 (残基数B, 3)。
+        radii_b (np.ndarray): 2つ目の残基の外接球の半径 (残基数B,)。
+        distance (float): 接触とみなす距離 (Å)。
+        block_size (int, optional): 一度に距離を計算する1つ目の残基の数 (デフォルトは1024)。
+
+    戻り値:
+        tuple: (residues_a, residues_b) 候補の残基ペアのインデックスの配列。
+    """
+    centers_b = np.asarray(centers_b, dtype=float)
+    radii_b = np.asarray(radii_b, dtype=float)
+    found_a, found_b = [], []
+    for start in range(0, len(centers_a), block_size):
+        block = slice(start, start + block_size)
+        separation = np.linalg.norm(centers_a[block, None, :] - centers_b[None, :, :], axis=2)
+        # NaN (原子を持たない残基) との比較はFalseなので自然に除外される
+        close = separation <= distance + radii_a[block, None] + radii_b[None, :] + SPHERE_TOLERANCE
+        rows, cols = np.nonzero(close)
+        found_a.append(rows + start)
+        found_b.append(cols)
+    if not found_a:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate(found_a), np.concatenate(found_b)
+
+
+def _residue_ranges(owners, num_residues):
+    # 残基ごとに原子が連続するように並べ替えた原子のインデックスと、各残基の開始位置・原子数
+    order = np.argsort(owners, kind="stable")
+    counts = np.bincount(owners, minlength=num_residues)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(int)
+    return order, starts, counts
+
+
+def residue_contacts(coords_a, owners_a, coords_b, owners_b, distance, spheres_a=None, spheres_b=None,
+                     max_atom_pairs=1 << 21):
+    """
+    最小原子間距離がdistance以内の残基ペアを求めます。
+    外接球で候補の残基ペアを絞り込み、残った残基ペアの原子ペアだけを距離計算します。
+
+    引数:
+        coords_a (np.ndarray): 1つ目の原子座標 (原子数A, 3)。
+        owners_a (np.ndarray): 1つ目の各原子が属する残基のインデックス。
+        coords_b (np.ndarray): 2つ目の原子座標 (原子数B, 3)。
+        owners_b (np.ndarray): 2つ目の各原子が属する残基のインデックス。
+        distance (float): 接触とみなす距離 (Å)。
+        spheres_a (tuple, optional): 1つ目のresidue_spheresの結果。同じ分子を繰り返し調べる場合に再利用できます。
+        spheres_b (tuple, optional): 2つ目のresidue_spheresの結果。
+        max_atom_pairs (int, optional): 一度に距離を計算する原子ペアの最大数 (デフォルトは2097152)。
+
+    戻り値:
+        tuple: (residues_a, residues_b, distances)
+        - residues_a (np.ndarray): 接触する残基ペアの1つ目の残基のインデックス。
+        - residues_b (np.ndarray): 接触する残基ペアの2つ目の残基のインデックス。
+        - distances (np.ndarray): その残基ペアの最小原子間距離 (Å)。
+    """
+    coords_a = np.asarray(coords_a, dtype=float).reshape(-1, 3)
+    coords_b = np.asarray(coords_b, dtype=float).reshape(-1, 3)
+    owners_a = np.asarray(owners_a, dtype=int)
+    owners_b = np.asarray(owners_b, dtype=int)
+    spheres_a = spheres_a or residue_spheres(coords_a, owners_a)
+    spheres_b = spheres_b or residue_spheres(coords_b, owners_b)
+    pair_a, pair_b = candidate_residue_pairs(*spheres_a, *spheres_b, distance)
+
+    order_a, starts_a, counts_a = _residue_ranges(owners_a, len(spheres_a[1]))
+    order_b, starts_b, counts_b = _residue_ranges(owners_b, len(spheres_b[1]))
+    sorted_a, sorted_b = coords_a[order_a], coords_b[order_b]
+    sizes = counts_a[pair_a] * counts_b[pair_b]
+
+    found = []
+    # 原子ペアの数がmax_atom_pairsを超えないように、候補の残基ペアを区切って計算する
+    bounds = np.cumsum(sizes)
+    start = 0
+    while start < len(pair_a):
+        offset = bounds[start - 1] if start else 0
+        stop = max(int(np.searchsorted(bounds, offset + max_atom_pairs, side="right")), start + 1)
+        chunk_a, chunk_b, chunk_sizes = pair_a[start:stop], pair_b[start:stop], sizes[start:stop]
+        # 各候補ペアの原子ペアを展開する (a側の原子 × b側の原子)
+        pair_id = np.repeat(np.arange(len(chunk_a)), chunk_sizes)
+        first = np.concatenate([[0], np.cumsum(chunk_sizes)[:-1]]).astype(int)
+        local = np.arange(len(pair_id)) - first[pair_id]
+        width = counts_b[chunk_b][pair_id]
+        atoms_a = starts_a[chunk_a][pair_id] + local // width
+        atoms_b = starts_b[chunk_b][pair_id] + local % width
+        atom_distances = np.linalg.norm(sorted_a[atoms_a] - sorted_b[atoms_b], axis=1)
+        nonempty = chunk_sizes > 0
+        minimum = np.minimum.reduceat(atom_distances, first[nonempty]) if len(atom_distances) else atom_distances
+        keep = minimum <= distance
+        found.append((chunk_a[nonempty][keep], chunk_b[nonempty][keep], minimum[keep]))
+        start = stop
+
+    if not found:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+    residues_a, residues_b, distances = (np.concatenate(values) for values in zip(*found))
+    return residues_a, residues_b, distances
+
+
+def main():
+    parser = argparse.ArgumentParser(description="外接球で絞り込んだ原子間距離により、2つのチェーン間で接触する残基ペアを表示します。")
+    parser.add_argument("pdb_file", help="PDBファイルのパス")
+    parser.add_argument("chain1", help="最初のチェーンID (例: 'A')")
+    parser.add_argument("chain2", help="2番目のチェーンID (例: 'B')")
+    parser.add_argument("--distance", type=float, default=8.0, help="接触とみなす距離 (Å) (デフォルト: 8.0)")
+    args = parser.parse_args()
+
+    atoms = read_pdb_atoms(args.pdb_file)
+    groups = []
+    for chain in (args.chain1, args.chain2):
+        index = np.flatnonzero(atoms.chains == chain)
+        keys = list(zip(atoms.resseqs[index], atoms.icodes[index]))
+        labels = list(dict.fromkeys(keys))
+        lookup = {key: position for position, key in enumerate(labels)}
+        groups.append((atoms.coords[index], np.array([lookup[key] for key in keys], dtype=int), labels))
+
+    (coords_a, owners_a, labels_a), (coords_b, owners_b, labels_b) = groups
+    residues_a, residues_b, distances = residue_contacts(coords_a, owners_a, coords_b, owners_b, args.distance)
+    for i, j, d in zip(residues_a, residues_b, distances):
+        print(f"{args.chain1}{labels_a[i][0]}{labels_a[i][1].strip()}\t{args.chain2}{labels_b[j][0]}{labels_b[j][1].strip()}\t{d:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+このスクリプトは、HADDOCKと同じ共通接触の割合 (FCC: Fraction of Common Contacts) による
+構造のクラスタリング機能を提供します (Rodrigues et al., Proteins 2012)。
+
+各構造のチェーン間の残基接触を、全構造で観測された接触を列とするビット列に詰めて保持し、
+構造のペアの共通接触数をビットごとのANDとpopcount (`np.bitwise_count`) でブロックごとに一括計算します
+(接触がまばらな場合は接触ごとの転置インデックスによる疎行列の積に自動的に切り替えます)。
+FCCがカットオフ以上のペアのみを疎行列として保持するため、数万構造でもメモリを圧迫しません。
+クラスタリングはHADDOCKの`cluster_fcc.py`と同じく、近傍の最も多い構造を中心にクラスターを作り、
+最小サイズに満たなくなった時点で打ち切ります。
+
+ZDOCKのポーズはzdock.outの剛体変換から複合体PDBファイルを介さず接触を計算でき、
+HADDOCKの`it1/water`のモデルなどのPDBファイルもそのまま扱えます。結果は`parse_cluster_log`と同じ列
+(RMSDの列はNaN) に、中心構造と各メンバーのFCCの平均 "FCC" 列を加えたDataFrameで返します。
+
+使用方法:
+    zdock.outまたはPDBファイルを指定して実行します。
+
+例:
+    python fcc_clustering.py --zdock zdock.out -n 2000 --cutoff 0.6
+    python fcc_clustering.py run1/structures/it1/water/*w.pdb --chains A B
+
+依存関係:
+    - NumPy (2.0以上)
+    - SciPy
+    - pandas
+    - natsort
+
+関数:
+    - pose_contacts: zdock.outのポーズのチェーン間残基接触を一括計算します。
+    - pdb_contacts: PDBファイルのチェーン間残基接触を計算します。
+    - contact_bitsets: 接触をビット列と疎行列に詰めます。
+    - fcc_neighbors: FCCがカットオフ以上の構造のペアを疎行列で返します。
+    - fcc_clustering: FCCの近傍からクラスターを作ります。
+    - cluster_poses_fcc: zdock.outのポーズをFCCでクラスタリングします。
+    - cluster_pdb_fcc: PDBファイルをFCCでクラスタリングします。
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from natsort import natsorted
+from scipy import sparse
+from scipy.spatial import cKDTree
+from dockmodules.zdock_output import ZDockResult, read_pdb_atoms
+
+# HADDOCKと同じ、残基接触とみなす重原子間の距離 (Å)
+CONTACT_DISTANCE = 5.0
+
+
+def _heavy_mask(atoms):
+    # 原子名の先頭の数字を除いた1文字目がHの原子を水素とみなす
+    return np.array([not name.lstrip("0123456789").startswith("H") for name in atoms.names], dtype=bool)
+
+
+def _residue_keys(atoms):
+    return np.array([f"{chain}:{resseq}{icode}" for chain, resseq, icode in zip(atoms.chains, atoms.resseqs, atoms.icodes)])
+
+
+def pose_contacts(zdock_result, indices=None, distance=CONTACT_DISTANCE, chunk_size=500):
+    """
+    zdock.outのポーズについて、受容体とリガンドの残基接触を一括計算します。
+
+    受容体のKD木は一度だけ構築し、チャンク内の全ポーズのリガンド重原子をまとめたKD木との
+    距離行列 (疎) から接触する原子のペアを求めます。
+
+    引数:
+        zdock_result (ZDockResult or str): ZDOCKの結果、またはzdock.outのパス。
+        indices (array_like, optional): 対象ポーズの0始まりのインデックス (デフォルトは全ポーズ)。
+        distance (float, optional): 接触とみなす重原子間の距離 (Å) (デフォルトは5.0Å)。
+        chunk_size (int, optional): 一度に処理するポーズ数 (デフォルトは500)。
+
+    戻り値:
+        tuple: (構造番号 (0始まり), 接触の識別子) の配列の組。各構造の接触は重複しません。
+    """
+    result = zdock_result if isinstance(zdock_result, ZDockResult) else ZDockResult(zdock_result)
+    indices = np.arange(len(result)) if indices is None else np.asarray(indices, dtype=int)
+
+    receptor_mask = _heavy_mask(result.receptor)
+    ligand_mask = _heavy_mask(result.ligand)
+    receptor_labels, receptor_residues = np.unique(_residue_keys(result.receptor)[receptor_mask], return_inverse=True)
+    ligand_labels, ligand_residues = np.unique(_residue_keys(result.ligand)[ligand_mask], return_inverse=True)
+    receptor_tree = cKDTree(result.receptor.coords[receptor_mask])
+    num_ligand_atoms = ligand_mask.sum()
+    num_pairs = len(receptor_labels) * len(ligand_labels)
+
+    structures, keys = [], []
+    for start in range(0, len(indices), chunk_size):
+        chunk = indices[start:start + chunk_size]
+        posed = result.ligand_coords(chunk, atom_mask=ligand_mask).reshape(-1, 3)
+        pairs = receptor_tree.sparse_distance_matrix(cKDTree(posed), distance, output_type="ndarray")
+        structure = start + pairs["j"] // num_ligand_atoms
+        key = receptor_residues[pairs["i"]] * len(ligand_labels) + ligand_residues[pairs["j"] % num_ligand_atoms]
+        # 同じ残基ペアの複数の原子接触を1つにまとめる
+        unique = np.unique(structure.astype(np.int64) * num_pairs + key)
+        structures.append(unique // num_pairs)
+        keys.append(unique % num_pairs)
+    return np.concatenate(structures), np.concatenate(keys)
+
+
+def pdb_contacts(pdb_files, chains=None, distance=CONTACT_DISTANCE):
+    """
+    PDBファイルについて、2つのチェーン間の残基接触を計算します。
+
+    引数:
+        pdb_files (list): PDBファイルのパスのリスト。
+        chains (tuple, optional): 接触を調べる2つのチェーンID (デフォルトは各ファイルの最初の2つのチェーン)。
+        distance (float, optional): 接触とみなす重原子間の距離 (Å) (デフォルトは5.0Å)。
+
+    戻り値:
+        tuple: (構造番号 (0始まり), 接触の識別子) の配列の組。接触の識別子は全ファイルで共通です。
+
+    例外:
+        ValueError: ファイルに2つ以上のチェーンがない場合。
+    """
+    contact_ids = {}
+    structures, keys = [], []
+    for number, pdb_file in enumerate(pdb_files):
+        atoms = read_pdb_atoms(pdb_file)
+        heavy = _heavy_mask(atoms)
+        pair = chains or list(dict.fromkeys(atoms.chains))[:2]
+        if len(pair) < 2:
+            raise ValueError(f"{pdb_file} にチェーンが2つ以上ありません。")
+        mask_a = heavy & (atoms.chains == pair[0])
+        mask_b = heavy & (atoms.chains == pair[1])
+        residue_keys = _residue_keys(atoms)
+
+        close = cKDTree(atoms.coords[mask_a]).sparse_distance_matrix(cKDTree(atoms.coords[mask_b]), distance, output_type="ndarray")
+        residue_pairs = set(zip(residue_keys[mask_a][close["i"]], residue_keys[mask_b][close["j"]]))
+        for residue_pair in residue_pairs:
+            structures.append(number)
+            keys.append(contact_ids.setdefault(residue_pair, len(contact_ids)))
+    return np.array(structures, dtype=np.int64), np.array(keys, dtype=np.int64)
+
+
+def contact_bitsets(structures, keys, num_structures):
+    """
+    各構造の接触を、全構造で観測された接触を列とするビット列に詰めます。
+    接触の列からワードごとのビットを直接立てるため、(構造数, 接触の種類数) の密な配列は作りません。
+    同じ接触から、接触の列を持つ疎行列も併せて作ります。
+
+    引数:
+        structures (np.ndarray): 接触ごとの構造番号 (0始まり)。
+        keys (np.ndarray): 接触の識別子。
+        num_structures (int): 構造数。
+
+    戻り値:
+        tuple: (bits, counts, contacts)
+        - bits (np.ndarray): 形状 (構造数, ワード数) のuint64のビット列。列cはワードc // 64のビットc % 64です。
+        - counts (np.ndarray): 形状 (構造数,) の各構造の接触数。
+        - contacts (scipy.sparse.csr_matrix): 形状 (構造数, 接触の種類数) の0/1の疎行列。
+    """
+    structures = np.asarray(structures, dtype=np.int64)
+    _, columns = np.unique(keys, return_inverse=True)
+    columns = columns.reshape(-1).astype(np.int64)
+    num_columns = int(columns.max()) + 1 if len(columns) else 0
+    num_words = max(1, -(-num_columns // 64))
+    bits = np.zeros((num_structures, num_words), dtype=np.uint64)
+    np.bitwise_or.at(bits, (structures, columns // 64), np.left_shift(np.uint64(1), (columns % 64).astype(np.uint64)))
+
+    contacts = sparse.csr_matrix((np.ones(len(columns), dtype=np.int32), (structures, columns)),
+                                 shape=(num_structures, num_columns))
+    # 同じ接触が重複して与えられても1として数える
+    contacts.sum_duplicates()
+    contacts.data[:] = 1
+    return bits, np.bitwise_count(bits).sum(axis=1, dtype=np.int64), contacts
+
+
+def fcc_neighbors(bits, counts, contacts, cutoff=0.6, strictness=0.75, max_block_bytes=1 << 22):
+    """
+    FCCがカットオフ以上の構造のペアを求めます。
+
+    構造iに対する構造jのFCCは「共通接触数 / 構造iの接触数」です。HADDOCKと同じく、
+    FCC(i, j) >= cutoff かつ FCC(j, i) >= cutoff * strictness のときjをiの近傍とします。
+
+    共通接触数は対称なので、構造を接触数の順に並べ替えて上三角のみを計算します。共通接触数は
+    少ない方の接触数を超えないため、接触数がcutoff * min(strictness, 1) 倍より大きく異なるペアは
+    近傍になり得ず、計算から除きます。共通接触数はビット列のANDとpopcountで求めますが、
+    多数の構造で接触がまばらな場合 (ZDOCKのポーズなど) は、接触ごとの構造の転置インデックス
+    (疎行列の積) の方が計算量が小さくなるため自動的に切り替えます。
+
+    引数:
+        bits (np.ndarray): contact_bitsetsのビット列。
+        counts (np.ndarray): contact_bitsetsの接触数。
+        contacts (scipy.sparse.csr_matrix): contact_bitsetsの接触の疎行列。
+        cutoff (float, optional): FCCのカットオフ (デフォルトは0.6)。
+        strictness (float, optional): 逆方向のFCCに課すカットオフの倍率 (デフォルトは0.75)。
+        max_block_bytes (int, optional): 一度に計算する中間配列の大きさの上限 (バイト) (デフォルトは4MiB)。
+
+    戻り値:
+        scipy.sparse.csr_matrix: 形状 (構造数, 構造数) のブール疎行列。(i, j) がTrueならjはiの近傍です。
+    """
+    n, num_words = bits.shape
+    order = np.argsort(counts, kind="stable")
+    bits = bits[order]
+    counts = np.maximum(counts[order], 1).astype(float)
+    ratio = cutoff * min(strictness, 1.0)
+
+    # 疎行列の積の計算量 (各接触を持つ構造数の二乗和) がpopcountの計算量より小さければ切り替える
+    contacts = contacts[order]
+    column_counts = np.asarray(contacts.sum(axis=0)).ravel().astype(float)
+    use_sparse = np.sum(column_counts ** 2) < n * n * num_words / 2.0
+    if use_sparse:
+        contacts_t = contacts.T.tocsc()
+        block_size = max(1, max_block_bytes // (n * 8))
+    else:
+        block_size = max(1, max_block_bytes // (n * num_words * 8))
+
+    rows, cols = [], []
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        # 接触数が大きく異なる構造は近傍になり得ないため、比較する列の範囲を絞る
+        limit = n if ratio <= 0 else int(np.searchsorted(counts, counts[stop - 1] / ratio, side="right"))
+        if use_sparse:
+            product = (contacts[start:stop] @ contacts_t[:, start:limit]).tocoo()
+            row, col, common = product.row, product.col, product.data
+        else:
+            common = np.bitwise_count(bits[start:stop, None, :] & bits[None, start:limit, :]).sum(axis=2, dtype=np.int64)
+            row, col = np.nonzero(common)
+            common = common[row, col]
+        # 共通接触のある上三角のペアについて、両方向の近傍関係をまとめて判定する
+        row, col = row + start, col + start
+        upper = row < col
+        row, col, common = row[upper], col[upper], common[upper]
+        count_i, count_j = counts[row], counts[col]
+        forward = (common >= cutoff * count_i) & (common >= cutoff * strictness * count_j)
+        backward = (common >= cutoff * count_j) & (common >= cutoff * strictness * count_i)
+        rows += [row[forward], col[backward]]
+        cols += [col[forward], row[backward]]
+
+    rows, cols = order[np.concatenate(rows)], order[np.concatenate(cols)]
+    return sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(n, n))
+
+
+def fcc_clustering(neighbors, min_size=4):
+    """
+    近傍の最も多い構造とその近傍をクラスターとして取り除く操作を繰り返します。
+    中心と近傍を合わせた大きさがmin_sizeに満たなくなった時点で打ち切り、残りの構造はクラスターに含めません。
+
+    引数:
+        neighbors (scipy.sparse.csr_matrix): fcc_neighborsの戻り値。
+        min_size (int, optional): クラスターの最小サイズ (デフォルトは4)。
+
+    戻り値:
+        list: (中心のインデックス, メンバーのインデックスの配列 (0始まり、昇順)) の組のリスト。
+    """
+    n = neighbors.shape[0]
+    incoming = neighbors.tocsc()
+    counts = np.asarray(neighbors.sum(axis=1)).ravel()
+    remaining = np.ones(n, dtype=bool)
+
+    clusters = []
+    while np.any(remaining):
+        center = int(np.argmax(np.where(remaining, counts, -1)))
+        if counts[center] + 1 < min_size:
+            break
+        row = neighbors.indices[neighbors.indptr[center]:neighbors.indptr[center + 1]]
+        members = np.union1d(row[remaining[row]], [center])
+        clusters.append((center, members))
+        remaining[members] = False
+        # 取り除いた構造を近傍の数から差し引く
+        counts -= np.asarray(incoming[:, members].sum(axis=1)).ravel()
+    return clusters
+
+
+def _clusters_to_dataframe(bits, counts, clusters, ids):
+    rows = []
+    for cluster_id, (center, members) in enumerate(clusters, start=1):
+        common = np.bitwise_count(bits[center] & bits[members]).sum(axis=1)
+        rows.append({
+            "Cluster ID": cluster_id,
+            "# Structures": len(members),
+            "RMSD": np.nan,
+            "Middle Structure": int(ids[center]),
+            "Middle RMSD": np.nan,
+            "Members": ", ".join(str(ids[member]) for member in members),
+            "FCC": float(np.mean(common / max(counts[center], 1)))
+        })
+    return pd.DataFrame(rows, columns=["Cluster ID", "# Structures", "RMSD", "Middle Structure", "Middle RMSD", "Members", "FCC"])
+
+
+def cluster_poses_fcc(zdock_result, indices=None, cutoff=0.6, strictness=0.75, min_size=4, distance=CONTACT_DISTANCE):
+    """
+    zdock.outのポーズを、複合体PDBファイルを介さずFCCでクラスタリングします。
+
+    引数:
+        zdock_result (ZDockResult or str): ZDOCKの結果、またはzdock.outのパス。
+        indices (array_like, optional): クラスタリングするポーズの0始まりのインデックス。k番目のポーズの
+            IDはkになり、`create_pl(indices=...)`が書き出すcomplex.k.pdbに対応します (デフォルトは全ポーズ)。
+        cutoff (float, optional): FCCのカットオフ (デフォルトは0.6)。
+        strictness (float, optional): 逆方向のFCCに課すカットオフの倍率 (デフォルトは0.75)。
+        min_size (int, optional): クラスターの最小サイズ (デフォルトは4)。
+        distance (float, optional): 接触とみなす重原子間の距離 (Å) (デフォルトは5.0Å)。
+
+    戻り値:
+        pd.DataFrame: `parse_cluster_log`と同じ列に "FCC" 列を加えたクラスタリング結果。
+    """
+    result = zdock_result if isinstance(zdock_result, ZDockResult) else ZDockResult(zdock_result)
+    indices = np.arange(len(result)) if indices is None else np.asarray(indices, dtype=int)
+    bits, counts, contacts = contact_bitsets(*pose_contacts(result, indices, distance), len(indices))
+    clusters = fcc_clustering(fcc_neighbors(bits, counts, contacts, cutoff, strictness), min_size)
+    return _clusters_to_dataframe(bits, counts, clusters, np.arange(1, len(indices) + 1))
+
+
+def cluster_pdb_fcc(pdb_files, cutoff=0.6, strictness=0.75, min_size=4, chains=None, distance=CONTACT_DISTANCE):
+    """
+    PDBファイル (HADDOCKの`it1/water`のモデルなど) をFCCでクラスタリングします。
+    ファイルは`run_clustering`と同じく自然順に並べ、1始まりの番号をIDとします。
+
+    引数:
+        pdb_files (list): PDBファイルのパスのリスト。
+        cutoff (float, optional): FCCのカットオフ (デフォルトは0.6)。
+        strictness (float, optional): 逆方向のFCCに課すカットオフの倍率 (デフォルトは0.75)。
+        min_size (int, optional): クラスターの最小サイズ (デフォルトは4)。
+        chains (tuple, optional): 接触を調べる2つのチェーンID (デフォルトは各ファイルの最初の2つのチェーン)。
+        distance (float, optional): 接触とみなす重原子間の距離 (Å) (デフォルトは5.0Å)。
+
+    戻り値:
+        pd.DataFrame: `parse_cluster_log`と同じ列に "FCC" 列を加えたクラスタリング結果。
+    """
+    pdb_files = natsorted(pdb_files)
+    bits, counts, contacts = contact_bitsets(*pdb_contacts(pdb_files, chains, distance), len(pdb_files))
+    clusters = fcc_clustering(fcc_neighbors(bits, counts, contacts, cutoff, strictness), min_size)
+    return _clusters_to_dataframe(bits, counts, clusters, np.arange(1, len(pdb_files) + 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="構造を共通接触の割合 (FCC) でクラスタリングします。")
+    parser.add_argument("pdb_files", nargs="*", help="クラスタリングするPDBファイル")
+    parser.add_argument("--zdock", help="PDBファイルの代わりにクラスタリングするzdock.outのパス")
+    parser.add_argument("-n", "--num_preds", type=int, help="--zdockでクラスタリングする上位のポーズ数 (デフォルト: 全て)")
+    parser.add_argument("--cutoff", type=float, default=0.6, help="FCCのカットオフ (デフォルト: 0.6)")
+    parser.add_argument("--strictness", type=float, default=0.75, help="逆方向のFCCに課すカットオフの倍率 (デフォルト: 0.75)")
+    parser.add_argument("--min_size", type=int, default=4, help="クラスターの最小サイズ (デフォルト: 4)")
+    parser.add_argument("--chains", nargs=2, help="接触を調べる2つのチェーンID (デフォルト: 最初の2つのチェーン)")
+    args = parser.parse_args()
+
+    if args.zdock:
+        result = ZDockResult(args.zdock)
+        count = len(result) if args.num_preds is None else min(args.num_preds, len(result))
+        df = cluster_poses_fcc(result, np.arange(count), args.cutoff, args.strictness, args.min_size)
+    else:
+        df = cluster_pdb_fcc(args.pdb_files, args.cutoff, args.strictness, args.min_size, args.chains)
+    print(df)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+このスクリプトは、NumPy/SciPyのみで動作するFFT相関による剛体ドッキングエンジンを提供します。
+ZDOCK本体の代わりに使用でき、結果はzdock.out互換の形式で書き出されるため、
+`create_pl`やクラスタリングなど後続の処理はそのまま利用できます。
+
+受容体のグリッド (表面層 = 1、内部 = core_weight) とそのFFTは一度だけ計算し、リガンドの回転を
+バッチごとに格子化して`scipy.fft`のマルチスレッドFFTで全並進のスコアを一括評価します
+(Katchalski-Katzir型の形状相補性スコア)。回転の集合は複数プロセスに分割して評価することもできます。
+粗いグリッドで全回転を評価し、有望な回転のみを細かいグリッドで再評価するスクリーニング向けの
+2段階モードも備えています。受容体の`_m.pdb`でブロックされた残基 (原子タイプ19) の表面層は
+内部と同じペナルティとし、ZDOCKと同様に結合面から除外します。
+
+使用方法:
+    マーク済みの受容体・リガンドPDBファイルを指定して実行します。
+
+例:
+    python fft_dock.py -R receptor_m.pdb -L ligand_m.pdb -o zdock.out -N 2000 --rotations 3600 --coarse
+
+依存関係:
+    - NumPy
+    - SciPy
+
+クラス:
+    - FFTDockEngine: 受容体グリッドを保持し、リガンドの回転をFFT相関で評価します。
+
+関数:
+    - uniform_rotations: 回転空間上でほぼ均一な回転行列を生成します。
+    - run_fft_docking: FFTドッキングを実行し、zdock.out互換のファイルを書き出します。
+"""
+import argparse
+import warnings
+import numpy as np
+from multiprocessing import Pool
+from scipy import fft as sp_fft
+from dockmodules.mark_surface import BLOCKED_ATOM_TYPE
+from dockmodules.zdock_output import POSE_DTYPE, ZDockResult, read_pdb_atoms, rotation_matrices_to_euler, write_zdock_output
+
+
+def uniform_rotations(num_rotations):
+    """
+    super-Fibonacciらせんにより、回転空間上でほぼ均一な回転行列を生成します。
+
+    引数:
+        num_rotations (int): 回転の数 (ZDOCKの標準サンプリングは3600、高密度サンプリングは54000)。
+
+    戻り値:
+        np.ndarray: 形状 (num_rotations, 3, 3) の回転行列。
+    """
+    s = np.arange(num_rotations) + 0.5
+    r = np.sqrt(s / num_rotations)
+    big_r = np.sqrt(1.0 - s / num_rotations)
+    alpha = 2.0 * np.pi * s / np.sqrt(2.0)
+    beta = 2.0 * np.pi * s / 1.533751168755204288118041
+    x, y = r * np.sin(alpha), r * np.cos(alpha)
+    z, w = big_r * np.sin(beta), big_r * np.cos(beta)
+
+    # 単位四元数 (w, x, y, z) を回転行列に変換
+    rot = np.empty((num_rotations, 3, 3))
+    rot[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    rot[:, 0, 1] = 2 * (x * y - z * w)
+    rot[:, 0, 2] = 2 * (x * z + y * w)
+    rot[:, 1, 0] = 2 * (x * y + z * w)
+    rot[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    rot[:, 1, 2] = 2 * (y * z - x * w)
+    rot[:, 2, 0] = 2 * (x * z - y * w)
+    rot[:, 2, 1] = 2 * (y * z + x * w)
+    rot[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return rot
+
+
+def _sphere_offsets(radius, spacing):
+    # 半径radius以内にある格子点のオフセット
+    reach = int(np.ceil(radius / spacing))
+    axis = np.arange(-reach, reach + 1)
+    offsets = np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1).reshape(-1, 3)
+    return offsets[np.linalg.norm(offsets * spacing, axis=1) <= radius]
+
+
+def _splat(coords, radius, spacing, n):
+    # 原点を格子点0とし、各原子から半径radius以内の格子点を1にする (周期境界)
+    grid = np.zeros((n, n, n), dtype=bool)
+    centers = np.rint(coords / spacing).astype(np.int64)
+    cells = (centers[:, None, :] + _sphere_offsets(radius, spacing)[None, :, :]).reshape(-1, 3) % n
+    grid[cells[:, 0], cells[:, 1], cells[:, 2]] = True
+    return grid
+
+
+class FFTDockEngine:
+    """
+    FFTDockEngineクラス
+    受容体の形状相補性グリッドのFFTを一度だけ計算して保持し、リガンドの回転をバッチごとに
+    FFT相関で評価します。ポーズは「元のリガンド座標をリガンド中心に移動 → 回転 → 受容体中心 + 変位」
+    で表され、zdock.out (受容体固定形式) としてそのまま書き出せます。
+
+    使用例:
+        engine = FFTDockEngine("receptor_m.pdb", "ligand_m.pdb")
+        header, poses = engine.dock(num_predictions=2000, num_rotations=3600, coarse=True)
+        write_zdock_output("zdock.out", header, poses)
+
+    属性:
+        receptor_pdb (str): 受容体PDBファイルのパス。
+        ligand_pdb (str): リガンドPDBファイルのパス。
+        spacing (float): 細かいグリッドの間隔 (Å)。
+        rec_center (np.ndarray): 受容体の中心座標。
+        lig_center (np.ndarray): リガンドの中心座標。
+        rec_blocked (np.ndarray): ブロックされた受容体原子を示すブール配列。
+    """
+    def __init__(self, receptor_pdb, ligand_pdb, spacing=1.2, atom_radius=1.8, surface_thickness=3.4, core_weight=-15.0):
+        """
+        引数:
+            receptor_pdb (str): 受容体PDBファイルのパス。
+            ligand_pdb (str): リガンドPDBファイルのパス。
+            spacing (float, optional): グリッド間隔 (Å) (デフォルトは1.2Å)。
+            atom_radius (float, optional): 原子の占有半径 (Å) (デフォルトは1.8Å)。
+            surface_thickness (float, optional): 受容体表面層の厚さ (Å) (デフォルトは3.4Å)。
+            core_weight (float, optional): 受容体内部のグリッド値 (衝突のペナルティ) (デフォルトは-15.0)。
+        """
+        self.receptor_pdb = receptor_pdb
+        self.ligand_pdb = ligand_pdb
+        self.spacing = spacing
+        self.atom_radius = atom_radius
+        self.surface_thickness = surface_thickness
+        self.core_weight = core_weight
+
+        receptor = read_pdb_atoms(receptor_pdb)
+        rec_coords = receptor.coords
+        lig_coords = read_pdb_atoms(ligand_pdb).coords
+        # block_residuesで原子タイプを19に書き換えた受容体原子 (ZDOCKの探索から除外する残基)
+        self.rec_blocked = np.array([receptor.lines[i][54:56] == f"{BLOCKED_ATOM_TYPE:>2d}" for i in receptor.atom_indices],
+                                    dtype=bool)
+        self.rec_center = rec_coords.mean(axis=0)
+        self.lig_center = lig_coords.mean(axis=0)
+        self.rec_coords = rec_coords - self.rec_center
+        self.lig_coords = lig_coords - self.lig_center
+        self._receptor_ffts = {}
+
+    def grid_size(self, spacing):
+        """
+        受容体とリガンドの大きさから、周期境界による重なりが起きないグリッドサイズを求めます。
+
+        引数:
+            spacing (float): グリッド間隔 (Å)。
+
+        戻り値:
+            int: FFTに適したグリッドの一辺の点数。
+        """
+        rec_radius = np.linalg.norm(self.rec_coords, axis=1).max()
+        lig_radius = np.linalg.norm(self.lig_coords, axis=1).max()
+        extent = 2.0 * (rec_radius + lig_radius + self.atom_radius + self.surface_thickness)
+        return sp_fft.next_fast_len(int(np.ceil(extent / spacing)), real=True)
+
+    def receptor_fft(self, spacing):
+        """
+        受容体グリッド (表面層 = 1、内部 = core_weight) のFFTを返します。グリッド間隔ごとに一度だけ計算します。
+
+        引数:
+            spacing (float): グリッド間隔 (Å)。
+
+        戻り値:
+            np.ndarray: 受容体グリッドの実数FFT (複素共役済み)。
+        """
+        if spacing not in self._receptor_ffts:
+            n = self.grid_size(spacing)
+            core = _splat(self.rec_coords, self.atom_radius, spacing, n)
+            shell = _splat(self.rec_coords, self.atom_radius + self.surface_thickness, spacing, n)
+            grid = np.where(core, self.core_weight, np.where(shell, 1.0, 0.0)).astype(np.float32)
+            if np.any(self.rec_blocked):
+                # ブロックした残基の表面層は内部と同じペナルティにして、結合面から除外する
+                blocked = _splat(self.rec_coords[self.rec_blocked], self.atom_radius + self.surface_thickness, spacing, n)
+                grid[blocked] = self.core_weight
+            self._receptor_ffts[spacing] = np.conj(sp_fft.rfftn(grid, workers=-1))
+        return self._receptor_ffts[spacing]
+
+    def score_rotations(self, rotations, spacing=None, per_rotation=1, batch_size=8, workers=-1):
+        """
+        各回転について全並進の形状相補性スコアをFFT相関で計算し、上位の並進を返します。
+
+        引数:
+            rotations (np.ndarray): 形状 (n, 3, 3) の回転行列。
+            spacing (float, optional): グリッド間隔 (Å) (デフォルトはself.spacing)。
+            per_rotation (int, optional): 回転ごとに残す並進の数 (デフォルトは1)。
+            batch_size (int, optional): 一度にFFTする回転の数 (デフォルトは8)。
+            workers (int, optional): scipy.fftのスレッド数 (デフォルトは-1 = 全CPU)。
+
+        戻り値:
+            tuple: (scores, displacements)
+            - scores (np.ndarray): 形状 (n, per_rotation) のスコア。
+            - displacements (np.ndarray): 形状 (n, per_rotation, 3) のリガンド中心の変位 (グリッド単位、符号付き)。
+        """
+        spacing = spacing or self.spacing
+        receptor_fft = self.receptor_fft(spacing)
+        n = self.grid_size(spacing)
+
+        scores = np.empty((len(rotations), per_rotation))
+        displacements = np.empty((len(rotations), per_rotation, 3), dtype=np.int64)
+        for start in range(0, len(rotations), batch_size):
+            batch = rotations[start:start + batch_size]
+            ligand_grids = np.zeros((len(batch), n, n, n), dtype=np.float32)
+            for grid, rot in zip(ligand_grids, batch):
+                grid[_splat(self.lig_coords @ rot.T, self.atom_radius, spacing, n)] = 1.0
+
+            # バッチ全体の相関 c(d) = sum_x R(x) L(x + d) をまとめて計算する
+            ligand_fft = sp_fft.rfftn(ligand_grids, axes=(1, 2, 3), workers=workers)
+            corr = sp_fft.irfftn(ligand_fft * receptor_fft, s=(n, n, n), axes=(1, 2, 3), workers=workers)
+            flat = corr.reshape(len(batch), -1)
+            top = np.argpartition(-flat, per_rotation - 1, axis=1)[:, :per_rotation]
+            top_scores = np.take_along_axis(flat, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+
+            # c(d) の最大点 d はリガンドを -d だけ動かした配置に対応する
+            index = np.stack(np.unravel_index(top, (n, n, n)), axis=-1)
+            shift = (-index) % n
+            shift[shift >= n / 2] -= n
+            scores[start:start + len(batch)] = np.take_along_axis(top_scores, order, axis=1)
+            displacements[start:start + len(batch)] = shift
+        return scores, displacements
+
+    def dock(self, num_predictions=2000, num_rotations=3600, per_rotation=1, coarse=False, coarse_factor=2.0,
+             refine_fraction=0.1, processes=1, batch_size=8):
+        """
+        回転集合全体を評価し、スコア上位の予測をzdock.out互換のヘッダーとポーズとして返します。
+
+        引数:
+            num_predictions (int, optional): 出力する予測数 (デフォルトは2000)。
+            num_rotations (int, optional): 評価する回転の数 (デフォルトは3600)。
+            per_rotation (int, optional): 回転ごとに残す並進の数 (デフォルトは1)。評価する回転が少なく
+                num_predictions個の予測に足りない場合は、足りるように自動的に増やします。
+            coarse (bool, optional): 粗いグリッドで全回転を評価し、有望な回転のみを再評価するか (デフォルトはFalse)。
+            coarse_factor (float, optional): 粗いグリッドの間隔の倍率 (デフォルトは2.0)。
+            refine_fraction (float, optional): 細かいグリッドで再評価する回転の割合 (デフォルトは0.1)。
+            processes (int, optional): 回転集合を分割して評価するプロセス数 (デフォルトは1)。
+            batch_size (int, optional): 一度にFFTする回転の数 (デフォルトは8)。
+
+        戻り値:
+            tuple: (header, poses) parse_zdock_outputと同じ形式のヘッダーとPOSE_DTYPE型のポーズ。
+        """
+        rotations = uniform_rotations(num_rotations)
+
+        if coarse:
+            # 粗いグリッドで各回転の最高スコアを求め、上位の回転のみを残す
+            coarse_scores, _ = self._map_rotations(rotations, self.spacing * coarse_factor, 1, processes, batch_size)
+            keep = max(int(np.ceil(len(rotations) * refine_fraction)), 1)
+            rotations = rotations[np.argsort(-coarse_scores[:, 0], kind="stable")[:keep]]
+
+        # 残した回転 × 回転ごとの並進がnum_predictionsに足りるようにする (並進の数はグリッド点数まで)
+        n = self.grid_size(self.spacing)
+        per_rotation = min(max(per_rotation, int(np.ceil(num_predictions / len(rotations)))), n ** 3)
+        scores, displacements = self._map_rotations(rotations, self.spacing, per_rotation, processes, batch_size)
+
+        # 全回転・全並進からスコア上位の予測を選ぶ
+        flat_scores = scores.reshape(-1)
+        order = np.argsort(-flat_scores, kind="stable")[:num_predictions]
+        rotation_index, rank = np.unravel_index(order, scores.shape)
+        if len(order) < num_predictions:
+            warnings.warn(f"探索空間が小さいため、予測数が要求された{num_predictions}個より少ない{len(order)}個になりました。")
+
+        header = {
+            "n": n,
+            "spacing": self.spacing,
+            "switch_num": None,
+            "rec_rand": None,
+            "lig_rand": np.zeros(3),
+            "receptor": self.receptor_pdb,
+            "rec_center": self.rec_center,
+            "ligand": self.ligand_pdb,
+            "lig_center": self.lig_center,
+        }
+        # zdock.outでは x' = R (x - l_c) - t * spacing + r_c なので、並進は変位の符号を反転して格納する
+        poses = np.empty(len(order), dtype=POSE_DTYPE)
+        poses["angles"] = rotation_matrices_to_euler(rotations[rotation_index])
+        poses["translation"] = (-displacements[rotation_index, rank]) % n
+        poses["score"] = flat_scores[order]
+        return header, poses
+
+    def _map_rotations(self, rotations, spacing, per_rotation, processes, batch_size):
+        # 受容体FFTを先に計算しておき、フォークした各プロセスで共有する
+        self.receptor_fft(spacing)
+        if processes <= 1:
+            return self.score_rotations(rotations, spacing, per_rotation, batch_size)
+
+        chunks = np.array_split(rotations, processes)
+        with Pool(processes, initializer=_init_worker, initargs=(self,)) as pool:
+            results = pool.starmap(_score_chunk, [(chunk, spacing, per_rotation, batch_size) for chunk in chunks])
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+_worker_engine = None
+
+
+def _init_worker(engine):
+    global _worker_engine
+    _worker_engine = engine
+
+
+def _score_chunk(rotations, spacing, per_rotation, batch_size):
+    # 各プロセスはCPUを分け合うため、FFTは1スレッドで実行する
+    return _worker_engine.score_rotations(rotations, spacing, per_rotation, batch_size, workers=1)
+
+
+def run_fft_docking(receptor_pdb, ligand_pdb, output_file="zdock.out", num_predictions=2000, num_rotations=3600,
+                    coarse=False, processes=1, **engine_options):
+    """
+    FFTドッキングを実行し、zdock.out互換のファイルを書き出します。
+
+    引数:
+        receptor_pdb (str): 受容体PDBファイルのパス。
+        ligand_pdb (str): リガンドPDBファイルのパス。
+        output_file (str, optional): 出力ファイル名 (デフォルトは "zdock.out")。
+        num_predictions (int, optional): 出力する予測数 (デフォルトは2000)。
+        num_rotations (int, optional): 評価する回転の数 (デフォルトは3600)。
+        coarse (bool, optional): 粗いグリッドによる事前評価を行うか (デフォルトはFalse)。
+        processes (int, optional): 回転集合を分割して評価するプロセス数 (デフォルトは1)。
+        **engine_options: FFTDockEngineに渡す追加の引数 (spacing, atom_radiusなど)。
+
+    戻り値:
+        ZDockResult: 書き出したzdock.outを読み込んだ結果。
+    """
+    engine = FFTDockEngine(receptor_pdb, ligand_pdb, **engine_options)
+    header, poses = engine.dock(num_predictions=num_predictions, num_rotations=num_rotations,
+                                coarse=coarse, processes=processes)
+    write_zdock_output(output_file, header, poses)
+    return ZDockResult(output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FFT相関による剛体ドッキングを実行し、zdock.out互換のファイルを出力します。")
+    parser.add_argument("-R", "--receptor", required=True, help="受容体PDBファイルのパス。")
+    parser.add_argument("-L", "--ligand", required=True, help="リガンドPDBファイルのパス。")
+    parser.add_argument("-o", "--output", default="zdock.out", help="出力ファイル名 (デフォルト: zdock.out)。")
+    parser.add_argument("-N", "--num_predictions", type=int, default=2000, help="予測数 (デフォルト: 2000)。")
+    parser.add_argument("--rotations", type=int, default=3600, help="評価する回転の数 (デフォルト: 3600)。")
+    parser.add_argument("--coarse", action="store_true", help="粗いグリッドで事前評価し、有望な回転のみを再評価します。")
+    parser.add_argument("--processes", type=int, default=1, help="回転集合を分割して評価するプロセス数 (デフォルト: 1)。")
+    args = parser.parse_args()
+
+    run_fft_docking(args.receptor, args.ligand, args.output, args.num_predictions, args.rotations,
+                    coarse=args.coarse, processes=args.processes)
+
+
+if __name__ == "__main__":
+    main()
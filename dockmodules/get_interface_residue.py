@@ -2,7 +2,8 @@
 """
 このスクリプトは、指定されたPDBファイルからタンパク質構造内の2つのチェーン間のインターフェイス残基を特定します。
 インターフェイス残基は、2つのチェーン内の残基の原子間の距離に基づいて決定されます。
-スクリプトはBiopythonライブラリを使用してPDBファイルを解析し、原子間の距離を計算します。
+スクリプトはBiopythonライブラリを使用してPDBファイルを解析し、残基の外接球による粗い判定
+(contact_search) で離れた残基ペアを除外してから、残った残基ペアの原子間距離だけを計算して判定します。
 各チェーンのインターフェイス残基をソートされたリスト形式で出力します。
 
 使用方法:
@@ -17,19 +18,42 @@
 
 依存関係:
     - Biopython
+    - NumPy
+    - SciPy
+
+ZDOCKの全ポーズについては、受容体のKD木を一度だけ構築し、複合体PDBファイルを書き出さずに
+ポーズ×残基のインターフェイス行列 (列方向の平均が接触頻度) を一括で求めることもできます。
 
 関数:
     - get_interface_residues: 距離の閾値に基づいて2つのチェーン間のインターフェイス残基を特定します。
+    - get_chain_pair_interfaces: 任意の数のチェーンを持つ構造について、全チェーンペア (またはチェーンのグループ間) の
+      インターフェイス残基を1つの空間インデックスへの1回の近傍探索で求めます。
+    - residue_pair_distances: 2つのチェーン間の残基ペアの最小原子間距離を疎なリストとして一度に求めます。
+    - interface_residues_by_cutoff: 残基ペアの最小距離から、複数のカットオフのインターフェイス残基を求めます。
+    - pose_interface_matrix: ZDOCKの全ポーズのインターフェイス残基をポーズ×残基の行列として一括判定します。
+    - consensus_interface_residues: 接触頻度が閾値以上の残基をチェーンごとの残基番号リストで返します。
 """
 import warnings
 from Bio import BiopythonWarning
 from Bio.PDB import *
 from Bio.PDB.PDBParser import PDBParser
 import argparse
+import numpy as np
+from scipy.spatial import cKDTree
+from dockmodules.zdock_output import ZDockResult
+from dockmodules.contact_search import residue_contacts
 
 # Biopythonの警告を無視
 warnings.simplefilter("ignore", BiopythonWarning)
 
+def _residue_atom_coords(residues, heavy_atoms=False):
+    # 残基の原子の座標 (原子数, 3) と、各原子が属する残基のインデックス
+    atoms = [(index, atom) for index, residue in enumerate(residues) for atom in residue
+             if not heavy_atoms or atom.element not in ("H", "D")]
+    coords = [atom.coord for _, atom in atoms]
+    owners = [index for index, _ in atoms]
+    return np.array(coords, dtype=float).reshape(-1, 3), np.array(owners, dtype=int)
+
 def get_interface_residues(pdb_file, chain1, chain2, distance=8.0):
     """
     2つのチェーン間のインターフェイス残基を特定する関数。
@@ -54,7 +78,7 @@ def get_interface_residues(pdb_file, chain1, chain2, distance=8.0):
         {'A': [10, 15, 20], 'B': [5, 12, 18]}
 
     注意:
-        - この関数はBiopythonライブラリを使用してPDBファイルを解析し、原子間の距離を計算します。
+        - この関数はBiopythonライブラリを使用してPDBファイルを解析し、残基の外接球で絞り込んだ残基ペアの原子間の距離を判定します。
         - 残基は、1つの残基内の任意の原子が他の残基内の任意の原子と指定された距離以内にある場合、
           インターフェイスの一部と見なされます。
         - PDBファイルとチェーンIDが有効であることを確認してください。
@@ -71,24 +95,14 @@ def get_interface_residues(pdb_file, chain1, chain2, distance=8.0):
     # 各チェーンの残基と原子を取得
     residues_a = list(chain_a.get_residues())
     residues_b = list(chain_b.get_residues())
-    
-    # インターフェイス残基を格納するセット
-    interface_a = set()
-    interface_b = set()
-    
-    # 各残基の原子間距離を計算
-    for res_a in residues_a:
-        for res_b in residues_b:
-            # 残基内の全ての原子間の距離をチェック
-            for atom_a in res_a:
-                for atom_b in res_b:
-                    if atom_a - atom_b <= distance:
-                        interface_a.add(res_a)
-                        interface_b.add(res_b)
-                        break  # 1つでも近い原子があれば十分
-                else:
-                    continue  # 内側のループがbreakされなかった場合のみ実行
-                break  # 外側のループをbreak
+    coords_a, owners_a = _residue_atom_coords(residues_a)
+    coords_b, owners_b = _residue_atom_coords(residues_b)
+
+    # 外接球で離れた残基ペアを除外し、最小原子間距離がdistance以内の残基ペアを求める
+    contact_a, contact_b, _ = residue_contacts(coords_a, owners_a, coords_b, owners_b, distance)
+    interface_a = {residues_a[i] for i in np.unique(contact_a)}
+    interface_b = {residues_b[i] for i in np.unique(contact_b)}
+
     # インターフェイス残基をA:1,2,3の形式で取得
     interface_dict = {
         chain1: [res.get_id()[1] for res in sorted(interface_a, key=lambda x: x.get_id()[1])],
@@ -97,19 +111,245 @@ def get_interface_residues(pdb_file, chain1, chain2, distance=8.0):
     return interface_dict
 
 
+def get_chain_pair_interfaces(pdb_file, distance=8.0, groups=None):
+    """
+    任意の数のチェーンを持つ構造について、チェーンペアごとのインターフェイス残基を一度に特定します。
+
+    PDBファイルは一度だけ解析し、チェーンごとのKD木を1回ずつ構築して、比較するチェーンペアの間だけで
+    distance以内の原子ペアを求めます。同じチェーン内の原子ペアは探索しないため、大きな複合体でも
+    チェーン内の大量の近接原子ペアを作って捨てることはありません。チェーンペアの結果はグループ間で
+    共有するため、チェーンペアごとにget_interface_residuesを呼ぶ場合のようにファイルを何度も解析する必要もありません。
+
+    引数:
+        pdb_file (str): PDBファイルのパス。
+        distance (float, optional): インターフェイスとみなす距離 (Å) (デフォルトは8.0Å)。
+        groups (list, optional): 比較するチェーンのグループのペアのリスト。例えば [("AC", "B")] は受容体のチェーンA・Cと
+            リガンドのチェーンBの間のインターフェイスを求めます。省略した場合は全てのチェーンペアを求めます。
+
+    戻り値:
+        dict: ペア (グループの場合は (チェーンIDを連結した文字列, チェーンIDを連結した文字列)) をキー、
+              {チェーンID: [残基番号リスト]} を値とする辞書。チェーンペアの値はget_interface_residuesと同じ形式です。
+
+    例外:
+        ValueError: グループに存在しないチェーンが含まれる場合、または1つのペアの両方のグループに同じチェーンが含まれる場合。
+
+    使用例:
+        >>> get_chain_pair_interfaces('complex.pdb', groups=[("AC", "B")])
+        {('AC', 'B'): {'A': [10, 15], 'C': [3], 'B': [5, 12, 18]}}
+    """
+    parser = PDBParser(PERMISSIVE=True)
+    model = parser.get_structure("protein", pdb_file)[0]
+    chain_ids = [chain.id for chain in model]
+    residues = [residue for chain in model for residue in chain]
+    residue_chains = np.array([chain_ids.index(residue.get_parent().id) for residue in residues], dtype=int)
+    coords, owners = _residue_atom_coords(residues)
+
+    if groups is None:
+        groups = [(chain_ids[i], chain_ids[j]) for i in range(len(chain_ids)) for j in range(i + 1, len(chain_ids))]
+    groups = [("".join(group1), "".join(group2)) for group1, group2 in groups]
+    for group1, group2 in groups:
+        missing = sorted(set(group1 + group2) - set(chain_ids))
+        if missing:
+            raise ValueError(f"チェーン {missing} が構造に存在しません。")
+        if set(group1) & set(group2):
+            raise ValueError(f"同じチェーンが両方のグループに含まれています: {group1}, {group2}")
+
+    atom_chains = residue_chains[owners]
+    trees = {}
+    contacts = {}
+
+    def chain_contacts(chain1, chain2):
+        # 2つのチェーンのKD木の間でdistance以内の原子ペアを求め、両側の残基のインデックスを返す (結果は共有する)
+        if (chain2, chain1) in contacts:
+            return contacts[chain2, chain1][::-1]
+        for chain in (chain1, chain2):
+            if chain not in trees:
+                index = np.flatnonzero(atom_chains == chain_ids.index(chain))
+                trees[chain] = (index, cKDTree(coords[index]))
+        (index1, tree1), (index2, tree2) = trees[chain1], trees[chain2]
+        pairs = tree1.sparse_distance_matrix(tree2, distance, output_type="ndarray")
+        contacts[chain1, chain2] = (np.unique(owners[index1[pairs["i"]]]), np.unique(owners[index2[pairs["j"]]]))
+        return contacts[chain1, chain2]
+
+    interfaces = {}
+    for group1, group2 in groups:
+        interface = {chain: set() for chain in group1 + group2}
+        for chain1 in group1:
+            for chain2 in group2:
+                found1, found2 = chain_contacts(chain1, chain2)
+                interface[chain1].update(found1.tolist())
+                interface[chain2].update(found2.tolist())
+        interfaces[group1, group2] = {chain: sorted(residues[index].get_id()[1] for index in found)
+                                      for chain, found in interface.items()}
+    return interfaces
+
+
+def residue_pair_distances(pdb_file, chain1, chain2, max_distance=12.0, heavy_atoms=True):
+    """
+    2つのチェーン間で、max_distance以内にある全ての残基ペアの最小原子間距離を一度に求めます。
+    結果は残基ペアの疎なリストなので、interface_residues_by_cutoffで任意のカットオフの
+    インターフェイス残基をしきい値処理だけで求められます。
+
+    引数:
+        pdb_file (str): PDBファイルのパス。
+        chain1 (str): 最初のチェーンID。
+        chain2 (str): 2番目のチェーンID。
+        max_distance (float, optional): 記録する最大の距離 (Å) (デフォルトは12.0Å)。
+        heavy_atoms (bool, optional): 水素原子を除いた重原子のみで距離を計算するか (デフォルトはTrue)。
+
+    戻り値:
+        tuple: (pairs, residues1, residues2)
+        - pairs (np.ndarray): "residue1", "residue2" (各チェーンの残基のインデックス) と "distance" (Å) の
+          フィールドを持つ構造化配列。
+        - residues1 (list): chain1の残基番号 (インデックス順)。
+        - residues2 (list): chain2の残基番号 (インデックス順)。
+    """
+    parser = PDBParser(PERMISSIVE=True)
+    model = parser.get_structure("protein", pdb_file)[0]
+    residues_a = list(model[chain1].get_residues())
+    residues_b = list(model[chain2].get_residues())
+    coords_a, owners_a = _residue_atom_coords(residues_a, heavy_atoms)
+    coords_b, owners_b = _residue_atom_coords(residues_b, heavy_atoms)
+
+    # 外接球で離れた残基ペアを除外し、残った残基ペアの最小原子間距離を求める
+    contact_a, contact_b, distances = residue_contacts(coords_a, owners_a, coords_b, owners_b, max_distance)
+    pairs = np.zeros(len(distances), dtype=[("residue1", int), ("residue2", int), ("distance", float)])
+    pairs["residue1"], pairs["residue2"], pairs["distance"] = contact_a, contact_b, distances
+    return pairs, [res.get_id()[1] for res in residues_a], [res.get_id()[1] for res in residues_b]
+
+def interface_residues_by_cutoff(pairs, residues1, residues2, chain1, chain2, cutoffs):
+    """
+    residue_pair_distancesの結果から、複数のカットオフのインターフェイス残基をしきい値処理で求めます。
+
+    引数:
+        pairs (np.ndarray): residue_pair_distancesの戻り値の残基ペアの構造化配列。
+        residues1 (list): chain1の残基番号。
+        residues2 (list): chain2の残基番号。
+        chain1 (str): 最初のチェーンID。
+        chain2 (str): 2番目のチェーンID。
+        cutoffs (list): インターフェイスとみなす距離 (Å) のリスト。residue_pair_distancesのmax_distance以下にしてください。
+
+    戻り値:
+        dict: カットオフをキー、get_interface_residuesと同じ {chain1: [残基番号リスト], chain2: [残基番号リスト]} を値とする辞書。
+    """
+    # 各残基の相手のチェーンまでの最小距離
+    nearest_a = np.full(len(residues1), np.inf)
+    nearest_b = np.full(len(residues2), np.inf)
+    np.minimum.at(nearest_a, pairs["residue1"], pairs["distance"])
+    np.minimum.at(nearest_b, pairs["residue2"], pairs["distance"])
+    residues1, residues2 = np.asarray(residues1, dtype=int), np.asarray(residues2, dtype=int)
+    return {
+        cutoff: {
+            chain1: sorted(residues1[nearest_a <= cutoff].tolist()),
+            chain2: sorted(residues2[nearest_b <= cutoff].tolist())
+        }
+        for cutoff in cutoffs
+    }
+
+def _residue_owners(atoms):
+    # 原子ごとの残基のインデックスと、ファイル順の残基 (チェーンID, 残基番号, 挿入コード) のリスト
+    keys = list(zip(atoms.chains.tolist(), atoms.resseqs.tolist(), atoms.icodes.tolist()))
+    residues = list(dict.fromkeys(keys))
+    positions = {key: index for index, key in enumerate(residues)}
+    return np.array([positions[key] for key in keys], dtype=int), residues
+
+def pose_interface_matrix(zdock_result, indices=None, distance=8.0, chunk_size=200):
+    """
+    ZDOCKの全ポーズについて、受容体とリガンドのインターフェイス残基をポーズ×残基の行列として一括判定します。
+
+    受容体は全ポーズで共通なので、受容体とリガンド (元の座標) のKD木は一度だけ構築します。
+    リガンドの残基は、受容体座標系に移したリガンド原子を受容体のKD木に問い合わせて判定します。
+    受容体の残基は、リガンドの外接球 (重心からの最大距離 + distance) 内の受容体原子だけを
+    各ポーズのリガンド座標系に逆変換し、リガンドのKD木に問い合わせて判定します。
+    複合体PDBファイルは書き出さず、各行はcomplex.N.pdbに対するget_interface_residuesと同じ判定になります。
+
+    引数:
+        zdock_result (ZDockResult or str): ZDOCKの結果、またはzdock.outのパス。
+        indices (array_like, optional): 対象ポーズの0始まりのインデックス (デフォルトは全ポーズ)。
+        distance (float, optional): インターフェイスとみなす原子間距離 (Å) (デフォルトは8.0Å)。
+        chunk_size (int, optional): 一度に判定するポーズ数 (デフォルトは200)。
+
+    戻り値:
+        tuple: (receptor_contacts, ligand_contacts, receptor_residues, ligand_residues)
+        - receptor_contacts (np.ndarray): 形状 (ポーズ数, 受容体の残基数) のブール配列。
+        - ligand_contacts (np.ndarray): 形状 (ポーズ数, リガンドの残基数) のブール配列。
+        - receptor_residues (list): 列に対応する受容体の残基 (チェーンID, 残基番号, 挿入コード)。
+        - ligand_residues (list): 列に対応するリガンドの残基 (チェーンID, 残基番号, 挿入コード)。
+        列方向の平均 (contacts.mean(axis=0)) が各残基の接触頻度です。
+    """
+    result = zdock_result if isinstance(zdock_result, ZDockResult) else ZDockResult(zdock_result)
+    indices = np.arange(len(result)) if indices is None else np.asarray(indices, dtype=int)
+    receptor, ligand = result.receptor, result.ligand
+    receptor_owners, receptor_residues = _residue_owners(receptor)
+    ligand_owners, ligand_residues = _residue_owners(ligand)
+    receptor_tree = cKDTree(receptor.coords)
+    ligand_tree = cKDTree(ligand.coords)
+    center = ligand.coords.mean(axis=0)
+    radius = np.linalg.norm(ligand.coords - center, axis=1).max() + distance
+    # cKDTree.queryは上限ちょうどの距離を含まないため、上限をわずかに広げて "<= distance" とする
+    upper = np.nextafter(distance, np.inf)
+
+    receptor_contacts = np.zeros((len(indices), len(receptor_residues)), dtype=bool)
+    ligand_contacts = np.zeros((len(indices), len(ligand_residues)), dtype=bool)
+    for start in range(0, len(indices), chunk_size):
+        rotations, translations = result.transforms(indices[start:start + chunk_size])
+        rows = np.arange(start, start + len(rotations))
+
+        # リガンドの原子を受容体座標系に移し、受容体のKD木に一度に問い合わせる
+        coords = np.einsum("pij,mj->pmi", rotations, ligand.coords) + translations[:, None, :]
+        dist, _ = receptor_tree.query(coords.reshape(-1, 3), distance_upper_bound=upper)
+        hits = (dist <= distance).reshape(len(rotations), len(ligand.coords))
+        pose_index, atom_index = np.nonzero(hits)
+        ligand_contacts[rows[pose_index], ligand_owners[atom_index]] = True
+
+        # リガンドの外接球内の受容体原子だけを各ポーズのリガンド座標系に逆変換して問い合わせる
+        candidates = receptor_tree.query_ball_point(rotations @ center + translations, radius)
+        pose_index = np.repeat(np.arange(len(rotations)), [len(c) for c in candidates])
+        atom_index = np.fromiter((atom for c in candidates for atom in c), dtype=int, count=len(pose_index))
+        local = np.einsum("pji,pj->pi", rotations[pose_index], receptor.coords[atom_index] - translations[pose_index])
+        dist, _ = ligand_tree.query(local, distance_upper_bound=upper)
+        hits = dist <= distance
+        receptor_contacts[rows[pose_index[hits]], receptor_owners[atom_index[hits]]] = True
+
+    return receptor_contacts, ligand_contacts, receptor_residues, ligand_residues
+
+def consensus_interface_residues(contacts, residues, threshold=0.5, poses=None):
+    """
+    接触頻度がthreshold以上の残基を、get_interface_residuesと同じチェーンごとの残基番号リストで返します。
+    クラスターのメンバーのポーズを指定すれば、クラスター内で共通するインターフェイスを制約に使えます。
+
+    引数:
+        contacts (np.ndarray): pose_interface_matrixの戻り値の接触行列 (ポーズ数, 残基数)。
+        residues (list): 列に対応する残基 (チェーンID, 残基番号, 挿入コード)。
+        threshold (float, optional): 接触頻度の閾値 (デフォルトは0.5)。
+        poses (array_like, optional): 頻度を求める行のインデックス (デフォルトは全行)。
+
+    戻り値:
+        dict: {チェーンID: [残基番号リスト]} 形式の辞書。
+    """
+    frequency = (contacts if poses is None else contacts[np.asarray(poses, dtype=int)]).mean(axis=0)
+    consensus = {}
+    for index in np.flatnonzero(frequency >= threshold):
+        chain, resseq, _ = residues[index]
+        consensus.setdefault(chain, []).append(resseq)
+    return {chain: sorted(resseqs) for chain, resseqs in consensus.items()}
+
+
 if __name__ == "__main__":
     # コマンドライン引数の解析
     parser = argparse.ArgumentParser(description="2つのチェーン間のインターフェイス残基を取得するスクリプト")
     parser.add_argument("pdb_file", type=str, help="PDBファイルのパス")
     parser.add_argument("chain1", type=str, help="最初のチェーンID (例: 'A')")
     parser.add_argument("chain2", type=str, help="2番目のチェーンID (例: 'B')")
-    parser.add_argument("--distance", type=float, default=8.0, help="インターフェイスとみなす距離 (Å) (デフォルト: 8.0)")
+    parser.add_argument("--distance", type=float, nargs="+", default=[8.0], help="インターフェイスとみなす距離 (Å)。複数指定可 (デフォルト: 8.0)")
     
     args = parser.parse_args()
     
-    # インターフェイス残基を取得
-    interface_residues = get_interface_residues(args.pdb_file, args.chain1, args.chain2, args.distance)
-    print(interface_residues)
+    # 残基ペアの最小距離を一度だけ求め、各カットオフのインターフェイス残基を取得
+    pairs, residues1, residues2 = residue_pair_distances(args.pdb_file, args.chain1, args.chain2, max(args.distance))
+    by_cutoff = interface_residues_by_cutoff(pairs, residues1, residues2, args.chain1, args.chain2, args.distance)
     # 結果を表示
-    print(f"Chain {args.chain1} interface residues: {interface_residues[args.chain1]}")
-    print(f"Chain {args.chain2} interface residues: {interface_residues[args.chain2]}")
+    for distance, interface_residues in by_cutoff.items():
+        print(f"Cutoff {distance} Å:")
+        print(f"Chain {args.chain1} interface residues: {interface_residues[args.chain1]}")
+        print(f"Chain {args.chain2} interface residues: {interface_residues[args.chain2]}")
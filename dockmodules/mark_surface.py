@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+このスクリプトは、ZDOCKの`mark_sur`で作成したマーク済みPDBファイル (`_m.pdb`) をキャッシュし、
+指定した残基をZDOCKの探索から除外する機能を提供します。
+
+マーク済みPDBファイルは、入力PDBファイル、`uniCHARMM`、`mark_sur`の実行ファイルの内容のハッシュを
+キーとしてディスクにキャッシュされるため、同じ受容体を多数のリガンドとドッキングする場合は
+2回目以降`mark_sur`を実行する必要がありません。ZDOCKを更新して`mark_sur`や`uniCHARMM`が変わると
+キーも変わるため、古い`_m.pdb`が使われることはありません。
+
+使用方法:
+    入力PDBファイルと出力PDBファイルのパスを指定して実行します。`mark_sur`は$ZDOCKから実行します。
+
+例:
+    python mark_surface.py receptor.pdb receptor_m.pdb
+    python mark_surface.py receptor.pdb receptor_m.pdb --block A:45,50-55
+
+環境変数:
+    ZDOCK: `mark_sur`と`uniCHARMM`を含むディレクトリ。
+    DOCK_REFINE_CACHE: キャッシュを保存するディレクトリ (デフォルト: ~/.cache/dock-refine)。
+
+関数:
+    - content_hash: ファイル内容のハッシュを計算します。
+    - run_mark_sur: ZDOCKの`mark_sur`を実行します。
+    - cached_mark: キャッシュを使って表面マーキングを実行します。
+    - parse_blocked_residues: "A:45,50-55" 形式のブロック残基指定を解析します。
+    - block_residues: マーク済みPDBファイルの指定残基をZDOCKの探索から除外します。
+"""
+import os
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+# ZDOCKの`block.pl`が探索から除外する原子に割り当てる原子タイプ
+BLOCKED_ATOM_TYPE = 19
+
+CACHE_DIR = os.environ.get("DOCK_REFINE_CACHE", os.path.expanduser("~/.cache/dock-refine"))
+
+
+def content_hash(*paths):
+    """
+    ファイル内容のSHA-256ハッシュを計算します。
+
+    引数:
+        *paths (str): ハッシュに含めるファイルのパス。
+
+    戻り値:
+        str: 16進数のハッシュ文字列。
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_mark_sur(pdb_file, out_pdb_file, zdock_path):
+    """
+    ZDOCKの`mark_sur`で、PDBファイルの表面原子をマークします。
+
+    引数:
+        pdb_file (str): 入力PDBファイルのパス。
+        out_pdb_file (str): 出力するマーク済みPDBファイルのパス。
+        zdock_path (str): `mark_sur`と`uniCHARMM`を含むZDOCKのディレクトリ。
+
+    例外:
+        subprocess.CalledProcessError: `mark_sur`の実行に失敗した場合。
+    """
+    # mark_surはカレントディレクトリのuniCHARMMを読み込む
+    subprocess.run(["cp", os.path.join(zdock_path, "uniCHARMM"), ".", "-f"])
+    subprocess.run([os.path.join(zdock_path, "mark_sur"), pdb_file, out_pdb_file], check=True)
+
+
+def cached_mark(pdb_file, out_pdb_file, mark_func, dependencies=(), tag="mark_sur", cache_dir=None):
+    """
+    入力PDBファイルと、マーキングの結果を左右するファイル (`uniCHARMM`、`mark_sur`の実行ファイル) の
+    内容のハッシュをキーに、マーク済みPDBファイルをキャッシュします。
+    キャッシュがあればコピーするだけで、なければmark_funcで作成してキャッシュに保存します。
+
+    引数:
+        pdb_file (str): 入力PDBファイルのパス。
+        out_pdb_file (str): 出力するマーク済みPDBファイルのパス。
+        mark_func (callable): mark_func(pdb_file, out_pdb_file) の形でマーキングを行う関数。
+        dependencies (tuple, optional): キーに含めるファイルのパス。ZDOCKを更新してこれらが変わると、
+            キャッシュは使われずに再作成されます。
+        tag (str, optional): マーキング方法の識別子。方法ごとに別のキャッシュになります (デフォルトは "mark_sur")。
+        cache_dir (str, optional): キャッシュディレクトリ (デフォルトは $DOCK_REFINE_CACHE)。
+
+    戻り値:
+        bool: キャッシュを使用した場合はTrue。
+    """
+    cache_dir = os.path.join(cache_dir or CACHE_DIR, "mark_sur")
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = os.path.join(cache_dir, f"{tag}_{content_hash(pdb_file, *dependencies)}_m.pdb")
+
+    if os.path.exists(cache_file):
+        shutil.copyfile(cache_file, out_pdb_file)
+        return True
+
+    mark_func(pdb_file, out_pdb_file)
+    # 書き込み途中のファイルが他のプロセスから読まれないよう、一時ファイル経由で保存する
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    shutil.copyfile(out_pdb_file, tmp_file)
+    os.replace(tmp_file, cache_file)
+    return False
+
+
+def parse_blocked_residues(specs):
+    """
+    "A:45,50-55" 形式のブロック残基指定を解析します。
+
+    引数:
+        specs (str or list): "チェーン:残基番号" 形式の指定、またはそのリスト。残基番号はカンマ区切りで、
+            "50-55" のような範囲も指定できます。
+
+    戻り値:
+        dict: チェーンIDをキー、残基番号 (int) のリストを値とする辞書。
+
+    例外:
+        ValueError: 指定の形式が正しくない場合。
+    """
+    if isinstance(specs, str):
+        specs = [specs]
+    blocked = {}
+    for spec in specs or []:
+        chain, sep, residues = spec.partition(":")
+        if not sep or len(chain) != 1:
+            raise ValueError(f"ブロック残基は 'チェーン:残基番号' の形式で指定してください: {spec}")
+        for token in residues.replace(" ", "").split(","):
+            if not token:
+                continue
+            # 負の残基番号も扱えるよう、先頭以外の "-" で範囲を区切る
+            split = token.find("-", 1)
+            if split > 0:
+                first, last = int(token[:split]), int(token[split + 1:])
+                blocked.setdefault(chain, []).extend(range(first, last + 1))
+            else:
+                blocked.setdefault(chain, []).append(int(token))
+    return blocked
+
+
+def block_residues(marked_pdb_file, out_pdb_file, blocked_residues):
+    """
+    マーク済みPDBファイルの指定残基の原子タイプ (55-56桁) をZDOCKの`block.pl`と同じく19に書き換え、
+    ZDOCKの探索から除外します。入力と出力に同じファイルを指定できます。
+
+    引数:
+        marked_pdb_file (str): マーク済みPDBファイルのパス。
+        out_pdb_file (str): 出力するPDBファイルのパス。
+        blocked_residues (dict): チェーンIDをキー、除外する残基番号のリストを値とする辞書。
+            ファイルに含まれないチェーンは無視されます。
+
+    戻り値:
+        int: 書き換えた原子の数。
+
+    例外:
+        ValueError: ファイルに含まれるチェーンに、指定した残基が存在しない場合。
+    """
+    with open(marked_pdb_file, "r") as f:
+        lines = f.readlines()
+
+    targets = {(chain, residue) for chain, residues in blocked_residues.items() for residue in residues}
+    present = {line[21] for line in lines if line.startswith(("ATOM", "HETATM"))}
+    found = set()
+    count = 0
+    for i, line in enumerate(lines):
+        if not line.startswith(("ATOM", "HETATM")):
+            continue
+        key = (line[21], int(line[22:26]))
+        if key in targets:
+            lines[i] = f"{line[:54]}{BLOCKED_ATOM_TYPE:>2d}{line[56:]}"
+            found.add(key)
+            count += 1
+
+    missing = sorted(key for key in targets - found if key[0] in present)
+    if missing:
+        raise ValueError(f"ブロックする残基が見つかりません: {missing}")
+
+    with open(out_pdb_file, "w") as f:
+        f.writelines(lines)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ZDOCKのmark_surでPDBファイルの表面原子をマークし、結果をキャッシュします。")
+    parser.add_argument("pdb_file", help="入力PDBファイルのパス")
+    parser.add_argument("out_pdb_file", help="出力するマーク済みPDBファイルのパス")
+    parser.add_argument("--zdock", default=os.environ.get("ZDOCK", "."),
+                        help="mark_surとuniCHARMMを含むディレクトリ (デフォルト: $ZDOCK)")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使用しません")
+    parser.add_argument("--block", action="append", help="ZDOCKの探索から除外する残基 (例: A:45,50-55)。複数指定できます")
+    args = parser.parse_args()
+
+    def mark(pdb_file, out_pdb_file):
+        run_mark_sur(pdb_file, out_pdb_file, args.zdock)
+
+    if args.no_cache:
+        mark(args.pdb_file, args.out_pdb_file)
+    else:
+        cached_mark(args.pdb_file, args.out_pdb_file, mark,
+                    (os.path.join(args.zdock, "uniCHARMM"), os.path.join(args.zdock, "mark_sur")))
+    if args.block:
+        block_residues(args.out_pdb_file, args.out_pdb_file, parse_blocked_residues(args.block))
+
+
+if __name__ == "__main__":
+    main()
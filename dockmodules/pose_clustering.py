@@ -0,0 +1,841 @@
+#!/usr/bin/env python3
+"""
+このスクリプトは、`gmx cluster`を使わずにZDOCKのポーズをPython内でクラスタリングする機能を提供します。
+
+ZDOCKのポーズは全て同じ受容体座標系で表されるため、構造の重ね合わせは不要です。
+リガンドのC-alpha原子のRMSD行列をzdock.outの剛体変換からNumPyで一括計算し、
+`gmx cluster -method gromos` と同じGROMOS法でクラスタリングします。結果は
+`parse_cluster_log`と同じ列を持つDataFrameで返すため、`cluster_pdb_files`の後続処理をそのまま使えます。
+
+RMSDは既定で複合体全体 (受容体 + リガンド) のC-alpha原子について計算します。受容体の座標は
+全ポーズで同一なので、これはリガンドのRMSDを原子数の比で縮めたものに等しく、`gmx cluster`
+(グループ3: C-alpha) と同じ感覚でカットオフを指定できます。
+
+HADDOCKのモデルなど受容体座標系が共通でない構造には、共分散行列をバッチ次元に積み重ねて
+まとめて特異値分解するKabsch法の重ね合わせ後RMSDも使用できます。
+全ペアのRMSD行列が大きすぎる数万個以上のポーズには、リガンド重心の格子で候補のリーダーを絞る
+逐次リーダー法を使用できます。
+複合体PDBファイルのRMSD行列は、共有メモリ上で複数プロセスに分けて計算することもできます。
+
+RMSD行列は圧縮形式 (上三角) のfloat32ファイルとして $DOCK_REFINE_CACHE にキャッシュできるため、
+同じポーズの集合を複数のカットオフで再クラスタリングする場合もRMSDの計算は1度で済みます。
+複合体PDBファイルのRMSD行列 (kabsch、gmx-dmエンジン) も、選択した原子の座標のハッシュをキーに同じ形式でキャッシュします。
+
+使用方法:
+    ZDOCKを実行したディレクトリで、zdock.outとクラスタリングするポーズ数を指定して実行します。
+
+例:
+    python pose_clustering.py zdock.out -n 100 --cutoff 0.45
+    python pose_clustering.py zdock.out -n 2000 --sweep 0.2,0.3,0.45,0.6 --output sweep.csv
+
+依存関係:
+    - NumPy
+    - SciPy
+    - pandas
+    - natsort
+
+関数:
+    - pairwise_rmsd: 座標の組から重ね合わせなしのRMSD行列を計算します。
+    - kabsch_rmsd: 構造のペアごとの重ね合わせ後のRMSDを一括計算します。
+    - fitted_rmsd_matrix: 全構造のペアについて重ね合わせ後のRMSD行列を計算します。
+    - parallel_rmsd_matrix: 共有メモリ上の座標から、RMSD行列を複数プロセスでタイルごとに計算します。
+    - gromos_clustering: RMSD行列をGROMOS法でクラスタリングします。
+    - clusters_to_dataframe: クラスタリング結果を`parse_cluster_log`と同じ形式のDataFrameにします。
+    - rmsd_matrix_cache: ポーズの全ペアのRMSDを圧縮形式のファイルにキャッシュし、メモリマップで返します。
+    - cluster_cutoff_sweep: キャッシュしたRMSD行列を使い、複数のカットオフでまとめてクラスタリングします。
+    - summarize_cutoff_sweep: カットオフごとのクラスター数と上位クラスターの大きさを表にします。
+    - cluster_poses: zdock.outのポーズを剛体変換から直接クラスタリングします。
+    - leader_clustering: zdock.outのポーズをスコア順に逐次リーダー法でクラスタリングします。
+    - interface_residue_keys: 複合体PDBファイルのいずれかでインターフェイスにある残基の和集合を求めます。
+    - selection_mask: RMSDを計算する原子 (C-alpha、主鎖、リガンドのC-alpha、インターフェイス) を選択します。
+    - superposition_transforms: 各構造を参照構造に重ねる回転と並進をKabsch法で一括計算します。
+    - receptor_fitted_coords: 複合体の全原子を受容体のC-alpha原子で参照構造に重ね合わせた座標を返します。
+    - select_pdb_coordinates: 複合体PDBファイルから選択した原子の座標を取り出します。
+    - pdb_rmsd_matrix: 複合体PDBファイルの選択した原子のRMSD行列を計算します (キャッシュ可)。
+    - pdb_cutoff_sweep: 複合体PDBファイルのキャッシュしたRMSD行列を使い、複数のカットオフでまとめてクラスタリングします。
+    - cluster_pdb_coordinates: 複合体PDBファイルをクラスタリングします。
+"""
+import argparse
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool, shared_memory
+from natsort import natsorted
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import squareform
+from dockmodules.mark_surface import CACHE_DIR
+from dockmodules.zdock_output import ZDockResult, ligand_rmsd_matrix, read_pdb_atoms
+
+# 複合体PDBファイルのRMSDを計算する原子の選択
+SELECTIONS = ("calpha", "backbone", "ligand-calpha", "interface")
+# CAPRIのi-RMSDと同じく、相手の分子から10Å以内の残基をインターフェイスとする
+INTERFACE_DISTANCE = 10.0
+
+
+def pairwise_rmsd(coords):
+    """
+    座標の組から、重ね合わせなしの全ペアのRMSD行列を計算します。
+
+    引数:
+        coords (np.ndarray): 形状 (構造数, 原子数, 3) の座標。
+
+    戻り値:
+        np.ndarray: 形状 (構造数, 構造数) のRMSD行列 (座標と同じ単位)。
+    """
+    flat = np.asarray(coords, dtype=float).reshape(len(coords), -1)
+    sq_norm = np.sum(flat ** 2, axis=1)
+    sq_dist = sq_norm[:, None] + sq_norm[None, :] - 2.0 * flat @ flat.T
+    return np.sqrt(np.maximum(sq_dist, 0.0) / coords.shape[1])
+
+
+def kabsch_rmsd(coords_a, coords_b):
+    """
+    構造のペアごとに最適な重ね合わせ (Kabsch法) をした後のRMSDを一括計算します。
+
+    共分散行列を積み重ねてバッチ次元でまとめて特異値分解するため、ペアごとのPythonループはありません。
+    鏡像にならないよう、共分散行列の行列式が負のペアでは最小の特異値の符号を反転します。
+
+    引数:
+        coords_a (np.ndarray): 形状 (ペア数, 原子数, 3) の座標。
+        coords_b (np.ndarray): 形状 (ペア数, 原子数, 3) の座標。
+
+    戻り値:
+        np.ndarray: 形状 (ペア数,) の重ね合わせ後のRMSD (座標と同じ単位)。
+    """
+    coords_a = coords_a - coords_a.mean(axis=1, keepdims=True)
+    coords_b = coords_b - coords_b.mean(axis=1, keepdims=True)
+    covariance = np.einsum("kma,kmb->kab", coords_a, coords_b)
+    sq_norm = np.sum(coords_a ** 2, axis=(1, 2)) + np.sum(coords_b ** 2, axis=(1, 2))
+    return _fitted_rmsd(covariance, sq_norm, coords_a.shape[1])
+
+
+def _fitted_rmsd(covariance, sq_norm, num_atoms):
+    # 特異値の和 (回転を鏡像にしない符号付き) から重ね合わせ後の二乗偏差を求める
+    singular = np.linalg.svd(covariance, compute_uv=False)
+    singular[..., -1] *= np.sign(np.linalg.det(covariance))
+    return np.sqrt(np.maximum(sq_norm - 2.0 * singular.sum(axis=-1), 0.0) / num_atoms)
+
+
+def fitted_rmsd_matrix(coords, block_size=256):
+    """
+    全構造のペアについて、重ね合わせ後のRMSD行列を計算します。
+
+    各構造を重心に移動した後、行ブロックごとに全構造との共分散行列を1回の行列積で求め、
+    まとめて特異値分解します。対称性を使って上三角のみを計算します。
+
+    引数:
+        coords (np.ndarray): 形状 (構造数, 原子数, 3) の座標。
+        block_size (int, optional): 一度に処理する行の数 (デフォルトは256)。
+
+    戻り値:
+        np.ndarray: 形状 (構造数, 構造数) のRMSD行列 (座標と同じ単位)。
+    """
+    coords = np.asarray(coords, dtype=float)
+    coords = coords - coords.mean(axis=1, keepdims=True)
+    n, num_atoms = coords.shape[:2]
+    # (構造数 * 3, 原子数) にして、行列積でブロック内の全ペアの共分散行列を得る
+    stacked = coords.transpose(0, 2, 1).reshape(n * 3, num_atoms)
+    sq_norm = np.sum(coords ** 2, axis=(1, 2))
+
+    rmsd = np.zeros((n, n))
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        products = stacked[start * 3:stop * 3] @ stacked[start * 3:].T
+        covariance = products.reshape(stop - start, 3, n - start, 3).transpose(0, 2, 1, 3)
+        block = _fitted_rmsd(covariance, sq_norm[start:stop, None] + sq_norm[None, start:], num_atoms)
+        rmsd[start:stop, start:] = block
+        rmsd[start:, start:stop] = block.T
+    np.fill_diagonal(rmsd, 0.0)
+    return rmsd
+
+
+_worker_buffers = None
+
+
+def _init_rmsd_worker(coords_name, rmsd_name, shape, fit):
+    # 共有メモリに名前で接続し、プロセスの終了まで保持する
+    global _worker_buffers
+    coords_shm = shared_memory.SharedMemory(name=coords_name)
+    rmsd_shm = shared_memory.SharedMemory(name=rmsd_name)
+    coords = np.ndarray(shape, dtype=float, buffer=coords_shm.buf)
+    rmsd = np.ndarray((shape[0], shape[0]), dtype=float, buffer=rmsd_shm.buf)
+    _worker_buffers = (coords_shm, rmsd_shm, coords, rmsd, fit)
+
+
+def _rmsd_tile(row_start, row_stop, col_start, col_stop):
+    # 1つのタイルのRMSDを計算し、共有メモリの出力行列の対称な2か所に直接書き込む
+    _, _, coords, rmsd, fit = _worker_buffers
+    rows, cols = coords[row_start:row_stop], coords[col_start:col_stop]
+    num_atoms = coords.shape[1]
+    if fit:
+        # 座標は重心に移動済み。(構造数 * 3, 原子数) の行列積でタイル内の全ペアの共分散行列を得る
+        products = rows.transpose(0, 2, 1).reshape(-1, num_atoms) @ cols.transpose(0, 2, 1).reshape(-1, num_atoms).T
+        covariance = products.reshape(len(rows), 3, len(cols), 3).transpose(0, 2, 1, 3)
+        sq_norm = np.sum(rows ** 2, axis=(1, 2))[:, None] + np.sum(cols ** 2, axis=(1, 2))[None, :]
+        block = _fitted_rmsd(covariance, sq_norm, num_atoms)
+    else:
+        rows, cols = rows.reshape(len(rows), -1), cols.reshape(len(cols), -1)
+        sq_dist = np.sum(rows ** 2, axis=1)[:, None] + np.sum(cols ** 2, axis=1)[None, :] - 2.0 * rows @ cols.T
+        block = np.sqrt(np.maximum(sq_dist, 0.0) / num_atoms)
+    rmsd[row_start:row_stop, col_start:col_stop] = block
+    rmsd[col_start:col_stop, row_start:row_stop] = block.T
+
+
+def parallel_rmsd_matrix(coords, fit=False, block_size=256, processes=None):
+    """
+    全構造のペアのRMSD行列を、複数プロセスでタイルに分けて計算します。
+
+    座標と出力行列を`multiprocessing.shared_memory`に置き、各プロセスは上三角のタイルの範囲だけを
+    受け取って共有メモリの出力行列に直接書き込むため、座標や結果のpickle化は行いません。
+
+    引数:
+        coords (np.ndarray): 形状 (構造数, 原子数, 3) の座標。
+        fit (bool, optional): Kabsch法で重ね合わせてからRMSDを計算するか (デフォルトはFalse)。
+        block_size (int, optional): タイルの一辺の構造数 (デフォルトは256)。
+        processes (int, optional): プロセス数 (デフォルトはCPUコア数)。
+
+    戻り値:
+        np.ndarray: 形状 (構造数, 構造数) のRMSD行列 (座標と同じ単位)。
+    """
+    coords = np.asarray(coords, dtype=float)
+    if fit:
+        coords = coords - coords.mean(axis=1, keepdims=True)
+    n = len(coords)
+    processes = processes or os.cpu_count() or 1
+    tiles = [(row, min(row + block_size, n), col, min(col + block_size, n))
+             for row in range(0, n, block_size) for col in range(row, n, block_size)]
+
+    coords_shm = shared_memory.SharedMemory(create=True, size=max(coords.nbytes, 1))
+    rmsd_shm = shared_memory.SharedMemory(create=True, size=max(n * n * 8, 1))
+    try:
+        np.ndarray(coords.shape, dtype=float, buffer=coords_shm.buf)[:] = coords
+        with Pool(min(processes, len(tiles)) or 1, initializer=_init_rmsd_worker,
+                  initargs=(coords_shm.name, rmsd_shm.name, coords.shape, fit)) as pool:
+            pool.starmap(_rmsd_tile, tiles, chunksize=1)
+        rmsd = np.ndarray((n, n), dtype=float, buffer=rmsd_shm.buf).copy()
+    finally:
+        coords_shm.close()
+        coords_shm.unlink()
+        rmsd_shm.close()
+        rmsd_shm.unlink()
+    np.fill_diagonal(rmsd, 0.0)
+    return rmsd
+
+
+def gromos_clustering(rmsd, cutoff):
+    """
+    RMSD行列をGROMOS法 (Daura et al., 1999) でクラスタリングします。
+
+    カットオフ未満の近傍が最も多い構造とその近傍を1つのクラスターとして取り除き、
+    残りの構造について同じ操作を繰り返します。
+
+    引数:
+        rmsd (np.ndarray): 形状 (n, n) のRMSD行列。
+        cutoff (float): 近傍とみなすRMSDのカットオフ (rmsdと同じ単位)。
+
+    戻り値:
+        list: 各クラスターのメンバーのインデックス (0始まり、昇順) の配列のリスト。見つかった順 (大きい順) に並びます。
+    """
+    neighbors = rmsd < cutoff
+    np.fill_diagonal(neighbors, False)
+    counts = neighbors.sum(axis=1)
+    remaining = np.ones(len(rmsd), dtype=bool)
+
+    clusters = []
+    while np.any(remaining):
+        # 残っている構造のうち近傍の最も多いもの (同数なら番号の小さいもの) を中心にする
+        center = int(np.argmax(np.where(remaining, counts, -1)))
+        members = np.flatnonzero(remaining & neighbors[center])
+        members = np.union1d(members, [center])
+        clusters.append(members)
+        remaining[members] = False
+        # 取り除いた構造を近傍の数から差し引く
+        counts -= neighbors[:, members].sum(axis=1)
+    return clusters
+
+
+def clusters_to_dataframe(rmsd, clusters, ids=None):
+    """
+    クラスタリング結果を`parse_cluster_log`と同じ列を持つDataFrameにします。
+
+    `gmx cluster`と同様に、RMSDはクラスター内の全ペアの平均、中央構造は他のメンバーとの
+    平均RMSDが最小のメンバーとし、メンバーが1つのクラスターのRMSDはNaNとします。
+
+    引数:
+        rmsd (np.ndarray): 形状 (n, n) のRMSD行列 (nm)。
+        clusters (list): gromos_clusteringの戻り値。
+        ids (array_like, optional): 各構造のID (デフォルトは1始まりの通し番号)。
+
+    戻り値:
+        pd.DataFrame: "Cluster ID", "# Structures", "RMSD", "Middle Structure", "Middle RMSD", "Members" の列を持つDataFrame。
+    """
+    ids = np.arange(1, len(rmsd) + 1) if ids is None else np.asarray(ids)
+    rows = []
+    for cluster_id, members in enumerate(clusters, start=1):
+        if len(members) > 1:
+            sub = rmsd[np.ix_(members, members)]
+            mean_to_others = sub.sum(axis=1) / (len(members) - 1)
+            middle = int(np.argmin(mean_to_others))
+            cluster_rmsd = sub[np.triu_indices(len(members), k=1)].mean()
+            middle_rmsd = mean_to_others[middle]
+        else:
+            middle, cluster_rmsd, middle_rmsd = 0, np.nan, np.nan
+        rows.append({
+            "Cluster ID": cluster_id,
+            "# Structures": len(members),
+            "RMSD": cluster_rmsd,
+            "Middle Structure": int(ids[members[middle]]),
+            "Middle RMSD": middle_rmsd,
+            "Members": ", ".join(str(ids[member]) for member in members)
+        })
+    return pd.DataFrame(rows, columns=["Cluster ID", "# Structures", "RMSD", "Middle Structure", "Middle RMSD", "Members"])
+
+
+def _ca_mask(atoms):
+    # C-alpha原子がなければ全原子を使う
+    mask = atoms.names == "CA"
+    return mask if np.any(mask) else np.ones(len(atoms), dtype=bool)
+
+
+def _rmsd_atoms(result, group):
+    # RMSDに使うリガンド原子の座標と、リガンドのRMSDをgroupの原子全体のRMSDに換算する係数
+    if group not in ("complex", "ligand"):
+        raise ValueError(f"groupは 'complex' または 'ligand' を指定してください: {group}")
+    ligand_mask = _ca_mask(result.ligand)
+    scale = 1.0
+    if group == "complex":
+        # 受容体原子の偏差は0なので、リガンドの二乗偏差を複合体全体の原子数で平均し直す
+        num_ligand = ligand_mask.sum()
+        scale = np.sqrt(num_ligand / (num_ligand + _ca_mask(result.receptor).sum()))
+    return result.ligand.coords[ligand_mask], scale
+
+
+def _rmsd_cache_file(arrays, n, cache_dir=None):
+    # キーとなる配列のハッシュと構造数から、圧縮形式のRMSD行列のキャッシュファイルのパスを決める
+    digest = hashlib.sha256()
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+    cache_dir = os.path.join(cache_dir or CACHE_DIR, "rmsd_matrix")
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, f"{digest.hexdigest()}_{n}.f32")
+
+
+def _write_rmsd_cache(cache_file, n, fill):
+    # 書き込み途中のファイルが他のプロセスから読まれないよう、一時ファイル経由で保存する
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    condensed = np.memmap(tmp_file, mode="w+", dtype=np.float32, shape=(n * (n - 1) // 2,))
+    fill(condensed)
+    condensed.flush()
+    del condensed
+    os.replace(tmp_file, cache_file)
+
+
+def rmsd_matrix_cache(zdock_result, indices=None, group="complex", cache_dir=None, block_size=1024):
+    """
+    ポーズの全ペアのRMSD (nm) を、上三角を行順に並べた圧縮形式 (`scipy.spatial.distance.squareform`と同じ)
+    のfloat32ファイルとしてキャッシュし、メモリマップで返します。
+
+    キーはポーズの剛体変換・RMSDに使う原子の座標・groupのハッシュなので、同じポーズの集合であれば
+    カットオフを変えて何度クラスタリングしても再計算しません。
+
+    引数:
+        zdock_result (ZDockResult or str): ZDOCKの結果、またはzdock.outのパス。
+        indices (array_like, optional): 対象ポーズの0始まりのインデックス (デフォルトは全ポーズ)。
+        group (str, optional): RMSDを計算する原子。"complex" または "ligand" (デフォルトは "complex")。
+        cache_dir (str, optional): キャッシュディレクトリ (デフォルトは $DOCK_REFINE_CACHE)。
+        block_size (int, optional): 一度に計算する行の数 (デフォルトは1024)。
+
+    戻り値:
+        np.memmap: 長さ n(n-1)/2 の読み取り専用のRMSD (nm)。
+
+    例外:
+        ValueError: groupが "complex" または "ligand" でない場合。
+    """
+    result = zdock_result if isinstance(zdock_result, ZDockResult) else ZDockResult(zdock_result)
+    indices = np.arange(len(result)) if indices is None else np.asarray(indices, dtype=int)
+    coords, scale = _rmsd_atoms(result, group)
+    rotations, translations = result.transforms(indices)
+    n = len(indices)
+    if n < 2:
+        return np.zeros(0, dtype=np.float32)
+
+    cache_file = _rmsd_cache_file((rotations, translations, coords, np.array([scale])), n, cache_dir)
+    if not os.path.exists(cache_file):
+        def fill(condensed):
+            for start in range(0, n - 1, block_size):
+                stop = min(start + block_size, n - 1)
+                block = ligand_rmsd_matrix(rotations[start:stop], translations[start:stop], rotations[start:], translations[start:], coords)
+                block *= scale / 10.0
+                # 行iの上三角部分 (j > i) は圧縮形式で連続している
+                offset = start * n - start * (start + 1) // 2
+                for row in range(stop - start):
+                    length = n - start - row - 1
+                    condensed[offset:offset + length] = block[row, row + 1:]
+                    offset += length
+        _write_rmsd_cache(cache_file, n, fill)
+
+    return np.memmap(cache_file, mode="r", dtype=np.float32, shape=(n * (n - 1) // 2,))
+
+
+def cluster_cutoff_sweep(zdock_result, cutoffs, indices=None, group="complex", cache_dir=None):
+    """
+    キャッシュしたRMSD行列を1度だけ読み込み、複数のカットオフでGROMOS法のクラスタリングを行います。
+
+    引数:
+        zdock_result (ZDockResult or str): ZDOCKの結果、またはzdock.outのパス。
+        cutoffs (list): クラスタリングのカットオフ距離 (nm) のリスト。
+        indices (array_like, optional): クラスタリングするポーズの0始まりのインデックス (デフォルトは全ポーズ)。
+        group (str, optional): RMSDを計算する原子。"complex" または "ligand" (デフォルトは "complex")。
+        cache_dir (str, optional): キャッシュディレクトリ (デフォルトは $DOCK_REFINE_CACHE)。
+
+    戻り値:
+        dict: カットオフをキー、`parse_cluster_log`と同じ列を持つクラスタリング結果を値とする辞書。
+
+    例外:
+        ValueError: groupが "complex" または "ligand" でない場合。
+    """
+    result = zdock_result if isinstance(zdock_result, ZDockResult) else ZDockResult(zdock_result)
+    indices = np.arange(len(result)) if indices is None else np.asarray(indices, dtype=int)
+    condensed = rmsd_matrix_cache(result, indices, group, cache_dir)
+    rmsd = squareform(np.asarray(condensed, dtype=float), checks=False) if len(indices) > 1 else np.zeros((len(indices),) * 2)
+    return {cutoff: clusters_to_dataframe(rmsd, gromos_clustering(rmsd, cutoff)) for cutoff in cutoffs}
+
+
+def summarize_cutoff_sweep(sweep, top=3):
+    """
+    cluster_cutoff_sweepの結果を、カットオフごとのクラスター数と上位クラスターの大きさの表にします。
+
+    引数:
+        sweep (dict): cluster_cutoff_sweepの戻り値。
+        top (int, optional): 大きさを表示する上位クラスターの数 (デフォルトは3)。
+
+    戻り値:
+        pd.DataFrame: "Cutoff", "# Clusters", "Top Sizes", "Top Middle Structures" の列を持つDataFrame。
+    """
+    rows = []
+    for cutoff, df in sorted(sweep.items()):
+        rows.append({
+            "Cutoff": cutoff,
+            "# Clusters": len(df),
+            "Top Sizes": ", ".join(str(size) for size in df["# Structures"].head(top)),
+            "Top Middle Structures": ", ".join(str(middle) for middle in df["Middle Structure"].head(top))
+        })
+    return pd.DataFrame(rows, columns=["Cutoff", "# Clusters", "Top Sizes", "Top Middle Structures"])
+
+
+def cluster_poses(zdock_result, indices=None, cutoff_distance=0.45, group="complex", use_cache=False, cache_dir=None):
+    """
+    zdock.outのポーズを、複合体PDBファイルを介さず剛体変換から直接GROMOS法でクラスタリングします。
+
+    引数:
+        zdock_result (ZDockResult or str): ZDOCKの結果、またはzdock.outのパス。
+        indices (array_like, optional): クラスタリングするポーズの0始まりのインデックス。k番目のポーズの
+            IDはkになり、`create_pl(indices=...)`が書き出すcomplex.k.pdbに対応します (デフォルトは全ポーズ)。
+        cutoff_distance (float, optional): クラスタリングのカットオフ距離 (nm) (デフォルトは0.45)。
+        group (str, optional): RMSDを計算する原子。"complex" は複合体全体、"ligand" はリガンドのみの
+            C-alpha原子です (デフォルトは "complex")。
+        use_cache (bool, optional): RMSD行列をrmsd_matrix_cacheでキャッシュするか (デフォルトはFalse)。
+        cache_dir (str, optional): キャッシュディレクトリ (デフォルトは $DOCK_REFINE_CACHE)。
+
+    戻り値:
+        pd.DataFrame: `parse_cluster_log`と同じ列を持つクラスタリング結果。
+
+    例外:
+        ValueError: groupが "complex" または "ligand" でない場合。
+    """
+    if use_cache:
+        return cluster_cutoff_sweep(zdock_result, [cutoff_distance], indices, group, cache_dir)[cutoff_distance]
+    result = zdock_result if isinstance(zdock_result, ZDockResult) else ZDockResult(zdock_result)
+    indices = np.arange(len(result)) if indices is None else np.asarray(indices, dtype=int)
+
+    coords, scale = _rmsd_atoms(result, group)
+    rotations, translations = result.transforms(indices)
+    rmsd = ligand_rmsd_matrix(rotations, translations, rotations, translations, coords)
+    # gmx clusterと同じくnm単位で扱う
+    rmsd *= scale / 10.0
+    np.fill_diagonal(rmsd, 0.0)
+    return clusters_to_dataframe(rmsd, gromos_clustering(rmsd, cutoff_distance))
+
+
+def leader_clustering(zdock_result, indices=None, cutoff_distance=0.45, group="complex", chunk_size=10000):
+    """
+    ポーズをスコア順に1つずつ読み、カットオフ以内のリーダー (代表ポーズ) があれば最も近いリーダーの
+    クラスターに加え、なければ新しいリーダーにする逐次クラスタリングを行います。
+
+    全ペアのRMSD行列を作らないため、数万から10^5個のポーズも扱えます。リガンド重心間の距離は
+    リガンドRMSDの下限になるので、リーダーの重心をカットオフの大きさの格子セルに登録し、
+    近傍の27セルのリーダーとのみ厳密なRMSDを計算します。保持するのはリーダーの剛体変換と
+    各ポーズの所属のみです。
+
+    引数:
+        zdock_result (ZDockResult or str): ZDOCKの結果、またはzdock.outのパス。
+        indices (array_like, optional): クラスタリングするポーズの0始まりのインデックスをスコア順に並べたもの。
+            k番目のポーズのIDはkになります (デフォルトはzdock.outの全ポーズ)。
+        cutoff_distance (float, optional): クラスタリングのカットオフ距離 (nm) (デフォルトは0.45)。
+        group (str, optional): RMSDを計算する原子。"complex" は複合体全体、"ligand" はリガンドのみの
+            C-alpha原子です (デフォルトは "complex")。
+        chunk_size (int, optional): 一度に剛体変換を計算するポーズ数 (デフォルトは10000)。
+
+    戻り値:
+        pd.DataFrame: `parse_cluster_log`と同じ列を持つクラスタリング結果 (大きい順)。中央構造はリーダー、
+        RMSDと中央構造のRMSDはメンバーとリーダーのRMSDの平均です。
+
+    例外:
+        ValueError: groupが "complex" または "ligand" でない場合。
+    """
+    result = zdock_result if isinstance(zdock_result, ZDockResult) else ZDockResult(zdock_result)
+    indices = np.arange(len(result)) if indices is None else np.asarray(indices, dtype=int)
+
+    coords, scale = _rmsd_atoms(result, group)
+    center = coords.mean(axis=0)
+    # nm単位の (groupの原子についての) カットオフを、リガンドのみのRMSD (Å) のカットオフに換算する
+    cutoff = cutoff_distance * 10.0 / scale
+    offsets = [(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)]
+
+    table = {}
+    # リーダーの剛体変換と重心は、容量を倍々に増やす配列に保持する
+    num_leaders = 0
+    leader_rotations = np.empty((1024, 3, 3))
+    leader_translations = np.empty((1024, 3))
+    leader_centroids = np.empty((1024, 3))
+    labels = np.empty(len(indices), dtype=int)
+    distances = np.zeros(len(indices))
+    for start in range(0, len(indices), chunk_size):
+        rotations, translations = result.transforms(indices[start:start + chunk_size])
+        centroids = rotations @ center + translations
+        cells = np.floor(centroids / cutoff).astype(np.int64)
+        for offset in range(len(rotations)):
+            cell = tuple(cells[offset])
+            candidates = [leader for shift in offsets
+                          for leader in table.get((cell[0] + shift[0], cell[1] + shift[1], cell[2] + shift[2]), ())]
+            if candidates:
+                candidates = np.array(candidates)
+                # 重心間の距離がカットオフを超えるリーダーは厳密なRMSDを計算するまでもない
+                close = np.linalg.norm(leader_centroids[candidates] - centroids[offset], axis=1) < cutoff
+                candidates = candidates[close]
+            if len(candidates):
+                rmsd = ligand_rmsd_matrix(rotations[offset:offset + 1], translations[offset:offset + 1],
+                                          leader_rotations[candidates], leader_translations[candidates], coords)[0]
+                nearest = int(np.argmin(rmsd))
+                if rmsd[nearest] < cutoff:
+                    labels[start + offset] = candidates[nearest]
+                    distances[start + offset] = rmsd[nearest]
+                    continue
+            # カットオフ以内のリーダーがなければ新しいリーダーにする
+            if num_leaders == len(leader_rotations):
+                leader_rotations = np.concatenate([leader_rotations, np.empty_like(leader_rotations)])
+                leader_translations = np.concatenate([leader_translations, np.empty_like(leader_translations)])
+                leader_centroids = np.concatenate([leader_centroids, np.empty_like(leader_centroids)])
+            table.setdefault(cell, []).append(num_leaders)
+            labels[start + offset] = num_leaders
+            leader_rotations[num_leaders] = rotations[offset]
+            leader_translations[num_leaders] = translations[offset]
+            leader_centroids[num_leaders] = centroids[offset]
+            num_leaders += 1
+
+    # gmx clusterと同じく大きい順に並べ、nm単位 (groupの原子についてのRMSD) で出力する
+    sizes = np.bincount(labels, minlength=num_leaders)
+    distances *= scale / 10.0
+    # 全リーダーのメンバーを1回の安定ソートでまとめて求める (各リーダーのメンバーはID順のまま)
+    members_of = np.split(np.argsort(labels, kind="stable"), np.cumsum(sizes)[:-1])
+    rows = []
+    for cluster_id, leader in enumerate(np.argsort(-sizes, kind="stable"), start=1):
+        members = members_of[leader]
+        mean_rmsd = distances[members].sum() / (len(members) - 1) if len(members) > 1 else np.nan
+        rows.append({
+            "Cluster ID": cluster_id,
+            "# Structures": len(members),
+            "RMSD": mean_rmsd,
+            "Middle Structure": int(members[0]) + 1,
+            "Middle RMSD": mean_rmsd,
+            "Members": ", ".join(str(member + 1) for member in members)
+        })
+    return pd.DataFrame(rows, columns=["Cluster ID", "# Structures", "RMSD", "Middle Structure", "Middle RMSD", "Members"])
+
+
+def superposition_transforms(coords, reference):
+    """
+    各構造を参照構造に重ねる回転と並進を、Kabsch法でバッチ次元にまとめて計算します。
+
+    引数:
+        coords (np.ndarray): 形状 (構造数, 原子数, 3) の重ね合わせに使う原子の座標。
+        reference (np.ndarray): 形状 (原子数, 3) の参照構造の座標。
+
+    戻り値:
+        tuple: (rotations, translations)。ZDockResult.transformsと同じく x' = x @ R.T + t で重ね合わせます。
+        - rotations (np.ndarray): 形状 (構造数, 3, 3) の回転行列。
+        - translations (np.ndarray): 形状 (構造数, 3) の並進ベクトル。
+    """
+    coords = np.asarray(coords, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    centers = coords.mean(axis=1)
+    reference_center = reference.mean(axis=0)
+    covariance = np.einsum("kma,mb->kab", coords - centers[:, None, :], reference - reference_center)
+    u, _, vt = np.linalg.svd(covariance)
+    # 鏡像にならないよう、行列式が負の場合は最小の特異値に対応する軸を反転する
+    sign = np.sign(np.linalg.det(np.einsum("kab,kbc->kac", u, vt)))
+    vt[:, -1, :] *= sign[:, None]
+    rotations = np.einsum("kab,kbc->kca", u, vt)
+    translations = reference_center - np.einsum("kab,kb->ka", rotations, centers)
+    return rotations, translations
+
+
+def _receptor_ca(atoms, chains=None):
+    # 受容体のC-alpha原子の座標
+    return atoms.coords[_ca_mask(atoms) & (atoms.chains == _chain_pair(atoms, chains)[0])]
+
+
+def receptor_fitted_coords(atoms, reference, chains=None):
+    """
+    複合体の全原子を、受容体のC-alpha原子で参照構造に重ね合わせた座標を返します。
+
+    引数:
+        atoms (PDBAtoms): 重ね合わせる複合体の原子。
+        reference (PDBAtoms): 参照構造の原子。
+        chains (tuple, optional): 受容体とリガンドのチェーンID (デフォルトはファイル内の最初の2つのチェーン)。
+
+    戻り値:
+        np.ndarray: 形状 (原子数, 3) の重ね合わせた座標。
+    """
+    rotations, translations = superposition_transforms(_receptor_ca(atoms, chains)[None], _receptor_ca(reference, chains))
+    return atoms.coords @ rotations[0].T + translations[0]
+
+
+def _chain_pair(atoms, chains):
+    # 受容体とリガンドのチェーンID (指定がなければファイル内の最初の2つのチェーン)
+    pair = chains or list(dict.fromkeys(atoms.chains))[:2]
+    if len(pair) < 2:
+        raise ValueError("受容体とリガンドの2つのチェーンが見つかりません。")
+    return pair
+
+
+def interface_residue_keys(pdb_files, chains=None, distance=INTERFACE_DISTANCE):
+    """
+    いずれかの複合体PDBファイルで相手のチェーンの原子からdistance以内にある残基の和集合を求めます。
+
+    引数:
+        pdb_files (list): 複合体PDBファイルのパスのリスト。
+        chains (tuple, optional): 受容体とリガンドのチェーンID (デフォルトは各ファイルの最初の2つのチェーン)。
+        distance (float, optional): インターフェイスとみなす原子間距離 (Å) (デフォルトは10.0Å)。
+
+    戻り値:
+        set: インターフェイス残基の (チェーンID, 残基番号, 挿入コード) の集合。
+    """
+    keys = set()
+    for pdb_file in pdb_files:
+        atoms = read_pdb_atoms(pdb_file)
+        index_a, index_b = (np.flatnonzero(atoms.chains == chain) for chain in _chain_pair(atoms, chains))
+        pairs = cKDTree(atoms.coords[index_a]).sparse_distance_matrix(cKDTree(atoms.coords[index_b]), distance,
+                                                                      output_type="ndarray")
+        for atom in np.concatenate([index_a[np.unique(pairs["i"])], index_b[np.unique(pairs["j"])]]):
+            keys.add((atoms.chains[atom], atoms.resseqs[atom], atoms.icodes[atom]))
+    return keys
+
+
+def selection_mask(atoms, selection="calpha", chains=None, interface_keys=None):
+    """
+    RMSDを計算する原子の選択をブール配列で返します。
+
+    引数:
+        atoms (PDBAtoms): 複合体の原子。
+        selection (str, optional): "calpha" は全C-alpha原子、"backbone" は主鎖 (N, CA, C)、
+            "ligand-calpha" はリガンドのC-alpha原子、"interface" はインターフェイス残基のC-alpha原子です
+            (デフォルトは "calpha")。"ligand-calpha" で重ね合わせる場合は、リガンドではなく受容体の
+            C-alpha原子で重ね合わせてください (select_pdb_coordinatesのfit_receptor)。
+        chains (tuple, optional): 受容体とリガンドのチェーンID (デフォルトはファイル内の最初の2つのチェーン)。
+        interface_keys (set, optional): "interface" で使うinterface_residue_keysの戻り値。
+
+    戻り値:
+        np.ndarray: 選択した原子がTrueのブール配列。
+
+    例外:
+        ValueError: selectionが不正な場合、またはselectionが "interface" でinterface_keysがない場合。
+    """
+    if selection not in SELECTIONS:
+        raise ValueError(f"selectionは {', '.join(SELECTIONS)} のいずれかを指定してください: {selection}")
+    if selection == "backbone":
+        return np.isin(atoms.names, ("N", "CA", "C"))
+    mask = _ca_mask(atoms)
+    if selection == "ligand-calpha":
+        mask &= atoms.chains == _chain_pair(atoms, chains)[1]
+    elif selection == "interface":
+        if interface_keys is None:
+            raise ValueError("selectionが 'interface' の場合はinterface_keysを指定してください。")
+        mask &= np.array([key in interface_keys for key in zip(atoms.chains, atoms.resseqs, atoms.icodes)], dtype=bool)
+    return mask
+
+
+def select_pdb_coordinates(pdb_files, selection="calpha", chains=None, interface_distance=INTERFACE_DISTANCE, fit_receptor=False):
+    """
+    複合体PDBファイルから、RMSDを計算する原子の座標を取り出します。ファイルは自然順に並べます。
+
+    "interface" のインターフェイス残基は、自然順で最初のファイル (パイプラインではZDOCKスコアが最も良い
+    complex.1.pdb) から求めます。全ファイルの和集合にすると、数千個のポーズでは受容体表面のほぼ全体になり、
+    インターフェイスに絞る意味がなくなるためです。
+
+    引数:
+        pdb_files (list): 複合体PDBファイルのパスのリスト。
+        selection (str, optional): RMSDを計算する原子。selection_maskを参照してください (デフォルトは "calpha")。
+        chains (tuple, optional): 受容体とリガンドのチェーンID (デフォルトは各ファイルの最初の2つのチェーン)。
+        interface_distance (float, optional): "interface" でインターフェイスとみなす原子間距離 (Å) (デフォルトは10.0Å)。
+        fit_receptor (bool, optional): Trueの場合、各ファイルを受容体のC-alpha原子で最初のファイルに重ね合わせた
+            座標を返します。リガンドの原子だけで重ね合わせるとリガンドの位置の違いが消えてしまうため、
+            "ligand-calpha" のRMSDを重ね合わせて計算する場合に使います (デフォルトはFalse)。
+
+    戻り値:
+        tuple: (形状 (ファイル数, 選択した原子数, 3) の座標, 最初のファイルのPDBAtoms, その選択のブール配列) の組。
+
+    例外:
+        ValueError: pdb_filesが空の場合、ファイル間で選択した原子数が異なる場合、または選択した原子がない場合。
+    """
+    pdb_files = natsorted(pdb_files)
+    if not pdb_files:
+        raise ValueError("複合体PDBファイルが指定されていません。")
+    interface_keys = interface_residue_keys(pdb_files[:1], chains, interface_distance) if selection == "interface" else None
+    coords, fit_coords = [], []
+    for pdb_file in pdb_files:
+        atoms = read_pdb_atoms(pdb_file)
+        mask = selection_mask(atoms, selection, chains, interface_keys)
+        if not coords:
+            reference, reference_mask = atoms, mask
+        coords.append(atoms.coords[mask])
+        if fit_receptor:
+            fit_coords.append(_receptor_ca(atoms, chains))
+    if len({len(c) for c in coords}) > 1 or len({len(c) for c in fit_coords}) > 1:
+        raise ValueError("複合体PDBファイル間で原子数が異なります。")
+    if not reference_mask.any():
+        raise ValueError(f"selection '{selection}' に該当する原子がありません。")
+    coords = np.array(coords)
+    if fit_receptor:
+        fit_coords = np.array(fit_coords)
+        rotations, translations = superposition_transforms(fit_coords, fit_coords[0])
+        coords = np.einsum("kma,kba->kmb", coords, rotations) + translations[:, None, :]
+    return coords, reference, reference_mask
+
+
+def pdb_rmsd_matrix(pdb_files, selection="calpha", chains=None, fit=False, processes=None, interface_distance=INTERFACE_DISTANCE,
+                    use_cache=False, cache_dir=None):
+    """
+    複合体PDBファイルの全ペアのRMSD行列 (nm) を計算します。
+    ファイルは`run_clustering`と同じく自然順に並べます。
+
+    引数:
+        pdb_files (list): 複合体PDBファイルのパスのリスト。
+        selection (str, optional): RMSDを計算する原子。selection_maskを参照してください (デフォルトは "calpha")。
+        chains (tuple, optional): 受容体とリガンドのチェーンID (デフォルトは各ファイルの最初の2つのチェーン)。
+        fit (bool, optional): Kabsch法で重ね合わせてからRMSDを計算するか (デフォルトはFalse)。
+            "ligand-calpha" では受容体のC-alpha原子で重ね合わせ、リガンドのC-alpha原子のRMSDを計算します。
+        processes (int, optional): 2以上の場合は、parallel_rmsd_matrixで複数プロセスに分けて計算します
+            (デフォルトは1プロセス)。
+        interface_distance (float, optional): "interface" でインターフェイスとみなす原子間距離 (Å) (デフォルトは10.0Å)。
+        use_cache (bool, optional): RMSD行列をrmsd_matrix_cacheと同じ圧縮形式でキャッシュするか (デフォルトはFalse)。
+            キーは選択した原子の座標とfitのハッシュなので、同じ構造であればカットオフを変えても再計算しません。
+        cache_dir (str, optional): キャッシュディレクトリ (デフォルトは $DOCK_REFINE_CACHE)。
+
+    戻り値:
+        np.ndarray: 形状 (ファイル数, ファイル数) のRMSD行列 (nm)。
+
+    例外:
+        ValueError: ファイル間で原子数が異なる場合。
+    """
+    fit_receptor = fit and selection == "ligand-calpha"
+    coords = select_pdb_coordinates(pdb_files, selection, chains, interface_distance, fit_receptor)[0]
+    # 受容体で重ね合わせた座標は、重ね合わせなしのRMSDを計算する
+    fit = fit and not fit_receptor
+    n = len(coords)
+    if use_cache and n > 1:
+        cache_file = _rmsd_cache_file((coords, np.array([float(fit)])), n, cache_dir)
+        if os.path.exists(cache_file):
+            condensed = np.memmap(cache_file, mode="r", dtype=np.float32, shape=(n * (n - 1) // 2,))
+            return squareform(np.asarray(condensed, dtype=float), checks=False)
+
+    if processes is not None and processes > 1:
+        rmsd = parallel_rmsd_matrix(coords, fit=fit, processes=processes) / 10.0
+    else:
+        rmsd = (fitted_rmsd_matrix(coords) if fit else pairwise_rmsd(coords)) / 10.0
+    np.fill_diagonal(rmsd, 0.0)
+    if use_cache and n > 1:
+        def fill(condensed):
+            condensed[:] = squareform(rmsd, checks=False)
+        _write_rmsd_cache(cache_file, n, fill)
+        # キャッシュから読み込んだ場合と同じ結果になるよう、float32に丸めた値を返す
+        rmsd = rmsd.astype(np.float32).astype(float)
+    return rmsd
+
+
+def pdb_cutoff_sweep(pdb_files, cutoffs, selection="calpha", chains=None, fit=False, processes=None, cache_dir=None):
+    """
+    複合体PDBファイルのRMSD行列をキャッシュから読み込み (なければ計算して保存し)、複数のカットオフで
+    GROMOS法のクラスタリングを行います。
+
+    引数:
+        pdb_files (list): 複合体PDBファイルのパスのリスト。
+        cutoffs (list): クラスタリングのカットオフ距離 (nm) のリスト。
+        selection (str, optional): RMSDを計算する原子。selection_maskを参照してください (デフォルトは "calpha")。
+        chains (tuple, optional): 受容体とリガンドのチェーンID (デフォルトは各ファイルの最初の2つのチェーン)。
+        fit (bool, optional): Kabsch法で重ね合わせてからRMSDを計算するか (デフォルトはFalse)。
+        processes (int, optional): RMSD行列を計算するプロセス数 (デフォルトは1プロセス)。
+        cache_dir (str, optional): キャッシュディレクトリ (デフォルトは $DOCK_REFINE_CACHE)。
+
+    戻り値:
+        dict: カットオフをキー、`parse_cluster_log`と同じ列を持つクラスタリング結果を値とする辞書。
+    """
+    rmsd = pdb_rmsd_matrix(pdb_files, selection, chains, fit, processes, use_cache=True, cache_dir=cache_dir)
+    return {cutoff: clusters_to_dataframe(rmsd, gromos_clustering(rmsd, cutoff)) for cutoff in cutoffs}
+
+
+def cluster_pdb_coordinates(pdb_files, cutoff_distance=0.45, selection="calpha", chains=None, fit=False, processes=None,
+                            use_cache=False, cache_dir=None):
+    """
+    複合体PDBファイルを、選択した原子 (既定ではC-alpha原子) のRMSDでGROMOS法によりクラスタリングします。
+    ファイルは`run_clustering`と同じく自然順に並べ、1始まりの番号をIDとします。
+
+    引数:
+        pdb_files (list): 複合体PDBファイルのパスのリスト。
+        cutoff_distance (float, optional): クラスタリングのカットオフ距離 (nm) (デフォルトは0.45)。
+        selection (str, optional): RMSDを計算する原子。selection_maskを参照してください (デフォルトは "calpha")。
+        chains (tuple, optional): 受容体とリガンドのチェーンID (デフォルトは各ファイルの最初の2つのチェーン)。
+        fit (bool, optional): Kabsch法で重ね合わせてからRMSDを計算するか (デフォルトはFalse)。
+            HADDOCKのモデルや別の実行のポーズなど、受容体座標系が共通でない構造にはTrueを指定してください。
+        processes (int, optional): 2以上の場合は、parallel_rmsd_matrixで複数プロセスに分けてRMSD行列を
+            計算します (デフォルトは1プロセス)。
+        use_cache (bool, optional): RMSD行列をキャッシュするか。pdb_rmsd_matrixを参照してください (デフォルトはFalse)。
+        cache_dir (str, optional): キャッシュディレクトリ (デフォルトは $DOCK_REFINE_CACHE)。
+
+    戻り値:
+        pd.DataFrame: `parse_cluster_log`と同じ列を持つクラスタリング結果。
+
+    例外:
+        ValueError: ファイル間で原子数が異なる場合。
+    """
+    rmsd = pdb_rmsd_matrix(pdb_files, selection, chains, fit, processes, use_cache=use_cache, cache_dir=cache_dir)
+    return clusters_to_dataframe(rmsd, gromos_clustering(rmsd, cutoff_distance))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ZDOCKのポーズをPython内でGROMOS法によりクラスタリングします。")
+    parser.add_argument("zdock_output", help="ZDOCKのアウトプットファイルのパス")
+    parser.add_argument("-n", "--num_preds", type=int, default=100, help="クラスタリングする上位のポーズ数 (デフォルト: 100)")
+    parser.add_argument("--cutoff", type=float, default=0.45, help="クラスタリングのカットオフ距離 (nm) (デフォルト: 0.45)")
+    parser.add_argument("--group", choices=["complex", "ligand"], default="complex", help="RMSDを計算する原子 (デフォルト: complex)")
+    parser.add_argument("--sweep", help="カンマ区切りの複数のカットオフ距離 (nm)。キャッシュしたRMSD行列でまとめてクラスタリングします (例: 0.2,0.3,0.45)")
+    parser.add_argument("--output", help="--sweep の全クラスタリング結果を書き出すCSVファイルのパス")
+    args = parser.parse_args()
+
+    result = ZDockResult(args.zdock_output)
+    indices = np.arange(min(args.num_preds, len(result)))
+    if args.sweep:
+        cutoffs = [float(token) for token in args.sweep.split(",") if token]
+        sweep = cluster_cutoff_sweep(result, cutoffs, indices, args.group)
+        print(summarize_cutoff_sweep(sweep).to_string(index=False))
+        if args.output:
+            frames = [df.assign(Cutoff=cutoff) for cutoff, df in sorted(sweep.items())]
+            pd.concat(frames, ignore_index=True).to_csv(args.output, index=False)
+        return
+    df = cluster_poses(result, indices, args.cutoff, args.group)
+    print(df)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+このスクリプトは、ZDOCKの予測ポーズのうち回転刻み1つ分程度しか違わない重複ポーズを、
+zdock.outのポーズパラメータだけから除去する機能を提供します。
+
+各ポーズをリガンド重心の位置 (受容体座標系) と向きを表す単位四元数の6自由度で表し、
+重心を許容誤差の大きさの格子セルにハッシュします。スコア順にポーズを調べ、近傍の27セルに
+登録済みの代表ポーズのうち重心距離と回転角がともに許容誤差内のものがあれば、そのポーズは
+代表ポーズに吸収されます。各代表ポーズが吸収したポーズ数 (自身を含む) を併せて返すため、
+クラスタリング後もクラスターの大きさを元のポーズ数で評価できます。
+
+使用方法:
+    ZDOCKを実行したディレクトリで、zdock.outを指定して実行します。
+
+例:
+    python pose_dedup.py zdock.out --translation-tolerance 2.0 --angle-tolerance 15.0
+
+依存関係:
+    - NumPy
+
+関数:
+    - rotation_matrices_to_quaternions: 回転行列を単位四元数に変換します。
+    - deduplicate_poses: 重複ポーズを除去し、代表ポーズと吸収したポーズ数を返します。
+"""
+import argparse
+import numpy as np
+from dockmodules.zdock_output import ZDockResult
+
+
+def rotation_matrices_to_quaternions(rot):
+    """
+    回転行列を単位四元数 (w, x, y, z) に変換します。qと-qは同じ回転を表すため、w >= 0 にそろえます。
+
+    引数:
+        rot (np.ndarray): 形状 (n, 3, 3) の回転行列。
+
+    戻り値:
+        np.ndarray: 形状 (n, 4) の単位四元数。
+    """
+    rot = np.asarray(rot, dtype=float)
+    m00, m11, m22 = rot[:, 0, 0], rot[:, 1, 1], rot[:, 2, 2]
+    # 数値的に安定な成分から求めるため、4通りの候補のうち対角成分が最大のものを使う
+    candidates = np.stack([
+        np.stack([1.0 + m00 + m11 + m22, rot[:, 2, 1] - rot[:, 1, 2], rot[:, 0, 2] - rot[:, 2, 0], rot[:, 1, 0] - rot[:, 0, 1]], axis=1),
+        np.stack([rot[:, 2, 1] - rot[:, 1, 2], 1.0 + m00 - m11 - m22, rot[:, 0, 1] + rot[:, 1, 0], rot[:, 0, 2] + rot[:, 2, 0]], axis=1),
+        np.stack([rot[:, 0, 2] - rot[:, 2, 0], rot[:, 0, 1] + rot[:, 1, 0], 1.0 - m00 + m11 - m22, rot[:, 1, 2] + rot[:, 2, 1]], axis=1),
+        np.stack([rot[:, 1, 0] - rot[:, 0, 1], rot[:, 0, 2] + rot[:, 2, 0], rot[:, 1, 2] + rot[:, 2, 1], 1.0 - m00 - m11 + m22], axis=1),
+    ], axis=1)
+    best = np.argmax(np.stack([1.0 + m00 + m11 + m22, 1.0 + m00 - m11 - m22, 1.0 - m00 + m11 - m22, 1.0 - m00 - m11 + m22], axis=1), axis=1)
+    quat = candidates[np.arange(len(rot)), best]
+    quat /= np.linalg.norm(quat, axis=1, keepdims=True)
+    return np.where(quat[:, :1] < 0, -quat, quat)
+
+
+def deduplicate_poses(zdock_result, order=None, translation_tolerance=2.0, angle_tolerance=15.0):
+    """
+    リガンド重心と向きがともに許容誤差内にあるポーズを重複とみなし、スコアの良いポーズだけを残します。
+
+    引数:
+        zdock_result (ZDockResult or str): ZDOCKの結果、またはzdock.outのパス。
+        order (array-like, optional): 調べるポーズのインデックス (0始まり) を優先順に並べたもの。
+            再スコアリングや制約による絞り込みの結果を渡せます (デフォルトはzdock.outの順)。
+        translation_tolerance (float, optional): リガンド重心の距離の許容誤差 (Å) (デフォルトは2.0Å)。
+        angle_tolerance (float, optional): リガンドの向きの差 (回転角) の許容誤差 (度) (デフォルトは15度)。
+
+    戻り値:
+        tuple: (代表ポーズのインデックス (0始まり、orderの順), 各代表ポーズが吸収したポーズ数 (自身を含む)) の組。
+    """
+    result = zdock_result if isinstance(zdock_result, ZDockResult) else ZDockResult(zdock_result)
+    order = np.arange(len(result)) if order is None else np.asarray(order, dtype=int)
+    rotations, translations = result.transforms(order)
+    centroids = rotations @ result.ligand.coords.mean(axis=0) + translations
+    quats = rotation_matrices_to_quaternions(rotations)
+    cells = np.floor(centroids / translation_tolerance).astype(np.int64)
+    # 回転角θの差は四元数の内積 |q1・q2| = cos(θ/2) で判定する
+    min_dot = np.cos(np.radians(angle_tolerance) / 2.0)
+    offsets = [(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)]
+
+    # セルごとに代表ポーズの番号 (survivors内の位置) を登録する
+    table = {}
+    survivors = []
+    counts = []
+    for position in range(len(order)):
+        cell = tuple(cells[position])
+        candidates = [s for offset in offsets
+                      for s in table.get((cell[0] + offset[0], cell[1] + offset[1], cell[2] + offset[2]), ())]
+        if candidates:
+            candidates = np.array(candidates)
+            positions = np.array(survivors)[candidates]
+            close = ((np.linalg.norm(centroids[positions] - centroids[position], axis=1) <= translation_tolerance)
+                     & (np.abs(quats[positions] @ quats[position]) >= min_dot))
+            if np.any(close):
+                # スコア順で最初に登録された代表ポーズに吸収させる
+                counts[int(np.min(candidates[close]))] += 1
+                continue
+        table.setdefault(cell, []).append(len(survivors))
+        survivors.append(position)
+        counts.append(1)
+
+    return order[np.array(survivors, dtype=int)], np.array(counts, dtype=int)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ZDOCKの予測ポーズから重複ポーズを除去します。")
+    parser.add_argument("zdock_output", help="ZDOCKのアウトプットファイルのパス")
+    parser.add_argument("--translation-tolerance", type=float, default=2.0, help="リガンド重心の距離の許容誤差 (Å) (デフォルト: 2.0)")
+    parser.add_argument("--angle-tolerance", type=float, default=15.0, help="リガンドの向きの差の許容誤差 (度) (デフォルト: 15.0)")
+    args = parser.parse_args()
+
+    survivors, counts = deduplicate_poses(args.zdock_output, translation_tolerance=args.translation_tolerance,
+                                          angle_tolerance=args.angle_tolerance)
+    print(f"代表ポーズ: {len(survivors)} / {counts.sum()}")
+    for pose, count in zip(survivors + 1, counts):
+        print(f"{pose}\t{count}")
+
+
+if __name__ == "__main__":
+    main()
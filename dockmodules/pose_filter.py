@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+このスクリプトは、実験などで既知のインターフェイス残基を制約として、ZDOCKの予測ポーズを
+クラスタリングの前にまとめてふるい分ける機能を提供します。
+
+受容体とリガンドのKD木をそれぞれの元の座標で一度だけ構築し、全ポーズについて
+- 指定したリガンド残基の原子を受容体座標系に移して受容体のKD木に問い合わせ、
+- 指定した受容体残基の原子を各ポーズのリガンド座標系に逆変換してリガンドのKD木に問い合わせる
+ことで、ポーズごとに座標ファイルを書き出すことなく一括して判定します。
+原子レベルの問い合わせの前に、制約残基の外接球 (contact_search) の中心だけを移して相手のKD木に問い合わせ、
+球が相手の原子からdistanceより離れている残基を除外します。除外だけで制約を満たさないと分かる
+ポーズは、原子レベルの問い合わせを行いません。
+
+使用方法:
+    ZDOCKを実行したディレクトリで、zdock.outと制約残基を指定して実行します。
+
+例:
+    python pose_filter.py zdock.out --receptor A:45,46,52A --ligand B:12,13 --distance 8.0
+
+依存関係:
+    - NumPy
+    - SciPy
+
+関数:
+    - parse_residue_list: "A:45,46,52A" 形式の残基リストを解析します。
+    - satisfies_restraints: 各ポーズが制約を満たすかどうかを一括判定します。
+"""
+import argparse
+import numpy as np
+from scipy.spatial import cKDTree
+from dockmodules.zdock_output import ZDockResult
+from dockmodules.contact_search import SPHERE_TOLERANCE, residue_spheres
+
+
+def parse_residue_list(text):
+    """
+    "A:45,46,52A" 形式の残基リストを解析します。
+    mark_surface.parse_blocked_residuesと同じく "チェーン:残基番号" でチェーンを指定し、指定したチェーンは
+    以降の残基番号に適用されます ("A:45,46,B:12")。残基番号の末尾の英字は挿入コードとして扱い、
+    "50-55" のような範囲も指定できます。チェーンを省略した残基番号は、その番号を持つ唯一のチェーンに対応します。
+
+    引数:
+        text (str): カンマ区切りの残基。空文字列やNoneの場合は空リストを返します。
+
+    戻り値:
+        list: (チェーンID (省略時はNone), 残基番号 (int), 挿入コード) のタプルのリスト。
+
+    例外:
+        ValueError: 指定の形式が正しくない場合。
+    """
+    residues = []
+    chain = None
+    for token in (text or "").replace(" ", "").split(","):
+        if ":" in token:
+            chain, _, token = token.partition(":")
+            if len(chain) != 1:
+                raise ValueError(f"制約残基のチェーンは 'チェーン:残基番号' の形式で指定してください: {text}")
+        if not token:
+            continue
+        try:
+            # 負の残基番号も扱えるよう、先頭以外の "-" で範囲を区切る
+            split = token.find("-", 1)
+            if split > 0:
+                residues.extend((chain, resseq, "") for resseq in range(int(token[:split]), int(token[split + 1:]) + 1))
+            elif token[-1].isalpha():
+                residues.append((chain, int(token[:-1]), token[-1]))
+            else:
+                residues.append((chain, int(token), ""))
+        except ValueError:
+            raise ValueError(f"制約残基の指定が正しくありません: {token}") from None
+    return residues
+
+
+def _residue_hits(query_points, tree, distance):
+    # query_points: (ポーズ数, 原子数, 3)、各原子が distance 以内に相手の原子を持つか
+    # distance_upper_boundは上限を含まないため、distanceちょうどの原子も拾えるよう1ulp広げる
+    bound = np.nextafter(distance, np.inf)
+    dist, _ = tree.query(query_points.reshape(-1, 3), distance_upper_bound=bound)
+    return (dist <= distance).reshape(query_points.shape[:2])
+
+
+def _sphere_hits(centers, radii, tree, distance):
+    # centers: (ポーズ数, 残基数, 3)、外接球が相手の原子からdistance以内に届き得るか
+    reach = distance + radii + SPHERE_TOLERANCE
+    dist, _ = tree.query(centers.reshape(-1, 3), distance_upper_bound=reach.max())
+    return dist.reshape(centers.shape[:2]) <= reach[None, :]
+
+
+def _group_spheres(atoms, groups):
+    # 制約残基ごとの外接球 (中心と半径)
+    owners = np.repeat(np.arange(len(groups)), [len(group) for group in groups])
+    return residue_spheres(atoms.coords[np.concatenate(groups)], owners, len(groups))
+
+
+def satisfies_restraints(zdock_result, receptor_residues=None, ligand_residues=None, distance=8.0, require="all",
+                         chunk_size=5000):
+    """
+    各ポーズが制約 (指定した残基が相手分子の原子からdistance以内にあること) を満たすかどうかを一括判定します。
+
+    引数:
+        zdock_result (ZDockResult or str): ZDOCKの結果、またはzdock.outのパス。
+        receptor_residues (list, optional): インターフェイスにあるべき受容体の残基。parse_residue_listの
+            (チェーンID, 残基番号, 挿入コード) のタプル、または残基番号 (int) のリスト。
+        ligand_residues (list, optional): インターフェイスにあるべきリガンドの残基。
+        distance (float, optional): インターフェイスとみなす原子間距離 (Å) (デフォルトは8.0Å)。
+        require (str, optional): "all" の場合は指定した全残基、"any" の場合は受容体・リガンドそれぞれで
+            少なくとも1残基が条件を満たすことを要求します (デフォルトは "all")。
+        chunk_size (int, optional): 一度に判定するポーズ数 (デフォルトは5000)。
+
+    戻り値:
+        np.ndarray: 形状 (ポーズ数,) のブール配列。制約を満たすポーズがTrue。
+
+    例外:
+        ValueError: requireが "all" または "any" でない場合、指定した残基が構造に存在しない場合、
+            またはチェーンを省略した残基番号が複数のチェーンに存在する場合。
+    """
+    if require not in ("all", "any"):
+        raise ValueError(f"requireは 'all' または 'any' を指定してください: {require}")
+    result = zdock_result if isinstance(zdock_result, ZDockResult) else ZDockResult(zdock_result)
+    receptor, ligand = result.receptor, result.ligand
+    reduce = np.all if require == "all" else np.any
+
+    def residue_atoms(atoms, residues, label):
+        # 残基ごとに (チェーン, 残基番号, 挿入コード) が一致する原子のインデックスをまとめる
+        groups, missing = [], []
+        for residue in residues:
+            chain, resseq, icode = residue if isinstance(residue, tuple) else (None, residue, "")
+            mask = (atoms.resseqs == resseq) & (atoms.icodes == icode)
+            if chain is not None:
+                mask &= atoms.chains == chain
+            elif len(np.unique(atoms.chains[mask])) > 1:
+                raise ValueError(f"{label}の残基 {resseq}{icode} は複数のチェーンにあります。"
+                                 f"'チェーン:残基番号' の形式で指定してください。")
+            groups.append(np.flatnonzero(mask))
+            if len(groups[-1]) == 0:
+                missing.append(f"{chain}:{resseq}{icode}" if chain is not None else f"{resseq}{icode}")
+        if missing:
+            raise ValueError(f"{label}に残基 {missing} が見つかりません。")
+        return groups
+
+    receptor_groups = residue_atoms(receptor, receptor_residues or [], "受容体")
+    ligand_groups = residue_atoms(ligand, ligand_residues or [], "リガンド")
+    receptor_tree = cKDTree(receptor.coords) if ligand_groups else None
+    ligand_tree = cKDTree(ligand.coords) if receptor_groups else None
+    ligand_spheres = _group_spheres(ligand, ligand_groups) if ligand_groups else None
+    receptor_spheres = _group_spheres(receptor, receptor_groups) if receptor_groups else None
+
+    satisfied = np.ones(len(result), dtype=bool)
+    for start in range(0, len(result), chunk_size):
+        stop = min(start + chunk_size, len(result))
+        rotations, translations = result.transforms(slice(start, stop))
+        chunk = np.ones(stop - start, dtype=bool)
+
+        if ligand_groups:
+            # 制約残基の外接球の中心を受容体座標系に移し、届き得ないポーズを除外する
+            centers, radii = ligand_spheres
+            centers = np.einsum("pij,mj->pmi", rotations, centers) + translations[:, None, :]
+            chunk &= reduce(_sphere_hits(centers, radii, receptor_tree, distance), axis=1)
+            # 残ったポーズについて、制約残基の原子だけを受容体座標系に移し、受容体のKD木に問い合わせる
+            poses = np.flatnonzero(chunk)
+            atom_index = np.concatenate(ligand_groups)
+            coords = np.einsum("pij,mj->pmi", rotations[poses], ligand.coords[atom_index]) + translations[poses, None, :]
+            hits = _residue_hits(coords, receptor_tree, distance)
+            bounds = np.cumsum([0] + [len(group) for group in ligand_groups])[:-1]
+            chunk[poses] &= reduce(np.logical_or.reduceat(hits, bounds, axis=1), axis=1)
+
+        if receptor_groups:
+            # 制約残基の外接球の中心を各ポーズのリガンド座標系に逆変換し、届き得ないポーズを除外する
+            centers, radii = receptor_spheres
+            centers = np.einsum("pji,pmj->pmi", rotations, centers[None, :, :] - translations[:, None, :])
+            chunk &= reduce(_sphere_hits(centers, radii, ligand_tree, distance), axis=1)
+            # 残ったポーズについて、制約残基の原子を逆変換し、リガンドのKD木に問い合わせる
+            poses = np.flatnonzero(chunk)
+            atom_index = np.concatenate(receptor_groups)
+            coords = np.einsum("pji,pmj->pmi", rotations[poses],
+                               receptor.coords[atom_index][None, :, :] - translations[poses, None, :])
+            hits = _residue_hits(coords, ligand_tree, distance)
+            bounds = np.cumsum([0] + [len(group) for group in receptor_groups])[:-1]
+            chunk[poses] &= reduce(np.logical_or.reduceat(hits, bounds, axis=1), axis=1)
+
+        satisfied[start:stop] = chunk
+
+    return satisfied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="既知のインターフェイス残基を満たすZDOCKの予測ポーズを抽出します。")
+    parser.add_argument("zdock_output", help="ZDOCKのアウトプットファイルのパス")
+    parser.add_argument("--receptor", help="インターフェイスにあるべき受容体の残基 (例: A:45,46,52A)")
+    parser.add_argument("--ligand", help="インターフェイスにあるべきリガンドの残基 (例: B:12,13)")
+    parser.add_argument("--distance", type=float, default=8.0, help="インターフェイスとみなす原子間距離 (Å) (デフォルト: 8.0)")
+    parser.add_argument("--require", choices=["all", "any"], default="all", help="全残基または1残基以上を要求します (デフォルト: all)")
+    args = parser.parse_args()
+
+    satisfied = satisfies_restraints(args.zdock_output, parse_residue_list(args.receptor),
+                                     parse_residue_list(args.ligand), args.distance, args.require)
+    poses = np.flatnonzero(satisfied) + 1
+    print(f"制約を満たすポーズ: {len(poses)} / {len(satisfied)}")
+    print(", ".join(str(pose) for pose in poses))
+
+
+if __name__ == "__main__":
+    main()
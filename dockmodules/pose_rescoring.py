@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+このスクリプトは、受容体のポテンシャルグリッドを用いてZDOCKの全予測ポーズを高速に再スコアリングする
+機能を提供します。受容体の静電ポテンシャル・脱溶媒和・接触・衝突のグリッドを一度だけ計算し
+(原子密度とカーネルのFFT畳み込み)、受容体PDBの内容のハッシュをキーとしてディスクに保存します。
+各ポーズのリガンド原子での値は三線形補間で一括して求めるため、2000ポーズ程度であれば数秒で
+全ポーズを評価できます。再スコアリングした順位は、複合体PDBとして書き出すポーズの選択に使用できます。
+
+エネルギー項:
+    - Elec: 距離依存誘電率 (ε = 4r) のクーロン相互作用 (kcal/mol)。
+    - Desolv: 原子ごとの脱溶媒和パラメータと近接原子数による脱溶媒和エネルギー。
+    - Contact: 4.5Å以内の受容体-リガンド原子ペア数。
+    - Clash: 3.0Å以内の受容体-リガンド原子ペア数。
+    Score = Elec + Desolv - contact_weight * Contact + clash_weight * Clash (値が小さいほど良い)
+
+使用方法:
+    ZDOCKを実行したディレクトリで、zdock.outを指定して実行します。
+
+例:
+    python pose_rescoring.py zdock.out --output rescore.csv
+
+環境変数:
+    DOCK_REFINE_CACHE: グリッドのキャッシュを保存するディレクトリ (デフォルト: ~/.cache/dock-refine)。
+
+依存関係:
+    - NumPy
+    - SciPy
+    - pandas
+
+クラス:
+    - ReceptorGrids: 受容体のポテンシャルグリッドを保持し、任意の座標での値を補間します。
+
+関数:
+    - atom_charges: 原子の部分電荷を割り当てます。
+    - atom_desolvation: 原子の脱溶媒和パラメータを割り当てます。
+    - rescore_poses: 全ポーズを再スコアリングし、スコア順のDataFrameを返します。
+"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.ndimage import map_coordinates
+from scipy.signal import fftconvolve
+from dockmodules.mark_surface import CACHE_DIR, content_hash
+from dockmodules.zdock_output import ZDockResult, read_pdb_atoms
+
+# uniCHARMMを使用しない場合の形式電荷
+FORMAL_CHARGES = {
+    ("ARG", "NH1"): 0.5, ("ARG", "NH2"): 0.5, ("LYS", "NZ"): 1.0,
+    ("ASP", "OD1"): -0.5, ("ASP", "OD2"): -0.5, ("GLU", "OE1"): -0.5, ("GLU", "OE2"): -0.5,
+}
+
+# 元素ごとの脱溶媒和パラメータ (負の値は埋没すると有利)
+DESOLVATION_PARAMETERS = {"C": -0.03, "S": -0.03, "N": 0.02, "O": 0.02}
+
+GRID_NAMES = ("elec", "burial", "desolv", "contact", "clash")
+
+
+def atom_charges(atoms):
+    """
+    原子の部分電荷として、荷電残基の形式電荷を割り当てます。
+
+    引数:
+        atoms (PDBAtoms): 原子情報。
+
+    戻り値:
+        np.ndarray: 形状 (原子数,) の電荷。
+    """
+    return np.array([FORMAL_CHARGES.get((res, name), 0.0) for res, name in zip(atoms.resnames, atoms.names)], dtype=float)
+
+
+def atom_desolvation(atoms):
+    """
+    原子名の先頭文字 (元素) から脱溶媒和パラメータを割り当てます。
+
+    引数:
+        atoms (PDBAtoms): 原子情報。
+
+    戻り値:
+        np.ndarray: 形状 (原子数,) の脱溶媒和パラメータ。
+    """
+    return np.array([DESOLVATION_PARAMETERS.get(name.lstrip("0123456789")[:1], 0.0) for name in atoms.names], dtype=float)
+
+
+def _radial_kernel(func, cutoff, spacing):
+    # 半径cutoffまでの等方的なカーネル (中心が配列の中央に来るよう奇数サイズ)
+    reach = int(np.ceil(cutoff / spacing))
+    axis = np.arange(-reach, reach + 1) * spacing
+    r = np.sqrt(axis[:, None, None] ** 2 + axis[None, :, None] ** 2 + axis[None, None, :] ** 2)
+    return np.where(r <= cutoff, func(r), 0.0)
+
+
+def _switch(r, inner=4.5, outer=6.0):
+    # inner以内で1、outerで0になる線形スイッチ関数
+    return np.clip((outer - r) / (outer - inner), 0.0, 1.0)
+
+
+class ReceptorGrids:
+    """
+    ReceptorGridsクラス
+    受容体のポテンシャルグリッド (elec, burial, desolv, contact, clash) を保持し、
+    任意の座標での値を三線形補間で一括して求めます。
+
+    使用例:
+        grids = ReceptorGrids.load_or_build("receptor_m.pdb")
+        values = grids.interpolate("elec", coords)
+
+    属性:
+        grids (dict): グリッド名をキーとする3次元配列。
+        origin (np.ndarray): グリッド点 (0, 0, 0) の座標。
+        spacing (float): グリッド間隔 (Å)。
+    """
+    def __init__(self, grids, origin, spacing):
+        self.grids = grids
+        self.origin = np.asarray(origin, dtype=float)
+        self.spacing = float(spacing)
+
+    @classmethod
+    def build(cls, receptor_pdb, spacing=0.8, margin=8.0, elec_cutoff=12.0):
+        """
+        受容体の原子密度とカーネルのFFT畳み込みでポテンシャルグリッドを計算します。
+
+        引数:
+            receptor_pdb (str): 受容体PDBファイルのパス。
+            spacing (float, optional): グリッド間隔 (Å) (デフォルトは0.8Å)。
+            margin (float, optional): 受容体の外側に確保する余白 (Å) (デフォルトは8.0Å)。
+            elec_cutoff (float, optional): 静電相互作用のカットオフ (Å) (デフォルトは12.0Å)。
+
+        戻り値:
+            ReceptorGrids: 計算したグリッド。
+        """
+        atoms = read_pdb_atoms(receptor_pdb)
+        origin = atoms.coords.min(axis=0) - margin
+        shape = tuple(np.ceil((atoms.coords.max(axis=0) + margin - origin) / spacing).astype(int) + 1)
+
+        # 原子を最も近いグリッド点に割り当てた密度
+        cells = np.rint((atoms.coords - origin) / spacing).astype(int)
+
+        def density(weights):
+            rho = np.zeros(shape)
+            np.add.at(rho, (cells[:, 0], cells[:, 1], cells[:, 2]), weights)
+            return rho
+
+        ones = np.ones(len(cells))
+        kernels = {
+            "elec": (atom_charges(atoms),
+                     _radial_kernel(lambda r: 332.0 / (4.0 * np.maximum(r, 2.0) ** 2), elec_cutoff, spacing)),
+            "burial": (ones, _radial_kernel(_switch, 6.0, spacing)),
+            "desolv": (atom_desolvation(atoms), _radial_kernel(_switch, 6.0, spacing)),
+            "contact": (ones, _radial_kernel(lambda r: np.ones_like(r), 4.5, spacing)),
+            "clash": (ones, _radial_kernel(lambda r: np.ones_like(r), 3.0, spacing)),
+        }
+        grids = {name: fftconvolve(density(weights), kernel, mode="same").astype(np.float32)
+                 for name, (weights, kernel) in kernels.items()}
+        return cls(grids, origin, spacing)
+
+    @classmethod
+    def load_or_build(cls, receptor_pdb, cache_dir=None, spacing=0.8, margin=8.0, elec_cutoff=12.0):
+        """
+        受容体PDBの内容のハッシュとパラメータをキーに、キャッシュがあれば読み込み、
+        なければ計算してキャッシュに保存します。
+
+        引数:
+            receptor_pdb (str): 受容体PDBファイルのパス。
+            cache_dir (str, optional): キャッシュディレクトリ (デフォルトは $DOCK_REFINE_CACHE)。
+            spacing, margin, elec_cutoff: buildと同じ。
+
+        戻り値:
+            ReceptorGrids: 読み込んだ、または計算したグリッド。
+        """
+        cache_dir = os.path.join(cache_dir or CACHE_DIR, "potential_grids")
+        os.makedirs(cache_dir, exist_ok=True)
+        key = f"{content_hash(receptor_pdb)}_{spacing}_{margin}_{elec_cutoff}"
+        cache_file = os.path.join(cache_dir, f"{key}.npz")
+
+        if os.path.exists(cache_file):
+            with np.load(cache_file) as data:
+                return cls({name: data[name] for name in GRID_NAMES}, data["origin"], float(data["spacing"]))
+
+        grids = cls.build(receptor_pdb, spacing, margin, elec_cutoff)
+        # 書き込み途中のファイルが他のプロセスから読まれないよう、一時ファイル経由で保存する
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_file, origin=grids.origin, spacing=grids.spacing, **grids.grids)
+        os.replace(tmp_file, cache_file)
+        return grids
+
+    def interpolate(self, name, coords):
+        """
+        指定したグリッドの値を三線形補間で求めます。グリッドの外側は0とします。
+
+        引数:
+            name (str): グリッド名 ("elec", "burial", "desolv", "contact", "clash")。
+            coords (np.ndarray): 形状 (..., 3) の座標。
+
+        戻り値:
+            np.ndarray: 形状 (...) の補間値。
+        """
+        coords = np.asarray(coords, dtype=float)
+        index = ((coords.reshape(-1, 3) - self.origin) / self.spacing).T
+        values = map_coordinates(self.grids[name], index, order=1, mode="constant", cval=0.0)
+        return values.reshape(coords.shape[:-1])
+
+
+def rescore_poses(zdock_result, grids=None, contact_weight=0.1, clash_weight=1.0,
+                  chunk_size=200, cache_dir=None):
+    """
+    ZDOCKの全予測ポーズを受容体のポテンシャルグリッドで再スコアリングします。
+
+    引数:
+        zdock_result (ZDockResult or str): ZDOCKの結果、またはzdock.outのパス。
+        grids (ReceptorGrids, optional): 使用するグリッド。指定されない場合はキャッシュから読み込むか計算します。
+        contact_weight (float, optional): 接触数の重み (デフォルトは0.1)。
+        clash_weight (float, optional): 衝突数の重み (デフォルトは1.0)。
+        chunk_size (int, optional): 一度に座標を計算するポーズ数 (デフォルトは200)。
+        cache_dir (str, optional): グリッドのキャッシュディレクトリ (デフォルトは $DOCK_REFINE_CACHE)。
+
+    戻り値:
+        pd.DataFrame: Scoreの小さい順に並んだDataFrame。以下の列を含みます:
+        - "Pose": zdock.out内のポーズ番号 (1始まり)
+        - "ZDOCK Score": ZDOCKのスコア
+        - "Elec", "Desolv", "Contact", "Clash": 各エネルギー項
+        - "Score": 再スコアリングの総合スコア (小さいほど良い)
+    """
+    result = zdock_result if isinstance(zdock_result, ZDockResult) else ZDockResult(zdock_result)
+    if grids is None:
+        grids = ReceptorGrids.load_or_build(result.resolve_path(result.header["receptor"]), cache_dir=cache_dir)
+
+    charges = atom_charges(result.ligand)
+    desolvation = atom_desolvation(result.ligand)
+
+    terms = {name: np.empty(len(result)) for name in ("Elec", "Desolv", "Contact", "Clash")}
+    for start in range(0, len(result), chunk_size):
+        stop = min(start + chunk_size, len(result))
+        coords = result.ligand_coords(slice(start, stop))
+        terms["Elec"][start:stop] = grids.interpolate("elec", coords) @ charges
+        # 脱溶媒和は受容体側 (desolvグリッド) とリガンド側 (パラメータ x 埋没度) の和
+        terms["Desolv"][start:stop] = (grids.interpolate("burial", coords) @ desolvation
+                                       + grids.interpolate("desolv", coords).sum(axis=1))
+        terms["Contact"][start:stop] = grids.interpolate("contact", coords).sum(axis=1)
+        terms["Clash"][start:stop] = grids.interpolate("clash", coords).sum(axis=1)
+
+    df = pd.DataFrame({"Pose": np.arange(1, len(result) + 1), "ZDOCK Score": result.scores, **terms})
+    df["Score"] = df["Elec"] + df["Desolv"] - contact_weight * df["Contact"] + clash_weight * df["Clash"]
+    return df.sort_values("Score", kind="stable").reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="受容体のポテンシャルグリッドでZDOCKの予測ポーズを再スコアリングします。")
+    parser.add_argument("zdock_output", help="ZDOCKのアウトプットファイルのパス")
+    parser.add_argument("--output", default="rescore.csv", help="出力CSVファイルのパス (デフォルト: rescore.csv)")
+    args = parser.parse_args()
+
+    df = rescore_poses(args.zdock_output)
+    df.to_csv(args.output, index=False)
+    print(df.head(20))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 """
 このスクリプトは、GROMACS分子動力学パッケージの`gmx cluster`コマンドを使用して
-PDBファイルのクラスタリングを行う機能を提供します。複数のPDBファイルを1つのファイルに
-結合し、クラスタリングプロセスを実行し、結果のログファイルをpandas DataFrameに解析して
+PDBファイルのクラスタリングを行う機能を提供します。複数のPDBファイルのC-alpha原子を1つの
+バイナリ軌跡ファイル (TRR) に結合し、クラスタリングプロセスを実行し、結果のログファイルをpandas DataFrameに解析して
 分析します。
 
 モジュール:
@@ -11,12 +11,16 @@ PDBファイルのクラスタリングを行う機能を提供します。複
     - io.StringIO: メモリ内テキストストリームの処理用。
     - pandas: データ操作と分析用。
     - natsort: ファイル名の自然順ソート用。
-    - re: 正規表現操作用。
+    - struct: TRRファイルのバイナリ書き出し用。
 
 関数:
-    - run_clustering: PDBファイルを結合し、`gmx cluster`コマンドを実行してログファイルを生成します。
+    - write_xpm_matrix: RMSD行列を`gmx cluster -dm`で読み込めるXPMファイルに書き出します。
+    - write_trr: 座標をGROMACSのTRR形式の軌跡ファイルに書き出します。
+    - write_index_file: RMSDを計算する原子のグループと全原子のグループからなるインデックスファイルを書き出します。
+    - run_clustering: PDBファイルの選択した原子をTRRファイルに結合し (またはRMSD行列をXPMファイルにし)、`gmx cluster`コマンドを実行してログファイルを生成します。
     - parse_cluster_log: クラスターログファイルを解析し、クラスタ情報を含むpandas DataFrameを返します。
-    - cluster_pdb_files: クラスタリングとログ解析を組み合わせた高レベル関数。
+    - cluster_pdb_files: クラスタリングとログ解析を組み合わせた高レベル関数 (gmxを使わないPython内のエンジンも選べます)。
+    - top_clusters_converged: ポーズ数を増やす前後で上位クラスターが安定しているかを判定します。
     - main: スクリプトのエントリーポイントで、コマンドライン引数を処理し、クラスタリングプロセスを実行します。
 
 使用方法:
@@ -39,13 +43,130 @@ import subprocess
 import pandas as pd
 from natsort import natsorted
 import numpy as np
-import re
+import struct
+from dockmodules.cluster_result import ClusterResult
+from dockmodules.pose_clustering import SELECTIONS, cluster_pdb_coordinates, pdb_rmsd_matrix, receptor_fitted_coords, \
+    select_pdb_coordinates
+from dockmodules.zdock_output import format_pdb_atoms, read_pdb_atoms
 
 GROMACS = os.environ.get("GROMACS")
 
-def run_clustering(pdb_files, gmx_options, cutoff_distance=0.45, output_prefix="cluster"):
+# GROMACSのXPMで1画素の色を表す文字 (gmx_fatalにならないよう1画素は2文字まで)
+XPM_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789!@#$%^&*()-_=+{}|;:',<.>/?"
+
+def write_xpm_matrix(matrix, xpm_file, cutoff_distance=None, levels=256):
+    """
+    RMSD行列を`gmx cluster -dm`で読み込めるGROMACS形式のXPMファイルに書き出します。
+
+    XPMは値を色のレベルに量子化して保持します。cutoff_distanceを指定すると、カットオフが
+    隣り合う2つのレベルのちょうど中間になるように刻み幅を選ぶため、量子化してもカットオフ未満か
+    どうかは変わらず、gromos法やlinkage法のクラスタリング結果は元の行列と一致します。
+    x軸とy軸には1始まりの構造番号を書き出すため、`-f`なしで実行したgmx clusterのログのメンバーIDは
+    結合PDBファイルのt=と同じになります。
+
+    引数:
+        matrix (np.ndarray): 形状 (n, n) の対称なRMSD行列 (nm)。
+        xpm_file (str): 出力するXPMファイルのパス。
+        cutoff_distance (float, optional): クラスタリングのカットオフ距離 (nm)。
+        levels (int, optional): 色のレベル数の上限 (デフォルトは256、最大は92 * 92)。
+            gmx clusterは画素ごとに色の表を線形探索するため、大きすぎると読み込みが遅くなります。
+
+    戻り値:
+        str: XPMファイルのパス。
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    n = len(matrix)
+    max_value = max(float(matrix.max()) if n else 0.0, 1e-6)
+    levels = min(levels, len(XPM_CHARS) ** 2)
+    if cutoff_distance:
+        # カットオフ = (k + 0.5) * step となるkのうち、最大値が全レベルに収まる最小の刻み幅を選ぶ
+        k = int(np.floor((levels - 1) * cutoff_distance / max_value - 0.5))
+        k = min(max(k, 0), levels - 2)
+        step = cutoff_distance / (k + 0.5)
+        levels = max(int(np.ceil(max_value / step)) + 1, k + 2)
+    else:
+        step = max_value / (levels - 1)
+    num_chars = 1 if levels <= len(XPM_CHARS) else 2
+    codes = [XPM_CHARS[i] for i in range(levels)] if num_chars == 1 else \
+        [XPM_CHARS[i // len(XPM_CHARS)] + XPM_CHARS[i % len(XPM_CHARS)] for i in range(levels)]
+    index = np.minimum(np.floor(matrix / step + 0.5).astype(int), levels - 1)
+    axis = [str(i) for i in range(1, n + 1)]
+
+    with open(xpm_file, "w") as f:
+        f.write("/* XPM */\n")
+        f.write("/* This file can be converted to EPS by the GROMACS program xpm2ps */\n")
+        f.write('/* title:   "RMS Deviation" */\n')
+        f.write('/* legend:  "RMSD (nm)" */\n')
+        f.write('/* x-label: "Time (ps)" */\n')
+        f.write('/* y-label: "Time (ps)" */\n')
+        f.write('/* type:    "Continuous" */\n')
+        f.write("static char *gromacs_xpm[] = {\n")
+        f.write(f'"{n} {n}   {levels} {num_chars}",\n')
+        for level, code in enumerate(codes):
+            gray = 255 - int(round(255 * level / max(levels - 1, 1)))
+            f.write(f'"{code:<{num_chars}} c #{gray:02X}{gray:02X}{gray:02X} " /* "{level * step:.6g}" */,\n')
+        for label in ("x-axis", "y-axis"):
+            for start in range(0, n, 80):
+                f.write(f"/* {label}:  {' '.join(axis[start:start + 80])} */\n")
+        # GROMACSのXPMはy軸の大きい行から順に並べる
+        rows = ['"' + "".join(codes[i] for i in index[row]) + '"' for row in range(n - 1, -1, -1)]
+        f.write(",\n".join(rows) + "\n};\n")
+    return xpm_file
+
+
+def write_trr(trr_file, coords, times):
+    """
+    座標をGROMACSのTRR形式 (単精度、座標のみ) の軌跡ファイルに書き出します。
+
+    引数:
+        trr_file (str): 出力するTRRファイルのパス。
+        coords (np.ndarray): 形状 (フレーム数, 原子数, 3) の座標 (Å)。
+        times (array_like): 各フレームの時刻。gmx clusterのログにはこの値が構造のIDとして出力されます。
+
+    戻り値:
+        str: TRRファイルのパス。
+    """
+    coords = np.asarray(coords, dtype=float)
+    num_atoms = coords.shape[1]
+    # TRRはXDR (ビッグエンディアン) で、座標はnm単位
+    frames = (coords / 10.0).astype(">f4")
+    version = b"GMX_trn_file"
+    with open(trr_file, "wb") as f:
+        for step, (time, frame) in enumerate(zip(times, frames)):
+            f.write(struct.pack(">iii", 1993, len(version) + 1, len(version)) + version)
+            # ir, e, box, vir, pres, top, sym, x, v, f の各サイズ、原子数、ステップ、nre、時刻、lambda
+            f.write(struct.pack(">13i2f", 0, 0, 0, 0, 0, 0, 0, num_atoms * 3 * 4, 0, 0, num_atoms, step, 0, time, 0.0))
+            f.write(frame.tobytes())
+    return trr_file
+
+
+def write_index_file(ndx_file, groups):
+    """
+    GROMACSのインデックスファイル (.ndx) を書き出します。グループは指定した順に0, 1, ... と番号が付きます。
+
+    引数:
+        ndx_file (str): 出力するインデックスファイルのパス。
+        groups (dict): グループ名をキー、グループの原子番号 (1始まり) を値とする辞書。
+
+    戻り値:
+        str: インデックスファイルのパス。
+    """
+    with open(ndx_file, "w") as f:
+        for group_name, atom_numbers in groups.items():
+            atom_numbers = [str(number) for number in atom_numbers]
+            f.write(f"[ {group_name} ]\n")
+            # GROMACSと同じく1行に15個ずつ並べる
+            for start in range(0, len(atom_numbers), 15):
+                f.write(" ".join(f"{number:>4}" for number in atom_numbers[start:start + 15]) + "\n")
+    return ndx_file
+
+def run_clustering(pdb_files, gmx_options, cutoff_distance=0.45, output_prefix="cluster", distance_matrix=False, processes=None,
+                   trajectory="trr", selection="calpha", chains=None, use_cache=False):
     """
-    複数のPDBファイルに対してgmx clusterコマンドを実行し、結合されたPDBファイルを生成します。
+    複数のPDBファイルに対してgmx clusterコマンドを実行し、結合された軌跡ファイルを生成します。
+
+    RMSDを計算する原子はselectionで選び、その原子からなるグループ (0) と軌跡の全原子のグループ
+    "System" (1) のインデックスファイル (`{output_prefix}.ndx`) を自動生成して`-n`でgmx clusterに渡します。
 
     引数:
         pdb_files (list): PDBファイルのパスのリスト
@@ -56,26 +177,88 @@ def run_clustering(pdb_files, gmx_options, cutoff_distance=0.45, output_prefix="
                                  例: 0.45
         output_prefix (str): 出力ファイルの接頭辞
                              例: "cluster"
+        distance_matrix (bool): Trueなら選択した原子のRMSD行列をPython内で計算してXPMファイルに書き出し、
+                                `gmx cluster -dm`に渡します。gmx clusterは軌跡の読み込みと重ね合わせを
+                                行わずクラスタリングのみを実行します。`-nofit`がgmx_optionsにあれば
+                                重ね合わせなしのRMSDを使います。軌跡を必要とする`-cl`などのオプションは
+                                使用できません (デフォルトはFalse)。
+        processes (int): distance_matrixがTrueのとき、RMSD行列を計算するプロセス数 (デフォルトは1プロセス)。
+        trajectory (str): "trr" は重ね合わせとRMSDに使う原子だけをバイナリのTRRファイルに結合し、
+                          参照構造もその原子だけのPDBファイルとして1度だけ書き出します。
+                          "pdb" は全原子のPDBファイルをテキストのまま結合します。`-cl`がgmx_optionsに
+                          あれば、クラスター構造を全原子で書き出せるよう自動的に "pdb" になり、
+                          出力グループにはインデックスファイルの全原子のグループ "System" を選びます
+                          (デフォルトは "trr")。
+        selection (str): RMSDを計算する原子。"calpha" (全C-alpha原子)、"backbone" (主鎖)、
+                         "ligand-calpha" (リガンドのC-alpha原子)、"interface" (自然順で最初の構造で相手の分子から
+                         10Å以内にある残基のC-alpha原子) のいずれかです (デフォルトは "calpha")。
+                         gmx clusterは同じグループで重ね合わせとRMSDを計算するため、"ligand-calpha" では
+                         各構造を受容体のC-alpha原子で最初の構造に重ね合わせた座標を軌跡に書き出し、
+                         `-nofit`を付けてgmx clusterを実行します。
+        chains (tuple): 受容体とリガンドのチェーンID (デフォルトは各ファイルの最初の2つのチェーン)。
+        use_cache (bool): distance_matrixがTrueのとき、RMSD行列を $DOCK_REFINE_CACHE にキャッシュし、
+                          同じ構造でカットオフだけを変えた再実行では再計算しません (デフォルトはFalse)。
 
     戻り値:
         str: クラスターログファイルのパス。
         例: "cluster.log"
+
+    例外:
+        ValueError: PDBファイル間で選択した原子数が異なる場合。
     """
-    combined_file = f"{output_prefix}_combined.pdb"
     pdb_files = natsorted(pdb_files)
-    represent_pdb = pdb_files[0]
-
-    # 全てのPDBファイルを1つに結合する処理
-    with open(combined_file, "w") as outfile:
-        for identifier, pdb_file in enumerate(pdb_files):
-            outfile.write(f"TITLE     AAA t=  {identifier + 1}\n")
-            with open(pdb_file, "r") as infile:
-                outfile.write(infile.read())
-            outfile.write("ENDMDL\n")
-
-    # gmx clusterコマンドを実行する
-    command = [f"{GROMACS}", "cluster", "-f", combined_file, "-s", represent_pdb, "-cutoff", str(cutoff_distance)] + gmx_options
-    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, input="3", text=True)
+    if "-cl" in gmx_options:
+        # クラスター構造を全原子で書き出すには全原子の軌跡が必要
+        trajectory = "pdb"
+    if distance_matrix:
+        # gmx clusterのデフォルトと同じく、選択した原子で重ね合わせた後のRMSDを計算する
+        rmsd = pdb_rmsd_matrix(pdb_files, selection, chains, fit="-nofit" not in gmx_options, processes=processes,
+                               use_cache=use_cache)
+        xpm_file = write_xpm_matrix(rmsd, f"{output_prefix}_rmsd.xpm", cutoff_distance)
+        command = [f"{GROMACS}", "cluster", "-dm", xpm_file, "-cutoff", str(cutoff_distance)] + gmx_options
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            print("Error running gmx cluster:")
+            print(result.stderr)
+            raise RuntimeError("gmx cluster command failed")
+        return "cluster.log"
+
+    # リガンドだけで重ね合わせるとポーズの違いが消えるため、受容体で重ね合わせてから-nofitでRMSDを計算する
+    fit_receptor = selection == "ligand-calpha" and "-nofit" not in gmx_options
+    if fit_receptor:
+        gmx_options = gmx_options + ["-nofit"]
+    coords, reference, mask = select_pdb_coordinates(pdb_files, selection, chains, fit_receptor=fit_receptor)
+    if trajectory == "trr":
+        # 選択した原子だけを残し、時刻を1始まりの構造番号にする
+        represent_pdb = f"{output_prefix}_reference.pdb"
+        with open(represent_pdb, "w") as outfile:
+            outfile.write("".join(reference.lines[i] for i in reference.atom_indices[mask]) + "END\n")
+        combined_file = write_trr(f"{output_prefix}_combined.trr", coords, np.arange(1, len(coords) + 1))
+        atom_numbers = np.arange(1, mask.sum() + 1)
+    else:
+        combined_file = f"{output_prefix}_combined.pdb"
+        represent_pdb = pdb_files[0]
+        atom_numbers = np.flatnonzero(mask) + 1
+
+        # 全てのPDBファイルを1つに結合する処理
+        with open(combined_file, "w") as outfile:
+            for identifier, pdb_file in enumerate(pdb_files):
+                outfile.write(f"TITLE     AAA t=  {identifier + 1}\n")
+                if fit_receptor:
+                    atoms = read_pdb_atoms(pdb_file)
+                    outfile.write(format_pdb_atoms(atoms.lines, atoms.atom_indices, receptor_fitted_coords(atoms, reference, chains)))
+                else:
+                    with open(pdb_file, "r") as infile:
+                        outfile.write(infile.read())
+                outfile.write("ENDMDL\n")
+    # 軌跡に含まれる全原子のグループも書き出し、`-cl`の出力グループとして選べるようにする
+    num_atoms = mask.sum() if trajectory == "trr" else len(mask)
+    ndx_file = write_index_file(f"{output_prefix}.ndx", {selection: atom_numbers, "System": np.arange(1, num_atoms + 1)})
+
+    # gmx clusterコマンドを実行する (グループ0を重ね合わせとRMSDに、`-cl`の出力にはグループ1の全原子を使う)
+    command = [f"{GROMACS}", "cluster", "-f", combined_file, "-s", represent_pdb, "-n", ndx_file,
+               "-cutoff", str(cutoff_distance)] + gmx_options
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, input="0\n1\n", text=True)
 
     if result.returncode != 0:
         print("Error running gmx cluster:")
@@ -87,6 +270,7 @@ def run_clustering(pdb_files, gmx_options, cutoff_distance=0.45, output_prefix="
 def parse_cluster_log(log_text="cluster.log"):
     """
     クラスターログファイルを解析し、クラスタ情報を含むDataFrameを返します。
+    解析はClusterResult.from_logで行い、そのDataFrame表示を返します。
 
     引数:
         log_text (str): ログファイルのパスまたはログ内容の文字列。
@@ -105,53 +289,10 @@ def parse_cluster_log(log_text="cluster.log"):
         FileNotFoundError: 指定されたログファイルパスが存在しない場合。
         ValueError: ログ内容が期待される形式でない場合。
     """
-    if isinstance(log_text, str) and log_text.endswith(".log"):
-        with open(log_text, "r", encoding="utf-8") as f:
-            log_text = f.read()
-
-    clusters = []
-    current_cluster = None
-
-    # ログファイルを1行ずつ解析する処理
-    for line in log_text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-
-        # クラスタ情報の行をマッチングする
-        match = re.match(r"^\s*(\d+)\s*\|\s*(\d+)\s*([\d.]*)\s*\|\s*(\d+)\s*([\d.]*)\s*\|", line)
-        if match:
-            if current_cluster:
-                clusters.append(current_cluster)
-
-            cluster_id = int(match.group(1))
-            num_structures = int(match.group(2))
-            rmsd = float(match.group(3)) if match.group(3) else np.nan
-            middle_id = int(match.group(4))
-            middle_rmsd = float(match.group(5)) if match.group(5) else np.nan
-            members = re.findall(r"\d+", line[match.end():])
-
-            current_cluster = {
-                "Cluster ID": cluster_id,
-                "# Structures": num_structures,
-                "RMSD": rmsd,
-                "Middle Structure": middle_id,
-                "Middle RMSD": middle_rmsd,
-                "Members": members
-            }
-        elif current_cluster:
-            members = re.findall(r"\d+", line)
-            current_cluster["Members"].extend(members)
-
-    if current_cluster:
-        clusters.append(current_cluster)
-
-    df = pd.DataFrame(clusters)
-    df["Members"] = df["Members"].apply(lambda x: ", ".join(x) if isinstance(x, list) else str(x))
-
-    return df
+    return ClusterResult.from_log(log_text).to_dataframe()
 
-def cluster_pdb_files(pdb_files, gmx_options, cutoff_distance=0.45, output_prefix="cluster"):
+def cluster_pdb_files(pdb_files, gmx_options, cutoff_distance=0.45, output_prefix="cluster", engine="gmx", processes=None,
+                      trajectory="trr", selection="calpha", chains=None, use_cache=False):
     """
     gmx clusterを使用してPDBファイルをクラスタリングし、結果のログファイルをDataFrameで返します
 
@@ -160,14 +301,56 @@ def cluster_pdb_files(pdb_files, gmx_options, cutoff_distance=0.45, output_prefi
         gmx_options (list): gmx clusterコマンドに渡す追加オプション
         cutoff_distance (float): クラスタリングのカットオフ距離
         output_prefix (str): 出力ファイルの接頭辞
+        engine (str): "gmx" はgmx cluster、"native" は重ね合わせなしのC-alpha RMSDによる
+                      Python内のGROMOS法、"kabsch" はKabsch法で重ね合わせた後のC-alpha RMSDによる
+                      Python内のGROMOS法を使用します (デフォルトは "gmx")。
+                      "native" はZDOCKのポーズのように受容体座標系が共通の複合体にのみ使用してください。
+                      "gmx-dm" はPython内で計算したRMSD行列を`gmx cluster -dm`に渡し、GROMACSの
+                      クラスタリング法 (-method) をそのまま使用します。
+        processes (int): "native"、"kabsch"、"gmx-dm" でRMSD行列を計算するプロセス数。2以上の場合は
+                         共有メモリ上でタイルごとに並列計算します (デフォルトは1プロセス)。
+        trajectory (str): "gmx" でgmx clusterに渡す軌跡の形式。run_clusteringを参照してください (デフォルトは "trr")。
+        selection (str): RMSDを計算する原子。run_clusteringを参照してください (デフォルトは "calpha")。
+        chains (tuple): 受容体とリガンドのチェーンID (デフォルトは各ファイルの最初の2つのチェーン)。
+        use_cache (bool): "native"、"kabsch"、"gmx-dm" でRMSD行列を $DOCK_REFINE_CACHE にキャッシュするか。
+                          "gmx" はgmx cluster自身がRMSDを計算するためキャッシュされません (デフォルトはFalse)。
 
     戻り値:
         pd.DataFrame: 解析されたクラスタ情報を含むDataFrame
     """
-    log_file = run_clustering(pdb_files, gmx_options, cutoff_distance, output_prefix)
+    if engine in ("native", "kabsch"):
+        return cluster_pdb_coordinates(pdb_files, cutoff_distance, selection, chains, fit=engine == "kabsch", processes=processes,
+                                       use_cache=use_cache)
+
+    log_file = run_clustering(pdb_files, gmx_options, cutoff_distance, output_prefix,
+                              distance_matrix=engine == "gmx-dm", processes=processes, trajectory=trajectory,
+                              selection=selection, chains=chains, use_cache=use_cache)
     df = parse_cluster_log(log_file)
     return df
 
+def top_clusters_converged(previous_df, cluster_df, max_clusters=3):
+    """
+    ポーズ数を増やす前後のクラスタリング結果を比べ、上位クラスターが安定しているかを判定します。
+
+    前回の上位max_clusters個の各クラスターの中央構造が、今回の同じ順位のクラスターのメンバーに
+    含まれていれば安定とみなします。メンバーIDはポーズを追加しても変わらないことを前提とします。
+
+    引数:
+        previous_df (pd.DataFrame or ClusterResult): 前回のparse_cluster_logの結果。
+        cluster_df (pd.DataFrame or ClusterResult): 今回のparse_cluster_logの結果。
+        max_clusters (int): 比較する上位クラスターの数。
+
+    戻り値:
+        bool: 上位クラスターが安定している場合はTrue。
+    """
+    previous = previous_df if isinstance(previous_df, ClusterResult) else ClusterResult.from_dataframe(previous_df)
+    current = cluster_df if isinstance(cluster_df, ClusterResult) else ClusterResult.from_dataframe(cluster_df)
+    previous_middles = previous.middle_structures[:max_clusters]
+    current_ids = current.cluster_ids[:max_clusters]
+    if len(previous_middles) != len(current_ids):
+        return False
+    return bool(np.all(current.cluster_of(previous_middles) == current_ids))
+
 def main():
     """
     コマンドライン引数を解析し、クラスタリングプロセスを実行するメイン関数。
@@ -182,11 +365,27 @@ def main():
                         help="Cutoff distance for gmx cluster (default: 0.45)")
     parser.add_argument("--output_prefix", default="cluster",
                         help="Prefix for output files (default: cluster)")
+    parser.add_argument("--engine", choices=["gmx", "gmx-dm", "native", "kabsch"], default="gmx",
+                        help="Clustering backend: gmx cluster, gmx cluster on a precomputed RMSD matrix (gmx-dm),\n"
+                             "or in-process GROMOS on C-alpha RMSD without fitting (native)\n"
+                             "or after batched Kabsch superposition (kabsch) (default: gmx)")
+    parser.add_argument("--trajectory", choices=["trr", "pdb"], default="trr",
+                        help="Combined input for gmx cluster: C-alpha-only binary TRR or full-atom text PDB (default: trr)")
+    parser.add_argument("--selection", choices=SELECTIONS, default="calpha",
+                        help="Atoms for fitting and RMSD: all C-alpha, backbone, ligand C-alpha (fitted on the receptor C-alpha)\n"
+                             "or interface C-alpha of the first structure (default: calpha)")
+    parser.add_argument("--chains", help="Receptor and ligand chain IDs (e.g., A,B) (default: first two chains of each file)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Number of processes for the RMSD matrix of the native, kabsch and gmx-dm engines (default: 1)")
+    parser.add_argument("--cache", action="store_true",
+                        help="Cache the RMSD matrix of the native, kabsch and gmx-dm engines in $DOCK_REFINE_CACHE\n"
+                             "so that reruns with another cutoff skip the RMSD computation")
 
     args = parser.parse_args()
     gmx_options = args.gmx_options.split() if args.gmx_options else []
 
-    df = cluster_pdb_files(args.pdb_files, gmx_options, args.cutoff_distance, args.output_prefix)
+    df = cluster_pdb_files(args.pdb_files, gmx_options, args.cutoff_distance, args.output_prefix, args.engine, args.processes, args.trajectory,
+                           args.selection, args.chains.split(",") if args.chains else None, args.cache)
     print(df)
 
 if __name__ == "__main__":
@@ -16,6 +16,7 @@
 
 例:
     python run_zdock.py -R receptor.pdb -L ligand.pdb -o output.zdock -N 1000 -S 42 -D -F
+    python run_zdock.py -R receptor.pdb -L ligand.pdb -B A:120-135 --block-ligand B:12,15 -N 500
 
 環境変数:
     ZDOCK: ZDOCKおよびその関連ツール（例: `mark_sur`, `create.pl`, `create_lig`）を含む
@@ -24,6 +25,7 @@
 依存関係:
     - Python 3.x
     - ZDOCKおよびその関連ツール
+    - NumPy (複合体構造の生成に使用)
     - 必要な外部コマンド: `cp`
 
 クラス:
@@ -43,6 +45,11 @@ import subprocess as sp
 import random
 from pathlib import Path
 import argparse
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from dockmodules.fft_dock import run_fft_docking
+from dockmodules.mark_surface import run_mark_sur, cached_mark, block_residues, parse_blocked_residues
+from dockmodules.zdock_output import ZDockResult, create_complexes, merge_zdock_results, parse_zdock_output
 
 # Set zdock_dir_path to use ZDOCK commands
 ZDOCK = os.environ.get("ZDOCK")
@@ -74,9 +81,12 @@ class ZDockRunner:
         zdock_runner.create_pl(zdock_output_file="zdock_output.out", num_preds=1000)
     メソッド:
         - __init__: クラスの初期化を行い、ZDOCKのパスを設定します。
-        - mark_sur: PDBファイルの表面残基をマークします。
+        - mark_sur: PDBファイルの表面残基をマークし、指定残基をブロックします (結果は入力内容のハッシュでキャッシュされます)。
         - run_zdock: ZDOCKを実行してドッキング予測を生成します。
-        - create_pl: ZDOCKのアウトプットファイルを処理し、予測構造を抽出します。
+        - run_fft_dock: ZDOCK本体の代わりにFFT剛体ドッキングを実行し、zdock.out互換のファイルを出力します。
+        - run_zdock_ensemble: シードの異なる複数のZDOCKを並列に実行し、予測を統合します。
+        - create_pl: ZDOCKのアウトプットファイルを処理し、予測構造を抽出します (デフォルトは`create.pl`、Python内の一括生成も選べます)。
+        - load_result: ZDOCKのアウトプットファイルをZDockResultとして読み込みます。
     注意:
         - このクラスを使用する前に、環境変数 'ZDOCK' を正しく設定してください。
         - 外部コマンドを実行するため、必要なスクリプトやバイナリが指定されたパスに存在することを確認してください。
@@ -93,25 +103,37 @@ class ZDockRunner:
             raise EnvironmentError("環境変数 'ZDOCK' が設定されていません。")
         self.zdock_output = None  # ZDOCKのアウトプットを保持するための属性
 
-    def mark_sur(self, pdb_path: str, out_pdb_path: str):
+    def mark_sur(self, pdb_path: str, out_pdb_path: str, use_cache: bool = True, blocked_residues: dict = None):
         """
         指定されたPDBファイルの表面残基をマークし、結果を新しいPDBファイルとして出力します。
 
+        マーク済みPDBファイルは入力PDBファイル、uniCHARMM、`mark_sur`の実行ファイルの内容のハッシュをキーに
+        キャッシュされ、同じ入力に対しては2回目以降`mark_sur`を実行せずにキャッシュをコピーします。
+
         引数:
             pdb_path (str): 表面残基をマークする対象のPDBファイルのパス。
             out_pdb_path (str): 表面残基がマークされた結果を保存する出力PDBファイルのパス。
+            use_cache (bool, optional): キャッシュを使用するか (デフォルトはTrue)。
+            blocked_residues (dict, optional): ZDOCKの探索から除外する残基。チェーンIDをキー、残基番号の
+                リストを値とする辞書です (例: {"A": [45, 46, 47]})。マーク後の`_m.pdb`の原子タイプを
+                `block.pl`と同様に書き換えます。キャッシュにはブロック前のファイルが保存されます。
 
         例外:
             subprocess.CalledProcessError: 外部コマンドの実行に失敗した場合。
+            ValueError: ブロックする残基がPDBファイルに存在しない場合。
         """
-        
-        # uniCHARMMファイルをカレントディレクトリにコピー
-        cp_uniCHARMM_cmd = ["cp", f"{self.zdock_path}/uniCHARMM", ".", "-f"]
-        sp.run(cp_uniCHARMM_cmd)
+        def mark(pdb_file, out_pdb_file):
+            run_mark_sur(pdb_file, out_pdb_file, self.zdock_path)
 
-        # PDBファイルの表面残基をマークする
-        mark_sur_cmd = [f"{self.zdock_path}/mark_sur", pdb_path, out_pdb_path]
-        sp.run(mark_sur_cmd)
+        if use_cache:
+            # ZDOCKを更新した場合に古い_m.pdbを使わないよう、mark_surとuniCHARMMの内容もキーに含める
+            cached_mark(pdb_path, out_pdb_path, mark, (f"{self.zdock_path}/uniCHARMM", f"{self.zdock_path}/mark_sur"))
+        else:
+            mark(pdb_path, out_pdb_path)
+
+        if blocked_residues:
+            # 膜貫通面や糖鎖付加部位など、結合に関与しない残基をZDOCKの探索から除外する
+            block_residues(out_pdb_path, out_pdb_path, blocked_residues)
 
     def run_zdock(self, receptor_pdb_path: str,
                   ligand_pdb_path: str,
@@ -148,7 +170,99 @@ class ZDockRunner:
         # ZDOCKのアウトプットファイルを保持
         self.zdock_output = filename
 
-    def create_pl(self, zdock_output_file: str = None, num_preds: int = 2000):
+    def run_fft_dock(self, receptor_pdb_path: str,
+                     ligand_pdb_path: str,
+                     filename: str = "zdock.out",
+                     num_predictions: int = 2000,
+                     num_rotations: int = 3600,
+                     coarse: bool = False,
+                     processes: int = 1):
+        """
+        ZDOCK本体の代わりに、NumPy/SciPyによるFFT剛体ドッキングを実行してzdock.out互換のファイルを出力します。
+
+        引数:
+            receptor_pdb_path (str): 受容体PDBファイルのパス。
+            ligand_pdb_path (str): リガンドPDBファイルのパス。
+            filename (str, optional): 出力ファイル名 (デフォルトは "zdock.out")。
+            num_predictions (int, optional): 出力する予測数 (デフォルトは2000)。
+            num_rotations (int, optional): 評価する回転の数 (デフォルトは3600、ZDOCKの高密度サンプリング相当は54000)。
+            coarse (bool, optional): 粗いグリッドで全回転を評価し、有望な回転のみを再評価するか (デフォルトはFalse)。
+            processes (int, optional): 回転集合を分割して評価するプロセス数 (デフォルトは1)。
+
+        戻り値:
+            ZDockResult: 出力したzdock.outを読み込んだ結果。
+        """
+        result = run_fft_docking(receptor_pdb_path, ligand_pdb_path, filename, num_predictions=num_predictions,
+                                 num_rotations=num_rotations, coarse=coarse, processes=processes)
+        self.zdock_output = filename
+        return result
+
+    def run_zdock_ensemble(self, receptor_pdb_path: str,
+                           ligand_pdb_path: str,
+                           filename: str = "zdock.out",
+                           num_predictions: int = 2000,
+                           seeds: list = None,
+                           num_runs: int = 4,
+                           is_dense_rot_samp: bool = False,
+                           is_fix_receptor: bool = False,
+                           processes: int = None,
+                           rmsd_tolerance: float = 1.0):
+        """
+        シードの異なる複数のZDOCKを並列に実行し、予測をスコア順・重複除去して1つのzdock.outに統合します。
+
+        各実行は専用の作業ディレクトリ (`zdock_seed{シード}`) で行われます。統合したzdock.outの
+        並進は小数で書き出されるため、複合体は`create_pl`のPython内生成 (use_native=True) で作成してください。
+
+        引数:
+            receptor_pdb_path (str): 受容体PDBファイルのパス。
+            ligand_pdb_path (str): リガンドPDBファイルのパス。
+            filename (str, optional): 統合した出力ファイル名 (デフォルトは "zdock.out")。
+            num_predictions (int, optional): 各実行および統合後の予測数 (デフォルトは2000)。
+            seeds (list, optional): 各実行のシード値。指定されない場合は1から100の異なる整数をnum_runs個選びます。
+            num_runs (int, optional): seedsが指定されない場合の実行数 (デフォルトは4)。
+            is_dense_rot_samp (bool, optional): 高密度回転サンプリングを使用するか (デフォルトはFalse)。
+            is_fix_receptor (bool, optional): 受容体を固定して回転を防ぐか (デフォルトはFalse)。
+            processes (int, optional): 同時に実行するZDOCKの数 (デフォルトは実行数とCPU数の小さい方)。
+            rmsd_tolerance (float, optional): 重複とみなすリガンドRMSD (Å) (デフォルトは1.0Å)。
+
+        戻り値:
+            ZDockResult: 統合したzdock.outを読み込んだ結果。
+
+        例外:
+            subprocess.CalledProcessError: ZDOCKコマンドの実行に失敗した場合。
+        """
+        if seeds is None:
+            seeds = random.sample(range(1, 101), num_runs)
+        processes = processes or min(len(seeds), os.cpu_count() or 1)
+
+        receptor_abs = os.path.abspath(receptor_pdb_path)
+        ligand_abs = os.path.abspath(ligand_pdb_path)
+
+        def run_seed(seed):
+            # シードごとの作業ディレクトリでZDOCKを実行する
+            scratch_dir = f"zdock_seed{seed}"
+            os.makedirs(scratch_dir, exist_ok=True)
+            sp.run(["cp", f"{self.zdock_path}/uniCHARMM", scratch_dir, "-f"])
+            zdock_cmd = [f"{self.zdock_path}/zdock", "-R", receptor_abs, "-L", ligand_abs,
+                         "-o", filename, "-N", str(num_predictions), "-S", str(seed)]
+            if is_dense_rot_samp:
+                zdock_cmd.append("-D")
+            if is_fix_receptor:
+                zdock_cmd.append("-F")
+            sp.run(zdock_cmd, cwd=scratch_dir, check=True)
+            return ZDockResult(os.path.join(scratch_dir, filename))
+
+        # ZDOCKは外部プロセスなので、スレッドから起動すれば並列に実行される
+        with ThreadPool(processes) as pool:
+            results = pool.map(run_seed, seeds)
+
+        merged = merge_zdock_results(results, filename, num_predictions=num_predictions,
+                                     rmsd_tolerance=rmsd_tolerance,
+                                     receptor=receptor_pdb_path, ligand=ligand_pdb_path)
+        self.zdock_output = filename
+        return merged
+
+    def create_pl(self, zdock_output_file: str = None, num_preds: int = 2000, indices: list = None, use_native: bool = False):
         """
         ZDOCKによって生成されたアウトプットファイルを処理し、指定された数の予測ドッキング構造を抽出します。
 
@@ -156,9 +270,18 @@ class ZDockRunner:
             zdock_output_file (str, optional): ZDOCKのアウトプットファイルのパス。
                 指定されない場合は、`self.zdock_output` が使用されます。
             num_preds (int, optional): 抽出する予測構造の数 (デフォルトは2000)。
+            indices (list, optional): 抽出するポーズの0始まりのインデックス。指定した順に
+                complex.1.pdb, complex.2.pdb, ... として出力されます。use_native=Trueの場合のみ有効です。
+            use_native (bool, optional): Python内のポーズ生成器を使用するか (デフォルトはFalse)。
+                Falseの場合はZDOCK付属の`create.pl`を実行します。Python内の生成が`create.pl`と1バイト単位で
+                一致することは`zdock_output.py --check`で確認できます。
+
+        戻り値:
+            list: 生成された複合体PDBファイルのパスのリスト。
 
         例外:
-            ValueError: ZDOCKのアウトプットファイルが指定されていない場合。
+            ValueError: ZDOCKのアウトプットファイルが指定されていない場合、またはuse_native=Falseで
+                merge_zdock_resultsで統合したzdock.outなど小数の並進を含むファイルを指定した場合。
             subprocess.CalledProcessError: 必要なコマンドの実行に失敗した場合。
         """
         # 使用するアウトプットファイルを決定
@@ -166,6 +289,20 @@ class ZDockRunner:
         if not zdock_output_file:
             raise ValueError("ZDOCKのアウトプットファイルが指定されていません。")
 
+        if use_native:
+            # zdock.outと受容体・リガンドを一度だけ読み込み、全ポーズを一括変換して書き出す
+            return create_complexes(zdock_output_file, num_preds=num_preds, indices=indices)
+
+        if indices is not None:
+            raise ValueError("indicesはuse_native=Trueの場合のみ指定できます。")
+
+        # create.plはZDOCK本体が書き出す整数の並進のみを扱えるため、統合したzdock.outは誤った複合体になる
+        _, poses = parse_zdock_output(zdock_output_file)
+        translations = poses["translation"]
+        if np.any(translations != np.round(translations)):
+            raise ValueError(f"{zdock_output_file} は小数の並進を含む (統合した) zdock.outのため、"
+                             f"create.plでは複合体を作成できません。use_native=Trueを指定してください。")
+
         # create_ligスクリプトをカレントディレクトリにコピー
         cp_create_lig_cmd = ["cp", f"{self.zdock_path}/create_lig", ".", "-f"]
         sp.run(cp_create_lig_cmd, check=True)
@@ -173,6 +310,26 @@ class ZDockRunner:
         # create.plスクリプトを実行
         create_pl_cmd = [f"{self.zdock_path}/create.pl", zdock_output_file, str(num_preds)]
         sp.run(create_pl_cmd, check=True)
+        return [f"complex.{i}.pdb" for i in range(1, num_preds + 1)]
+
+    def load_result(self, zdock_output_file: str = None):
+        """
+        ZDOCKのアウトプットファイルを読み込み、ポーズ座標をメモリ上で取得できるZDockResultを返します。
+
+        引数:
+            zdock_output_file (str, optional): ZDOCKのアウトプットファイルのパス。
+                指定されない場合は、`self.zdock_output` が使用されます。
+
+        戻り値:
+            ZDockResult: zdock.outのヘッダーと予測ポーズを保持するオブジェクト。
+
+        例外:
+            ValueError: ZDOCKのアウトプットファイルが指定されていない場合。
+        """
+        zdock_output_file = zdock_output_file or self.zdock_output
+        if not zdock_output_file:
+            raise ValueError("ZDOCKのアウトプットファイルが指定されていません。")
+        return ZDockResult(zdock_output_file)
             
 
 def main():
@@ -181,9 +338,13 @@ def main():
     parser.add_argument("-L", "--ligand", required=True, help="リガンドPDBファイルのパス。")
     parser.add_argument("-o", "--output", default="zdock.out", help="出力ファイル名 (デフォルト: zdock.out)。")
     parser.add_argument("-N", "--num_predictions", type=int, default=2000, help="予測数 (デフォルト: 2000)。")
-    parser.add_argument("-S", "--seed", type=int, help="ランダム化シード (デフォルト: ランダム)。")
+    parser.add_argument("-S", "--seed", type=int, help="ランダム化シード (デフォルト: ランダム)。-Kが2以上の場合は、シード, シード+1, ... で各実行を行います。")
     parser.add_argument("-D", "--dense", action="store_true", help="高密度回転サンプリングを使用します。")
     parser.add_argument("-F", "--fix", action="store_true", help="受容体を固定して回転を防ぎます。")
+    parser.add_argument("--engine", choices=["zdock", "fft"], default="zdock", help="ドッキングエンジン (デフォルト: zdock)。")
+    parser.add_argument("-K", "--num_runs", type=int, default=1, help="シードの異なるZDOCKを並列に実行する数 (デフォルト: 1)。")
+    parser.add_argument("-B", "--block-receptor", action="append", help="ZDOCKの探索から除外する受容体の残基 (例: A:45,50-55)。複数指定できます。")
+    parser.add_argument("--block-ligand", action="append", help="ZDOCKの探索から除外するリガンドの残基 (例: B:12,15)。複数指定できます。")
     args = parser.parse_args()
 
     zdock_runner = ZDockRunner()
@@ -193,12 +354,22 @@ def main():
     ligand_m_out = Path(args.ligand).stem + "_m.pdb"
     
     # 受容体とリガンドの表面残基をマークする処理を開始
-    zdock_runner.mark_sur(args.receptor, receptor_m_out)
-    zdock_runner.mark_sur(args.ligand, ligand_m_out)
+    # 受容体とリガンドは同じチェーンIDを使うことが多いため、ブロックする残基は分子ごとに指定する
+    zdock_runner.mark_sur(args.receptor, receptor_m_out, blocked_residues=parse_blocked_residues(args.block_receptor))
+    zdock_runner.mark_sur(args.ligand, ligand_m_out, blocked_residues=parse_blocked_residues(args.block_ligand))
     
     # ZDOCKを実行
-    seed = args.seed if args.seed is not None else random.randint(1, 100)
-    zdock_runner.run_zdock(receptor_m_out, ligand_m_out, args.output, args.num_predictions, seed, args.dense, args.fix)
+    if args.engine == "fft":
+        num_rotations = 54000 if args.dense else 3600
+        zdock_runner.run_fft_dock(receptor_m_out, ligand_m_out, args.output, args.num_predictions, num_rotations)
+    elif args.num_runs > 1:
+        # -Sを指定した場合は、そこから連番のシードで各実行を再現できるようにする
+        seeds = [args.seed + i for i in range(args.num_runs)] if args.seed is not None else None
+        zdock_runner.run_zdock_ensemble(receptor_m_out, ligand_m_out, args.output, args.num_predictions, seeds=seeds,
+                                        num_runs=args.num_runs, is_dense_rot_samp=args.dense, is_fix_receptor=args.fix)
+    else:
+        seed = args.seed if args.seed is not None else random.randint(1, 100)
+        zdock_runner.run_zdock(receptor_m_out, ligand_m_out, args.output, args.num_predictions, seed, args.dense, args.fix)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+"""
+このスクリプトは、ZDOCKのアウトプットファイル（zdock.out）を読み込み、予測されたドッキングポーズの
+座標をメモリ上で取得したり、複合体PDBファイル（complex.N.pdb）をPython内で生成する機能を提供します。
+ZDOCK付属の`create.pl`は予測ごとに`create_lig`を起動して受容体ファイル全体を書き直しますが、
+本モジュールではzdock.outとマーク済みの受容体・リガンドを一度だけ読み込み、全ポーズの回転・並進を
+NumPyで一括して適用します。出力は`create.pl`と同じ形式（受容体 + 変換後のリガンド）を意図していますが、
+実際の`create.pl`の出力との1バイト単位の一致は`--check`で確認してください。確認するまでは、
+`ZDockRunner.create_pl`の既定は`create.pl`です。
+
+`ZDockResult`はzdock.outのヘッダーと予測ポーズ（オイラー角・並進・スコア）を構造化配列として保持し、
+任意のポーズ（インデックスまたはスライス）の座標をPDBファイルを書き出さずに返します。
+クラスタリング、インターフェイス抽出、再スコアリングはこの座標を直接利用できます。
+
+使用方法:
+    ZDOCKを実行したディレクトリで、zdock.outと抽出する予測数を指定して実行します。
+
+例:
+    python zdock_output.py zdock.out 100
+    python zdock_output.py zdock.out --check complex.1.pdb complex.2.pdb
+
+依存関係:
+    - NumPy
+
+クラス:
+    - PDBAtoms: PDBファイルの行・原子座標・原子情報を保持します。
+    - ZDockResult: zdock.outの内容を保持し、ポーズ座標を必要に応じて計算します。
+
+関数:
+    - parse_zdock_output: zdock.outのヘッダーと予測ポーズを読み込みます。
+    - euler_to_rotation_matrices: ZDOCKのオイラー角を回転行列に一括変換します。
+    - rotation_matrices_to_euler: 回転行列をZDOCKのオイラー角に一括変換します。
+    - write_zdock_output: ヘッダーと予測ポーズをzdock.outの形式で書き出します。
+    - read_pdb_atoms: PDBファイルの行と原子座標を読み込みます。
+    - format_pdb_atoms: 座標を置き換えたPDBテキストを生成します。
+    - ligand_rmsd_matrix: 剛体変換から全ペアのリガンドRMSDを計算します。
+    - merge_zdock_results: 複数のZDOCK結果をスコア順・重複除去して統合します。
+    - create_complexes: 指定したポーズの複合体PDBファイルを書き出します。
+    - check_against_create_pl: Python内で生成した複合体が`create.pl`の出力と1バイト単位で一致するか確認します。
+"""
+import os
+import argparse
+import numpy as np
+
+# zdock.outの予測ポーズを保持する構造化配列の型
+POSE_DTYPE = np.dtype([
+    ("angles", np.float64, (3,)),
+    ("translation", np.float64, (3,)),
+    ("score", np.float64),
+])
+
+
+def parse_zdock_output(zdock_output_file):
+    """
+    zdock.outを読み込み、ヘッダー情報と予測ポーズの構造化配列を返します。
+
+    引数:
+        zdock_output_file (str): ZDOCKのアウトプットファイルのパス。
+
+    戻り値:
+        tuple: (header, poses)
+        - header (dict): "n", "spacing", "switch_num", "rec_rand", "lig_rand",
+          "receptor", "rec_center", "ligand", "lig_center" を含む辞書。
+          受容体固定 (-F) の場合、"switch_num" と "rec_rand" は None です。
+        - poses (np.ndarray): POSE_DTYPE型の構造化配列。"angles" (オイラー角)、
+          "translation" (グリッド単位の並進)、"score" を含みます。
+
+    例外:
+        ValueError: ヘッダーが期待される形式でない場合。
+    """
+    with open(zdock_output_file, "r") as f:
+        lines = [line.split() for line in f if line.strip()]
+
+    if len(lines) < 4:
+        raise ValueError(f"{zdock_output_file} はZDOCKのアウトプット形式ではありません。")
+
+    # 1行目: グリッドサイズ、グリッド間隔、(受容体固定でない場合) switch_num
+    first = lines[0]
+    header = {
+        "n": int(first[0]),
+        "spacing": float(first[1]),
+        "switch_num": int(first[2]) if len(first) > 2 else None,
+        "rec_rand": None,
+    }
+    line_index = 1
+    if header["switch_num"] is not None:
+        header["rec_rand"] = np.array(lines[line_index][:3], dtype=float)
+        line_index += 1
+    header["lig_rand"] = np.array(lines[line_index][:3], dtype=float)
+    line_index += 1
+    header["receptor"] = lines[line_index][0]
+    header["rec_center"] = np.array(lines[line_index][1:4], dtype=float)
+    line_index += 1
+    header["ligand"] = lines[line_index][0]
+    header["lig_center"] = np.array(lines[line_index][1:4], dtype=float)
+    line_index += 1
+
+    values = np.array([tokens[:7] for tokens in lines[line_index:]], dtype=float).reshape(-1, 7)
+    poses = np.empty(len(values), dtype=POSE_DTYPE)
+    poses["angles"] = values[:, 0:3]
+    poses["translation"] = values[:, 3:6]
+    poses["score"] = values[:, 6]
+    return header, poses
+
+
+def euler_to_rotation_matrices(angles):
+    """
+    ZDOCKのオイラー角 (psi, theta, phi) を回転行列に一括変換します。
+
+    引数:
+        angles (array_like): 形状 (3,) または (n, 3) のオイラー角 (ラジアン)。
+
+    戻り値:
+        np.ndarray: 形状 (n, 3, 3) の回転行列。
+    """
+    angles = np.atleast_2d(np.asarray(angles, dtype=float))
+    psi, theta, phi = angles[:, 0], angles[:, 1], angles[:, 2]
+    c_psi, s_psi = np.cos(psi), np.sin(psi)
+    c_theta, s_theta = np.cos(theta), np.sin(theta)
+    c_phi, s_phi = np.cos(phi), np.sin(phi)
+
+    rot = np.empty((len(angles), 3, 3))
+    rot[:, 0, 0] = c_psi * c_phi - s_psi * c_theta * s_phi
+    rot[:, 1, 0] = s_psi * c_phi + c_psi * c_theta * s_phi
+    rot[:, 2, 0] = s_theta * s_phi
+    rot[:, 0, 1] = -c_psi * s_phi - s_psi * c_theta * c_phi
+    rot[:, 1, 1] = -s_psi * s_phi + c_psi * c_theta * c_phi
+    rot[:, 2, 1] = s_theta * c_phi
+    rot[:, 0, 2] = s_psi * s_theta
+    rot[:, 1, 2] = -c_psi * s_theta
+    rot[:, 2, 2] = c_theta
+    return rot
+
+
+def rotation_matrices_to_euler(rotations):
+    """
+    回転行列をZDOCKのオイラー角 (psi, theta, phi) に一括変換します (euler_to_rotation_matricesの逆変換)。
+
+    引数:
+        rotations (np.ndarray): 形状 (n, 3, 3) の回転行列。
+
+    戻り値:
+        np.ndarray: 形状 (n, 3) のオイラー角 (ラジアン)。
+    """
+    rotations = np.asarray(rotations, dtype=float).reshape(-1, 3, 3)
+    theta = np.arccos(np.clip(rotations[:, 2, 2], -1.0, 1.0))
+    psi = np.arctan2(rotations[:, 0, 2], -rotations[:, 1, 2])
+    phi = np.arctan2(rotations[:, 2, 0], rotations[:, 2, 1])
+
+    # theta が 0 または pi の場合は psi と phi を区別できないため、phi = 0 とする
+    degenerate = np.abs(np.sin(theta)) < 1e-8
+    psi[degenerate] = np.arctan2(rotations[degenerate, 1, 0], rotations[degenerate, 0, 0])
+    phi[degenerate] = 0.0
+    return np.stack([psi, theta, phi], axis=1)
+
+
+def write_zdock_output(output_file, header, poses):
+    """
+    ヘッダーと予測ポーズをzdock.outの形式で書き出します。
+
+    引数:
+        output_file (str): 出力ファイルのパス。
+        header (dict): parse_zdock_outputと同じ形式のヘッダー。
+        poses (np.ndarray): POSE_DTYPE型の予測ポーズ。
+    """
+    def join(values, fmt):
+        return "\t".join(fmt % value for value in values)
+
+    with open(output_file, "w") as f:
+        first = [str(header["n"]), str(header["spacing"])]
+        if header["switch_num"] is not None:
+            first.append(str(header["switch_num"]))
+        f.write("\t".join(first) + "\n")
+        if header["switch_num"] is not None:
+            f.write(join(header["rec_rand"], "%.6f") + "\n")
+        f.write(join(header["lig_rand"], "%.6f") + "\n")
+        f.write(f"{header['receptor']}\t{join(header['rec_center'], '%.3f')}\n")
+        f.write(f"{header['ligand']}\t{join(header['lig_center'], '%.3f')}\n")
+
+        translations = poses["translation"]
+        integral = np.all(translations == np.round(translations))
+        for pose in poses:
+            # ZDOCK本体の出力は整数の並進、統合・変換したポーズは小数の並進を書き出す
+            trans = join(pose["translation"], "%d" if integral else "%.6f")
+            f.write(f"{join(pose['angles'], '%.6f')}\t{trans}\t{pose['score']:.3f}\n")
+
+
+class PDBAtoms:
+    """
+    PDBファイルの全行と、ATOM/HETATM行の座標・原子情報を保持するクラス。
+
+    属性:
+        lines (list): 改行を含むファイルの全行。
+        atom_indices (np.ndarray): ATOM/HETATM行のインデックス。
+        coords (np.ndarray): 形状 (原子数, 3) の座標。
+        names (np.ndarray): 原子名。
+        resnames (np.ndarray): 残基名。
+        chains (np.ndarray): チェーンID。
+        resseqs (np.ndarray): 残基番号。
+        icodes (np.ndarray): 挿入コード。
+    """
+    def __init__(self, lines):
+        self.lines = lines
+        self.atom_indices = np.array([i for i, line in enumerate(lines) if line.startswith(("ATOM", "HETATM"))], dtype=int)
+        atom_lines = [lines[i] for i in self.atom_indices]
+        self.coords = np.array([[float(line[30:38]), float(line[38:46]), float(line[46:54])]
+                                for line in atom_lines], dtype=float).reshape(-1, 3)
+        self.names = np.array([line[12:16].strip() for line in atom_lines], dtype=str)
+        self.resnames = np.array([line[17:20].strip() for line in atom_lines], dtype=str)
+        self.chains = np.array([line[21:22] for line in atom_lines], dtype=str)
+        self.resseqs = np.array([int(line[22:26]) for line in atom_lines], dtype=int)
+        self.icodes = np.array([line[26:27].strip() for line in atom_lines], dtype=str)
+
+    def __len__(self):
+        return len(self.atom_indices)
+
+
+def read_pdb_atoms(pdb_file):
+    """
+    PDBファイルを読み込み、PDBAtomsとして返します。
+
+    引数:
+        pdb_file (str): PDBファイルのパス。
+
+    戻り値:
+        PDBAtoms: ファイルの全行と原子情報。
+    """
+    with open(pdb_file, "r") as f:
+        return PDBAtoms(f.readlines())
+
+
+def format_pdb_atoms(lines, atom_indices, coords):
+    """
+    原子行の座標 (31-54桁) を置き換えたPDBテキストを生成します。
+
+    引数:
+        lines (list): PDBファイルの全行。
+        atom_indices (np.ndarray): 座標を置き換える行のインデックス。
+        coords (np.ndarray): 形状 (原子数, 3) の新しい座標。
+
+    戻り値:
+        str: PDBテキスト。
+    """
+    new_lines = list(lines)
+    for i, (x, y, z) in zip(atom_indices, coords.tolist()):
+        line = lines[i]
+        new_lines[i] = f"{line[:30]}{x:8.3f}{y:8.3f}{z:8.3f}{line[54:]}"
+    return "".join(new_lines)
+
+
+class ZDockResult:
+    """
+    ZDockResultクラス
+    zdock.outのヘッダーと予測ポーズを保持し、ポーズの座標を必要な分だけ計算します。
+    受容体・リガンドのPDBファイルは最初に座標が必要になった時点で一度だけ読み込まれます。
+
+    使用例:
+        result = ZDockResult("zdock.out")
+        # 1番目のポーズのリガンド座標 (原子数, 3)
+        coords = result.ligand_coords(0)
+        # 上位100ポーズのリガンド座標 (100, 原子数, 3)
+        coords = result.ligand_coords(slice(0, 100))
+        # 上位10ポーズを complex.1.pdb ～ complex.10.pdb として書き出す
+        result.write_complexes(range(10))
+
+    属性:
+        zdock_output_file (str): zdock.outのパス。
+        header (dict): zdock.outのヘッダー情報。
+        poses (np.ndarray): POSE_DTYPE型の予測ポーズ。
+    """
+    def __init__(self, zdock_output_file):
+        self.zdock_output_file = zdock_output_file
+        self.header, self.poses = parse_zdock_output(zdock_output_file)
+        self._receptor = None
+        self._ligand = None
+
+    def __len__(self):
+        return len(self.poses)
+
+    @property
+    def scores(self):
+        return self.poses["score"]
+
+    def resolve_path(self, path):
+        # カレントディレクトリにない場合はzdock.outと同じディレクトリから探す
+        if os.path.exists(path):
+            return path
+        return os.path.join(os.path.dirname(os.path.abspath(self.zdock_output_file)), path)
+
+    @property
+    def receptor(self):
+        if self._receptor is None:
+            self._receptor = read_pdb_atoms(self.resolve_path(self.header["receptor"]))
+        return self._receptor
+
+    @property
+    def ligand(self):
+        if self._ligand is None:
+            self._ligand = read_pdb_atoms(self.resolve_path(self.header["ligand"]))
+        return self._ligand
+
+    def _select(self, index):
+        # 整数・スライス・インデックス配列を1次元のポーズ配列に変換する
+        if isinstance(index, (int, np.integer)):
+            return self.poses[[index]]
+        return np.atleast_1d(self.poses[index])
+
+    def transforms(self, index=slice(None)):
+        """
+        元のリガンド座標xを x @ R.T + t で受容体座標系のポーズに移す剛体変換を返します。
+
+        変換は`create_lig`と同じ手順 (リガンド中心への移動、初期ランダム回転、ポーズの回転・並進、
+        受容体の初期ランダム回転の逆変換、受容体中心への移動) を1つの回転と並進にまとめたものです。
+
+        引数:
+            index (int, slice or array_like, optional): ポーズのインデックス (デフォルトは全ポーズ)。
+
+        戻り値:
+            tuple: (rotations, translations)
+            - rotations (np.ndarray): 形状 (n, 3, 3) の回転行列。
+            - translations (np.ndarray): 形状 (n, 3) の並進ベクトル。
+        """
+        poses = self._select(index)
+        header = self.header
+        n, spacing = header["n"], header["spacing"]
+
+        # 並進はグリッドの半分を超える場合に負側へ折り返す
+        shift = poses["translation"].copy()
+        shift[shift >= n / 2] -= n
+        shift *= spacing
+
+        rot = euler_to_rotation_matrices(poses["angles"])
+        lig_rand = euler_to_rotation_matrices(header["lig_rand"])[0]
+        rec_rand_inv = np.eye(3)
+        if header["rec_rand"] is not None:
+            rec_rand_inv = euler_to_rotation_matrices(header["rec_rand"])[0].T
+
+        if header["switch_num"]:
+            # 受容体側を動かした予測: 並進してから回転の逆変換を適用
+            outer = rec_rand_inv @ rot.transpose(0, 2, 1)
+            offset = np.einsum("pij,pj->pi", outer, shift)
+        else:
+            outer = np.broadcast_to(rec_rand_inv, rot.shape) @ rot
+            offset = -shift @ rec_rand_inv.T
+
+        rotations = outer @ lig_rand
+        translations = offset + header["rec_center"] - rotations @ header["lig_center"]
+        return rotations, translations
+
+    def ligand_coords(self, index=slice(None), atom_mask=None):
+        """
+        指定したポーズのリガンド座標を返します。
+
+        引数:
+            index (int, slice or array_like, optional): ポーズのインデックス (デフォルトは全ポーズ)。
+            atom_mask (array_like, optional): 使用するリガンド原子のブール配列またはインデックス。
+
+        戻り値:
+            np.ndarray: indexが整数の場合は形状 (原子数, 3)、それ以外は (n, 原子数, 3) の座標。
+        """
+        coords = self.ligand.coords if atom_mask is None else self.ligand.coords[atom_mask]
+        rotations, translations = self.transforms(index)
+        posed = np.einsum("pij,mj->pmi", rotations, coords) + translations[:, None, :]
+        return posed[0] if isinstance(index, (int, np.integer)) else posed
+
+    def complex_coords(self, index=slice(None)):
+        """
+        指定したポーズの複合体 (受容体 + リガンド) の座標を返します。
+
+        引数:
+            index (int, slice or array_like, optional): ポーズのインデックス (デフォルトは全ポーズ)。
+
+        戻り値:
+            np.ndarray: indexが整数の場合は形状 (原子数, 3)、それ以外は (n, 原子数, 3) の座標。
+        """
+        ligand = self.ligand_coords(index)
+        if ligand.ndim == 2:
+            return np.concatenate([self.receptor.coords, ligand])
+        receptor = np.broadcast_to(self.receptor.coords, (len(ligand),) + self.receptor.coords.shape)
+        return np.concatenate([receptor, ligand], axis=1)
+
+    def write_complexes(self, indices, prefix="complex", start=1):
+        """
+        指定したポーズを`create.pl`と同じ形式の複合体PDBファイルとして書き出します。
+
+        引数:
+            indices (array_like): 書き出すポーズの0始まりのインデックス。
+            prefix (str, optional): 出力ファイルの接頭辞 (デフォルトは "complex")。
+            start (int, optional): 最初のファイル番号 (デフォルトは1)。k番目のポーズが
+                `{prefix}.{start + k}.pdb` として出力されます。
+
+        戻り値:
+            list: 書き出したPDBファイルのパスのリスト。
+        """
+        output_files = []
+        for number, text in enumerate(self.complex_texts(indices), start=start):
+            output_file = f"{prefix}.{number}.pdb"
+            with open(output_file, "w") as f:
+                f.write(text)
+            output_files.append(output_file)
+        return output_files
+
+    def complex_texts(self, indices):
+        """
+        指定したポーズの複合体PDBテキストを、`create.pl`と同じ形式 (受容体 + 変換後のリガンド) で順に返します。
+
+        引数:
+            indices (array_like): ポーズの0始まりのインデックス。
+
+        戻り値:
+            generator: 各ポーズの複合体PDBテキスト (str)。
+        """
+        indices = np.asarray(indices, dtype=int)
+        receptor_text = "".join(self.receptor.lines)
+        ligand = self.ligand
+        for coords in self.ligand_coords(indices):
+            yield receptor_text + format_pdb_atoms(ligand.lines, ligand.atom_indices, coords)
+
+
+def ligand_rmsd_matrix(rotations_a, translations_a, rotations_b, translations_b, coords):
+    """
+    同じリガンドを2組の剛体変換で配置したときのリガンドRMSD (重ね合わせなし) を一括計算します。
+
+    リガンドの重心と2次モーメントSを使うと、ポーズp, q間のRMSDは
+    RMSD^2 = |c_p - c_q|^2 + 2 tr(S) - 2 tr(R_p^T R_q S) と表せるため、
+    原子数によらず回転行列の内積だけで全ペアを計算できます。
+
+    引数:
+        rotations_a (np.ndarray): 形状 (n, 3, 3) の回転行列。
+        translations_a (np.ndarray): 形状 (n, 3) の並進ベクトル。
+        rotations_b (np.ndarray): 形状 (m, 3, 3) の回転行列。
+        translations_b (np.ndarray): 形状 (m, 3) の並進ベクトル。
+        coords (np.ndarray): 形状 (原子数, 3) の元のリガンド座標 (RMSDの計算に使う原子のみ)。
+
+    戻り値:
+        np.ndarray: 形状 (n, m) のRMSD行列 (座標と同じ単位)。
+    """
+    center = coords.mean(axis=0)
+    centered = coords - center
+    moment = centered.T @ centered / len(coords)
+
+    centroids_a = rotations_a @ center + translations_a
+    centroids_b = rotations_b @ center + translations_b
+    sq_dist = (np.sum(centroids_a ** 2, axis=1)[:, None] + np.sum(centroids_b ** 2, axis=1)[None, :]
+               - 2.0 * centroids_a @ centroids_b.T)
+    cross = rotations_a.reshape(-1, 9) @ (rotations_b @ moment).reshape(-1, 9).T
+    return np.sqrt(np.maximum(sq_dist + 2.0 * np.trace(moment) - 2.0 * cross, 0.0))
+
+
+def merge_zdock_results(results, output_file, num_predictions=None, rmsd_tolerance=1.0, receptor=None, ligand=None):
+    """
+    シードの異なる複数のZDOCK結果を1つのスコア順のzdock.outに統合します。
+
+    各実行は初期ランダム回転が異なるため、全ポーズを受容体座標系の剛体変換に変換し、
+    ランダム回転のない共通ヘッダー (受容体固定形式) で表し直します。スコアの高い順に並べ、
+    既に採用したポーズとのリガンドRMSDがrmsd_tolerance未満のポーズは重複として除外します。
+    並進は小数で書き出されるため、統合したzdock.outの複合体は`create_pl`の
+    Python内生成 (use_native=True) で作成してください。
+
+    引数:
+        results (list): ZDockResultのリスト (同じ受容体・リガンドに対する実行結果)。
+        output_file (str): 統合したzdock.outの出力パス。
+        num_predictions (int, optional): 出力する予測数 (デフォルトは全て)。
+        rmsd_tolerance (float, optional): 重複とみなすリガンドRMSD (Å) (デフォルトは1.0Å)。
+        receptor (str, optional): ヘッダーに記載する受容体PDBのパス (デフォルトは最初の結果のもの)。
+        ligand (str, optional): ヘッダーに記載するリガンドPDBのパス (デフォルトは最初の結果のもの)。
+
+    戻り値:
+        ZDockResult: 統合したzdock.outを読み込んだ結果。
+    """
+    first = results[0]
+    rotations, translations, scores = [], [], []
+    for result in results:
+        rot, trans = result.transforms()
+        rotations.append(rot)
+        translations.append(trans)
+        scores.append(result.scores)
+    rotations = np.concatenate(rotations)
+    translations = np.concatenate(translations)
+    scores = np.concatenate(scores)
+
+    # スコアの高い順に、既に採用したポーズと重複しないものを選ぶ
+    coords = first.ligand.coords
+    order = np.argsort(-scores, kind="stable")
+    limit = len(order) if num_predictions is None else num_predictions
+    kept = []
+    for index in order:
+        if len(kept) >= limit:
+            break
+        if kept:
+            rmsd = ligand_rmsd_matrix(rotations[[index]], translations[[index]],
+                                      rotations[kept], translations[kept], coords)
+            if rmsd.min() < rmsd_tolerance:
+                continue
+        kept.append(index)
+
+    # ランダム回転のない共通ヘッダーでポーズを表し直す: x' = R (x - l_c) - t * spacing + r_c
+    header = {
+        "n": first.header["n"],
+        "spacing": first.header["spacing"],
+        "switch_num": None,
+        "rec_rand": None,
+        "lig_rand": np.zeros(3),
+        "receptor": receptor or first.header["receptor"],
+        "rec_center": first.header["rec_center"],
+        "ligand": ligand or first.header["ligand"],
+        "lig_center": first.header["lig_center"],
+    }
+    rot = rotations[kept]
+    shift = (header["rec_center"] - rot @ header["lig_center"] - translations[kept]) / header["spacing"]
+    # 並進が折り返されないよう、必要に応じてグリッドサイズを拡大する
+    if len(shift):
+        header["n"] = max(header["n"], int(np.ceil(2 * np.abs(shift).max())) + 2)
+
+    poses = np.empty(len(kept), dtype=POSE_DTYPE)
+    poses["angles"] = rotation_matrices_to_euler(rot)
+    poses["translation"] = shift
+    poses["score"] = scores[kept]
+    write_zdock_output(output_file, header, poses)
+    return ZDockResult(output_file)
+
+
+def create_complexes(zdock_output_file, num_preds=None, indices=None, prefix="complex"):
+    """
+    zdock.outから指定したポーズの複合体PDBファイルを書き出します。
+
+    `create.pl`と同様に、受容体ファイルの内容に変換後のリガンドを連結して
+    `{prefix}.{k}.pdb` を出力します。受容体・リガンドのパスはzdock.outのヘッダーから取得し、
+    カレントディレクトリにない場合はzdock.outと同じディレクトリから探します。
+
+    引数:
+        zdock_output_file (str or ZDockResult): ZDOCKのアウトプットファイルのパス、または読み込み済みの結果。
+        num_preds (int, optional): 上位から書き出す予測数。indicesが指定された場合は無視されます。
+        indices (list, optional): 書き出すポーズの0始まりのインデックス。k番目のポーズが
+            `{prefix}.{k}.pdb` (kは1始まり) として出力されます。
+        prefix (str, optional): 出力ファイルの接頭辞 (デフォルトは "complex")。
+
+    戻り値:
+        list: 書き出したPDBファイルのパスのリスト。
+    """
+    result = zdock_output_file if isinstance(zdock_output_file, ZDockResult) else ZDockResult(zdock_output_file)
+    if indices is None:
+        count = len(result) if num_preds is None else min(num_preds, len(result))
+        indices = np.arange(count)
+    return result.write_complexes(indices, prefix=prefix)
+
+
+def check_against_create_pl(zdock_output_file, complex_files):
+    """
+    Python内で生成した複合体が、同じzdock.outに対して`create.pl`が出力した複合体と1バイト単位で一致するか確認します。
+
+    引数:
+        zdock_output_file (str or ZDockResult): `create.pl`に渡したzdock.out、または読み込み済みの結果。
+        complex_files (list): `create.pl`が出力した複合体PDBファイルのパスのリスト。k番目 (0始まり) が
+            k番目のポーズ (complex.{k + 1}.pdb) に対応します。
+
+    戻り値:
+        bool: 全て一致した場合はTrue。
+
+    例外:
+        ValueError: 一致しない場合。最初に異なるファイルと行を示します。
+    """
+    result = zdock_output_file if isinstance(zdock_output_file, ZDockResult) else ZDockResult(zdock_output_file)
+    for complex_file, produced in zip(complex_files, result.complex_texts(np.arange(len(complex_files)))):
+        with open(complex_file, "r") as f:
+            expected = f.read()
+        if produced == expected:
+            continue
+        produced_lines, expected_lines = produced.splitlines(keepends=True), expected.splitlines(keepends=True)
+        for number, (ours, theirs) in enumerate(zip(produced_lines, expected_lines), start=1):
+            if ours != theirs:
+                raise ValueError(f"{complex_file} の{number}行目が`create.pl`の出力と異なります:\n"
+                                 f"  create.pl: {theirs!r}\n  native:    {ours!r}")
+        raise ValueError(f"{complex_file} の行数が`create.pl`の出力と異なります: "
+                         f"create.pl {len(expected_lines)}行, native {len(produced_lines)}行")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="zdock.outから複合体PDBファイルを生成します。")
+    parser.add_argument("zdock_output", help="ZDOCKのアウトプットファイルのパス")
+    parser.add_argument("num_preds", nargs="?", type=int, help="生成する予測数 (デフォルト: 全て)")
+    parser.add_argument("--check", nargs="+", metavar="COMPLEX_PDB",
+                        help="同じzdock.outに対して`create.pl`が出力したcomplex.1.pdb, complex.2.pdb, ... (この順に指定)。"
+                             "Python内の生成が1バイト単位で一致するか確認します")
+    args = parser.parse_args()
+
+    if args.check:
+        check_against_create_pl(args.zdock_output, args.check)
+        print(f"{len(args.check)} 個の複合体PDBファイルが`create.pl`の出力と一致しました。")
+        return
+
+    output_files = create_complexes(args.zdock_output, args.num_preds)
+    print(f"{len(output_files)} 個の複合体PDBファイルを生成しました。")
+
+
+if __name__ == "__main__":
+    main()
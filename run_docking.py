@@ -18,7 +18,7 @@ ZDOCK、HADDOCK、GROMACSなどのツールを使用して、以下の手順を
 必要な環境変数:
 - ZDOCK: ZDOCKの実行可能ファイルへのパス
 - HADDOCK: HADDOCKの実行可能ファイルへのパス
-- GROMACS: GROMACSの実行可能ファイルへのパス
+- GROMACS: GROMACSの実行可能ファイルへのパス (--cluster-engine gmx、gmx-dm 以外の場合は不要)
 
 関数:
 - docking_pipeline(): ドッキングパイプライン全体を実行します。
@@ -34,26 +34,47 @@ import json
 from dockmodules.run_zdock import ZDockRunner
 from dockmodules.get_haddock_input import HaddockInputGenerator
 from dockmodules.run_haddock import run_haddock
-from dockmodules.run_clustering import cluster_pdb_files
-from dockmodules.get_interface_residue import get_interface_residues
+from dockmodules.run_clustering import cluster_pdb_files, top_clusters_converged
+from dockmodules.get_interface_residue import residue_pair_distances, interface_residues_by_cutoff
 from dockmodules.haddock_analysis import HaddockAnalysis
+from dockmodules.pose_rescoring import rescore_poses
+from dockmodules.pose_filter import satisfies_restraints, parse_residue_list
+from dockmodules.pose_dedup import deduplicate_poses
+from dockmodules.cluster_result import ClusterResult
+from dockmodules.pose_clustering import SELECTIONS, cluster_poses, leader_clustering, cluster_cutoff_sweep, pdb_cutoff_sweep, summarize_cutoff_sweep
+from dockmodules.fcc_clustering import cluster_poses_fcc
+from dockmodules.mark_surface import parse_blocked_residues
 import argparse
 import random
 from multiprocessing import Pool
+import numpy as np
 import pandas as pd
 
-def run_haddock_docking_for_cluster(cluster_id, cluster_df, receptor_pdb, ligand_pdb, interface_distance=8.0):
+def run_haddock_docking_for_cluster(cluster_id, clusters, receptor_pdb, ligand_pdb, interface_distance=8.0):
     #選択したcluster idの一番ZDockスコアの良かった構造を選択する
-    members = cluster_df.loc[cluster_df['Cluster ID'] == cluster_id, 'Members'].values[0]
-    first_member = str(members).split(',')[0].strip()
+    first_member = clusters.first_member(cluster_id)
     pdb_file = f"complex.{first_member}.pdb"
     
     # インターフェイス残基の取得
-    interface_residues = get_interface_residues(pdb_file, "A", "B", distance=interface_distance)
+    # 残基ペアの最小距離を一度だけ求め、指定した全てのカットオフの残基をしきい値処理で得る
+    distances = list(np.atleast_1d(interface_distance).astype(float))
+    pairs, receptor_residues, ligand_residues = residue_pair_distances(pdb_file, "A", "B", max_distance=max(distances))
+    by_cutoff = interface_residues_by_cutoff(pairs, receptor_residues, ligand_residues, "A", "B", distances)
+    # HADDOCKのリストレイントには最初のカットオフの残基を使う
+    interface_residues = by_cutoff[distances[0]]
 
     # クラスター用ディレクトリの作成
     cluster_dir = f"Pos{cluster_id}"
     os.makedirs(cluster_dir, exist_ok=True)
+
+    # 各カットオフのインターフェイス残基を報告する
+    interface_rows = []
+    for distance, residues in by_cutoff.items():
+        print(f"Cluster {cluster_id} (complex.{first_member}.pdb) interface residues at {distance} Å: "
+              f"A={residues['A']}, B={residues['B']}")
+        interface_rows.extend({"Cutoff": distance, "Chain": chain, "# Residues": len(residues[chain]),
+                               "Residues": ", ".join(map(str, residues[chain]))} for chain in ("A", "B"))
+    pd.DataFrame(interface_rows).to_csv(os.path.join(cluster_dir, "interface_residues.csv"), index=False)
     
     # 作成したディレクトリ内で操作を行う
     receptor_pdb_basename = os.path.basename(receptor_pdb)
@@ -106,6 +127,111 @@ def run_haddock_docking_for_cluster(cluster_id, cluster_df, receptor_pdb, ligand
 
     return merged_df, representative_structure_path
 
+def cluster_docking_poses(zdock_result, indices, pdb_files, gmx_options, cluster_cutoff=0.45, cluster_engine="gmx", fcc_cutoff=0.6, cluster_selection="calpha"):
+    """
+    書き出したポーズを指定したエンジンでクラスタリングします。
+
+    引数:
+        zdock_result (ZDockResult): ZDOCKの結果。
+        indices (np.ndarray): 書き出したポーズのインデックス (0始まり)。k番目がcomplex.k.pdbに対応します。
+        pdb_files (list): 書き出した複合体PDBファイルのパスのリスト。
+        gmx_options (list): gmx clusterコマンドに渡す追加オプション。
+        cluster_cutoff (float, optional): RMSDによるクラスタリングの距離カットオフ (nm) (デフォルトは0.45)。
+        cluster_engine (str, optional): "gmx" はgmx cluster、"gmx-dm" はPython内で計算したRMSD行列を
+            `gmx cluster -dm`に渡すgmx cluster、"native" はzdock.outの剛体変換から
+            直接計算するPython内のGROMOS法、"kabsch" は重ね合わせ後のRMSDによるPython内のGROMOS法、
+            "fcc" は共通接触の割合 (FCC) によるクラスタリングを使用します (デフォルトは "gmx")。
+            全候補を逐次クラスタリングする "leader" はdocking_pipelineが直接扱います。
+        fcc_cutoff (float, optional): FCCによるクラスタリングのカットオフ (デフォルトは0.6)。
+        cluster_selection (str, optional): RMSDを計算する原子 ("calpha", "backbone", "ligand-calpha", "interface")。
+            `run_clustering`を参照してください (デフォルトは "calpha")。
+
+    RMSD行列は $DOCK_REFINE_CACHE にキャッシュするため ("gmx" を除く)、カットオフだけを変えた再実行では再計算しません。
+
+    戻り値:
+        pd.DataFrame: `parse_cluster_log`と同じ列を持つクラスタリング結果。
+    """
+    if cluster_engine == "native" and cluster_selection in ("calpha", "ligand-calpha"):
+        # 受容体座標系は全ポーズで共通なので、重ね合わせなしのRMSDを剛体変換から直接計算する
+        group = "ligand" if cluster_selection == "ligand-calpha" else "complex"
+        return cluster_poses(zdock_result, indices, cutoff_distance=cluster_cutoff, group=group, use_cache=True)
+    if cluster_engine == "fcc":
+        return cluster_poses_fcc(zdock_result, indices, cutoff=fcc_cutoff)
+    return cluster_pdb_files(pdb_files, gmx_options, cutoff_distance=cluster_cutoff, output_prefix="cluster", engine=cluster_engine,
+                             processes=os.cpu_count() or 1, selection=cluster_selection, use_cache=True)
+
+def cluster_cutoff_table(zdock_result, indices, pdb_files, cutoffs, cluster_engine="gmx", cluster_selection="calpha"):
+    """
+    キャッシュしたRMSD行列を使い、複数のカットオフでGROMOS法のクラスタリングを行った結果を表にします。
+
+    "gmx"、"gmx-dm"、"kabsch" では、gmx clusterの既定と同じく重ね合わせた後のRMSDを使います。
+
+    引数:
+        zdock_result (ZDockResult): ZDOCKの結果。
+        indices (np.ndarray): 書き出したポーズのインデックス (0始まり)。k番目がcomplex.k.pdbに対応します。
+        pdb_files (list): 書き出した複合体PDBファイルのパスのリスト。
+        cutoffs (list): クラスタリングの距離カットオフ (nm) のリスト。
+        cluster_engine (str, optional): クラスタリングのエンジン。cluster_docking_posesを参照してください (デフォルトは "gmx")。
+        cluster_selection (str, optional): RMSDを計算する原子。cluster_docking_posesを参照してください (デフォルトは "calpha")。
+
+    戻り値:
+        pd.DataFrame: summarize_cutoff_sweepの表。
+
+    例外:
+        ValueError: RMSDのカットオフを使わない "fcc"、"leader" が指定された場合。
+    """
+    if cluster_engine in ("fcc", "leader"):
+        raise ValueError(f"--cluster-engine {cluster_engine} はRMSDのカットオフによるクラスタリングではありません。")
+    if cluster_engine == "native" and cluster_selection in ("calpha", "ligand-calpha"):
+        group = "ligand" if cluster_selection == "ligand-calpha" else "complex"
+        sweep = cluster_cutoff_sweep(zdock_result, cutoffs, indices, group)
+    else:
+        sweep = pdb_cutoff_sweep(pdb_files, cutoffs, cluster_selection, fit=cluster_engine != "native", processes=os.cpu_count() or 1)
+    return summarize_cutoff_sweep(sweep)
+
+def adaptive_cluster_poses(zdock_result, candidates, gmx_options, cluster_cutoff=0.45, max_clusters=3, initial_poses=50, max_poses=None, cluster_engine="gmx", fcc_cutoff=0.6, cluster_selection="calpha"):
+    """
+    書き出してクラスタリングするポーズ数を50, 100, 200, ... と倍増させ、上位クラスターが
+    安定した時点で打ち切ります。
+
+    前回までに書き出した複合体PDBファイルはそのまま使い、新たに必要なポーズだけを
+    続きの番号で書き出すため、クラスターのメンバーIDは回をまたいで同じポーズを指します。
+
+    引数:
+        zdock_result (ZDockResult): ZDOCKの結果。
+        candidates (np.ndarray): 書き出すポーズのインデックス (0始まり) を優先順に並べたもの。
+        gmx_options (list): gmx clusterコマンドに渡す追加オプション。
+        cluster_cutoff (float, optional): クラスタリングの距離カットオフ (nm) (デフォルトは0.45)。
+        max_clusters (int, optional): 安定性を確認する上位クラスターの数 (デフォルトは3)。
+        initial_poses (int, optional): 最初にクラスタリングするポーズ数 (デフォルトは50)。
+        max_poses (int, optional): クラスタリングするポーズ数の上限 (デフォルトは全候補)。
+        cluster_engine (str, optional): クラスタリングのエンジン。cluster_docking_posesを参照してください (デフォルトは "gmx")。
+        fcc_cutoff (float, optional): FCCによるクラスタリングのカットオフ (デフォルトは0.6)。
+        cluster_selection (str, optional): RMSDを計算する原子。cluster_docking_posesを参照してください (デフォルトは "calpha")。
+
+    戻り値:
+        tuple: (書き出した複合体PDBファイルのパスのリスト, 最後のクラスタリング結果のDataFrame) の組。
+    """
+    max_poses = len(candidates) if max_poses is None else min(max_poses, len(candidates))
+    num_poses = min(initial_poses, max_poses)
+    pdb_files = []
+    previous_df = None
+    while True:
+        # 新たに必要なポーズだけを続きの番号で書き出す
+        pdb_files += zdock_result.write_complexes(candidates[len(pdb_files):num_poses], start=len(pdb_files) + 1)
+        cluster_df = cluster_docking_poses(zdock_result, candidates[:num_poses], pdb_files, gmx_options, cluster_cutoff, cluster_engine, fcc_cutoff, cluster_selection)
+        print(f"{num_poses} ポーズ: 上位クラスターの構造数 {cluster_df['# Structures'].head(max_clusters).tolist()}")
+
+        if previous_df is not None and top_clusters_converged(previous_df, cluster_df, max_clusters):
+            print(f"{num_poses} ポーズで上位クラスターが収束しました。")
+            break
+        if num_poses >= max_poses:
+            break
+        previous_df = cluster_df
+        num_poses = min(num_poses * 2, max_poses)
+
+    return pdb_files, cluster_df
+
 def ensure_pdb_end_statement(pdb_file):
     """PDBファイルにENDステートメントがあるか確認し、なければ追加する"""
     with open(pdb_file, 'r+') as file:
@@ -113,13 +239,17 @@ def ensure_pdb_end_statement(pdb_file):
         if not lines[-1].strip() == "END":
             file.write("\nEND\n")
 
-def docking_pipeline(receptor_pdb, ligand_pdb,output_dir="results", max_clusters=3, interface_distance=8.0, cluster_cutoff=0.45):
+def docking_pipeline(receptor_pdb, ligand_pdb,output_dir="results", max_clusters=3, interface_distance=8.0, cluster_cutoff=0.45, zdock_runs=1, docking_engine="zdock", num_poses=100, rescore=False, restraint_receptor=None, restraint_ligand=None, restraint_distance=8.0, restraint_require="all", dedup=False, dedup_translation=2.0, dedup_angle=15.0, adaptive=False, max_poses=None, blocked_receptor=None, num_predictions=2000, cluster_engine="gmx", fcc_cutoff=0.6, cluster_selection="calpha", blocked_ligand=None):
+    # -t に複数のカットオフが指定された場合は、最初の値でクラスタリングし、全ての値の比較表を出力する
+    cluster_cutoffs = [float(cutoff) for cutoff in np.atleast_1d(cluster_cutoff)]
+    cluster_cutoff = cluster_cutoffs[0]
+
     # 環境変数の確認
     ZDOCK = os.environ.get("ZDOCK")
     HADDOCK = os.environ.get("HADDOCK")
     GROMACS = os.environ.get("GROMACS")
 
-    if not ZDOCK or not HADDOCK or not GROMACS:
+    if not ZDOCK or not HADDOCK or (not GROMACS and cluster_engine in ("gmx", "gmx-dm")):
         raise EnvironmentError("必要な環境変数 (ZDOCK, HADDOCK, GROMACS) が設定されていません。")
     
     # receptor_pdb, ligand_pdb をフルパスに変換
@@ -151,18 +281,78 @@ def docking_pipeline(receptor_pdb, ligand_pdb,output_dir="results", max_clusters
     receptor_m_out = f"{os.path.splitext(receptor_pdb)[0]}_m.pdb"
     ligand_m_out = f"{os.path.splitext(ligand_pdb)[0]}_m.pdb"
 
-    zdock_runner.mark_sur(receptor_pdb, receptor_m_out)
-    zdock_runner.mark_sur(ligand_pdb, ligand_m_out)
+    # 受容体とリガンドは同じチェーンIDを使うことが多いため、ブロックする残基はそれぞれの分子にだけ適用する
+    zdock_runner.mark_sur(receptor_pdb, receptor_m_out, blocked_residues=blocked_receptor)
+    zdock_runner.mark_sur(ligand_pdb, ligand_m_out, blocked_residues=blocked_ligand)
 
     zdock_output = "zdock.out"
-    zdock_runner.run_zdock(receptor_m_out, ligand_m_out, filename=zdock_output, num_predictions=2000, seed=random.randint(1, 100), is_dense_rot_samp=False, is_fix_receptor=False)
+    if docking_engine == "fft":
+        # ZDOCK本体の代わりにFFT剛体ドッキングを実行し、zdock.out互換のファイルを出力する
+        zdock_runner.run_fft_dock(receptor_m_out, ligand_m_out, filename=zdock_output, num_predictions=num_predictions, coarse=True, processes=os.cpu_count() or 1)
+    elif zdock_runs > 1:
+        # シードの異なるZDOCKを並列に実行し、予測をスコア順に統合する
+        zdock_runner.run_zdock_ensemble(receptor_m_out, ligand_m_out, filename=zdock_output, num_predictions=num_predictions, num_runs=zdock_runs, is_dense_rot_samp=False, is_fix_receptor=False)
+    else:
+        zdock_runner.run_zdock(receptor_m_out, ligand_m_out, filename=zdock_output, num_predictions=num_predictions, seed=random.randint(1, 100), is_dense_rot_samp=False, is_fix_receptor=False)
     
-    num_preds = 100
-    zdock_runner.create_pl(zdock_output, num_preds=num_preds)
-    # クラスタリングの実行
-    pdb_files = [f"complex.{i}.pdb" for i in range(1, num_preds + 1)]  # 最初の100個のPDBファイルを使用
+    num_preds = num_poses
+    zdock_result = zdock_runner.load_result(zdock_output)
+    # 書き出すポーズの候補 (0始まり) をZDOCKスコア順に並べる
+    candidates = np.arange(len(zdock_result))
+    if rescore:
+        # 全ポーズを受容体のポテンシャルグリッドで再スコアリングし、その順位で候補を並べ替える
+        rescore_df = rescore_poses(zdock_result)
+        rescore_df.to_csv("rescore.csv", index=False)
+        candidates = rescore_df["Pose"].values - 1
+    if restraint_receptor or restraint_ligand:
+        # 既知のインターフェイス残基を満たさないポーズを、書き出す前にまとめて除外する
+        satisfied = satisfies_restraints(zdock_result, restraint_receptor, restraint_ligand, distance=restraint_distance, require=restraint_require)
+        candidates = candidates[satisfied[candidates]]
+        print(f"制約を満たすポーズ: {len(candidates)} / {len(zdock_result)}")
+        if len(candidates) == 0:
+            raise ValueError("制約を満たすポーズがありません。残基番号や距離を確認してください。")
+    multiplicity = np.ones(len(candidates), dtype=int)
+    if dedup:
+        # 回転刻み程度しか違わない重複ポーズを除き、各代表ポーズが吸収したポーズ数を記録する
+        candidates, multiplicity = deduplicate_poses(zdock_result, candidates, translation_tolerance=dedup_translation, angle_tolerance=dedup_angle)
+        print(f"重複を除いたポーズ: {len(candidates)} / {multiplicity.sum()}")
     gmx_options = []
-    cluster_df = cluster_pdb_files(pdb_files, gmx_options, cutoff_distance=cluster_cutoff, output_prefix="cluster")
+    if cluster_engine == "leader":
+        # 全候補ポーズをスコア順に逐次クラスタリングし、HADDOCKに渡すリーダーのみを複合体PDBファイルとして書き出す
+        # 剛体変換から計算できるのはC-alpha原子のRMSDのみなので、リガンドのC-alpha原子以外は複合体全体とする
+        group = "ligand" if cluster_selection == "ligand-calpha" else "complex"
+        cluster_df = leader_clustering(zdock_result, candidates[:max_poses], cutoff_distance=cluster_cutoff, group=group)
+        for leader in cluster_df["Middle Structure"].head(max_clusters):
+            zdock_result.write_complexes([candidates[leader - 1]], start=leader)
+    elif adaptive:
+        # 上位クラスターが安定するまで、書き出してクラスタリングするポーズ数を増やす
+        pdb_files, cluster_df = adaptive_cluster_poses(zdock_result, candidates, gmx_options, cluster_cutoff=cluster_cutoff, max_clusters=max_clusters, max_poses=max_poses, cluster_engine=cluster_engine, fcc_cutoff=fcc_cutoff, cluster_selection=cluster_selection)
+    else:
+        # 上位のポーズのみを複合体PDBファイルとして書き出す
+        # ZDOCK 1回分の上位ポーズをそのまま書き出す場合はcreate.plを使い、並べ替えや除外をした候補、
+        # 統合・FFTのzdock.outなどcreate.plで扱えない場合のみPython内で生成する
+        selected = candidates[:num_preds]
+        top_poses = np.array_equal(selected, np.arange(len(selected)))
+        use_create_pl = top_poses and docking_engine == "zdock" and zdock_runs == 1
+        pdb_files = zdock_runner.create_pl(zdock_output, num_preds=len(selected), indices=None if use_create_pl else selected,
+                                           use_native=not use_create_pl)
+        # クラスタリングの実行
+        cluster_df = cluster_docking_poses(zdock_result, candidates[:num_preds], pdb_files, gmx_options, cluster_cutoff, cluster_engine, fcc_cutoff, cluster_selection)
+    if cluster_df.empty:
+        raise RuntimeError("クラスターが見つかりませんでした。カットオフやポーズ数を見直してください。")
+    if len(cluster_cutoffs) > 1:
+        # キャッシュしたRMSD行列で全てのカットオフのクラスタリングを比較する
+        if cluster_engine in ("fcc", "leader"):
+            print(f"--cluster-engine {cluster_engine} ではカットオフの比較表を作成しません。")
+        else:
+            sweep_table = cluster_cutoff_table(zdock_result, candidates[:len(pdb_files)], pdb_files, cluster_cutoffs, cluster_engine, cluster_selection)
+            sweep_table.to_csv("cluster_sweep.csv", index=False)
+            print("カットオフごとのクラスタリング結果:")
+            print(sweep_table.to_string(index=False))
+    # メンバーを整数配列で保持し、各ワーカーで文字列を分割し直さずに参照できるようにする
+    clusters = ClusterResult.from_dataframe(cluster_df)
+    # 各クラスターが代表する元のポーズ数 (重複除去で吸収されたポーズを含む) を集計する
+    cluster_df["Represented Poses"] = clusters.member_sums(multiplicity)
     print("クラスタリング結果:", cluster_df)
     
     # クラスタリング結果から指定した数のクラスターIDを取得
@@ -172,7 +362,7 @@ def docking_pipeline(receptor_pdb, ligand_pdb,output_dir="results", max_clusters
     
     
     with Pool() as pool:
-        results = pool.starmap(run_haddock_docking_for_cluster, [(cluster_id, cluster_df, receptor_pdb, ligand_pdb, interface_distance) for cluster_id in cluster_ids])
+        results = pool.starmap(run_haddock_docking_for_cluster, [(cluster_id, clusters, receptor_pdb, ligand_pdb, interface_distance) for cluster_id in cluster_ids])
 
     # merged_df を結合し、#struc 列を更新
     combined_df = pd.concat([df.assign(**{"#struc": path}) for df, path in results], ignore_index=True)
@@ -202,11 +392,34 @@ def main():
     parser.add_argument("ligand", help="リガンドPDBファイルのパス")
     parser.add_argument("-o", "--output", default="results", help="出力ディレクトリのパス (デフォルト: results)")
     parser.add_argument("-c", "--max-clusters", type=int, default=3, help="処理する最大クラスター数 (デフォルト: 3)")
-    parser.add_argument("-d", "--interface-distance", type=float, default=8.0, help="インターフェイス残基の距離カットオフ (Å) (デフォルト: 8.0)")
-    parser.add_argument("-t", "--cluster-cutoff", type=float, default=0.45, help="クラスタリングの距離カットオフ (nm) (デフォルト: 0.45)")
+    parser.add_argument("-d", "--interface-distance", type=float, nargs="+", default=[8.0], help="インターフェイス残基の距離カットオフ (Å)。複数指定すると各カットオフの残基を報告し、最初の値をHADDOCKのリストレイントに使用 (デフォルト: 8.0)")
+    parser.add_argument("-t", "--cluster-cutoff", type=float, nargs="+", default=[0.45], help="クラスタリングの距離カットオフ (nm)。複数指定すると最初の値でクラスタリングし、キャッシュしたRMSD行列で全ての値の比較表 (cluster_sweep.csv) を出力 (デフォルト: 0.45)")
+    parser.add_argument("-k", "--zdock-runs", type=int, default=1, help="シードの異なるZDOCKを並列に実行する数 (デフォルト: 1)")
+    parser.add_argument("--engine", choices=["zdock", "fft"], default="zdock", help="剛体ドッキングのエンジン (zdock: ZDOCK本体, fft: 組み込みのFFTドッキング) (デフォルト: zdock)")
+    parser.add_argument("-n", "--num-poses", type=int, default=100, help="複合体PDBとして書き出しクラスタリングするポーズ数 (デフォルト: 100)")
+    parser.add_argument("--rescore", action="store_true", help="全ポーズを受容体のポテンシャルグリッドで再スコアリングし、その順位で書き出すポーズを選びます")
+    parser.add_argument("--restrain-receptor", help="インターフェイスにあるべき受容体の残基。満たさないポーズはクラスタリング前に除外されます (例: A:45,46,52A)")
+    parser.add_argument("--restrain-ligand", help="インターフェイスにあるべきリガンドの残基 (例: B:12,13)")
+    parser.add_argument("--restraint-distance", type=float, default=8.0, help="制約残基がインターフェイスにあるとみなす原子間距離 (Å) (デフォルト: 8.0)")
+    parser.add_argument("--restraint-require", choices=["all", "any"], default="all", help="指定した全残基 (all) または1残基以上 (any) が制約を満たすことを要求します (デフォルト: all)")
+    parser.add_argument("--dedup", action="store_true", help="リガンド重心と向きがほぼ同じ重複ポーズを、書き出す前にスコアの良いものだけ残して除去します")
+    parser.add_argument("--dedup-translation", type=float, default=2.0, help="重複とみなすリガンド重心の距離 (Å) (デフォルト: 2.0)")
+    parser.add_argument("--dedup-angle", type=float, default=15.0, help="重複とみなすリガンドの向きの差 (度) (デフォルト: 15.0)")
+    parser.add_argument("--adaptive", action="store_true", help="クラスタリングするポーズ数を50, 100, 200, ... と増やし、上位クラスターが安定した時点で打ち切ります (-n は無視されます)")
+    parser.add_argument("--max-poses", type=int, help="--adaptive または --cluster-engine leader でクラスタリングするポーズ数の上限 (デフォルト: 全ポーズ)")
+    parser.add_argument("-b", "--block-receptor", action="append", help="ZDOCKの探索から除外する受容体の残基 (例: A:120-135)。チェーンごとに複数指定できます")
+    parser.add_argument("--block-ligand", action="append", help="ZDOCKの探索から除外するリガンドの残基 (例: B:12,15)。チェーンごとに複数指定できます")
+    parser.add_argument("-N", "--num-predictions", type=int, default=2000, help="剛体ドッキングで出力する予測数 (デフォルト: 2000)")
+    parser.add_argument("--cluster-engine", choices=["gmx", "gmx-dm", "native", "kabsch", "fcc", "leader"], default="gmx", help="クラスタリングのエンジン (gmx: gmx cluster, gmx-dm: Python内で計算したRMSD行列を gmx cluster -dm に渡してGROMACSのクラスタリング法のみを実行, native: 剛体変換から計算するPython内のGROMOS法, kabsch: 重ね合わせ後のRMSDによるPython内のGROMOS法, fcc: 共通接触の割合によるHADDOCK方式のクラスタリング, leader: -n によらず全ポーズ (--max-poses まで) をスコア順に逐次クラスタリング。gmx、gmx-dm以外はGROMACS不要) (デフォルト: gmx)")
+    parser.add_argument("--cluster-selection", choices=SELECTIONS, default="calpha", help="RMSDを計算する原子 (calpha: 全C-alpha原子, backbone: 主鎖, ligand-calpha: リガンドのC-alpha原子, interface: 最上位のポーズで相手の分子から10Å以内にある残基のC-alpha原子)。ligand-calphaを重ね合わせるエンジンでは受容体のC-alpha原子で重ね合わせます。gmx、gmx-dmではインデックスファイルを自動生成します (デフォルト: calpha)")
+    parser.add_argument("--fcc-cutoff", type=float, default=0.6, help="--cluster-engine fcc のFCCカットオフ (デフォルト: 0.6)")
     args = parser.parse_args()
 
-    docking_pipeline(args.receptor, args.ligand, args.output, args.max_clusters, args.interface_distance, args.cluster_cutoff)
+    docking_pipeline(args.receptor, args.ligand, args.output, args.max_clusters, args.interface_distance, args.cluster_cutoff, args.zdock_runs, args.engine, args.num_poses, args.rescore,
+                     parse_residue_list(args.restrain_receptor), parse_residue_list(args.restrain_ligand), args.restraint_distance, args.restraint_require,
+                     args.dedup, args.dedup_translation, args.dedup_angle, args.adaptive, args.max_poses,
+                     parse_blocked_residues(args.block_receptor), args.num_predictions, args.cluster_engine, args.fcc_cutoff, args.cluster_selection,
+                     parse_blocked_residues(args.block_ligand))
 
 if __name__ == "__main__":
     main()